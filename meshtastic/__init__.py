@@ -12,6 +12,11 @@ notable properties of interface classes:
 - `nodes` - The database of received nodes.  Includes always up-to-date location and username information for each
 node in the mesh.  This is a read-only datastructure.
 - `nodesByNum` - like "nodes" but keyed by nodeNum instead of nodeId. As such, includes "unknown" nodes which haven't seen a User packet yet
+- `nodeDB` - The `meshtastic.nodedb.NodeDB` behind `nodes` and `nodesByNum`, with extra lookups (by short name, by lastHeard)
+and a spatial index over node positions (`nodeDB.spatial`)
+- `telemetryStore` - Optional `meshtastic.timeseries.TelemetryStore` keeping a history of the telemetry of each node (needs numpy)
+- `maxNodes`, `maxNodeAge` & `lastReceivedMode` - Bound the memory used by the node DB on large meshes (the limits are applied
+on each (re)connect, `nodeDB.maxNodes` & `nodeDB.maxAge` change them right away)
 - `myInfo` & `metadata` - Contain read-only information about the local radio device (software version, hardware version, etc)
 - `localNode` - Pointer to a node object for the local node
 
@@ -33,7 +38,13 @@ type of packet, you should subscribe to the full topic name.  If you want to see
 - `meshtastic.receive.position(packet)`
 - `meshtastic.receive.user(packet)`
 - `meshtastic.receive.data.portnum(packet)` (where portnum is an integer or well known PortNum enum)
-- `meshtastic.node.updated(node = NodeInfo)` - published when a node in the DB changes (appears, location changed, username changed, etc...)
+- `meshtastic.sent(packet)` - published for every packet we send to the radio, as a dictionary like received packets
+(with the MeshPacket protobuf in "raw")
+- `meshtastic.node.updated(node = NodeInfo)` - published when the radio sends us a NodeInfo (during the node DB download)
+- `meshtastic.node.changed(change = NodeChange)` - published when fields of a node in the DB change (appears, location changed,
+username changed, new telemetry, etc...), with the changed field paths and their old and new values. Bursts of changes to the
+same node within `interface.nodeChanges.window` seconds are folded into one event.
+- `meshtastic.node.removed(num = int)` - published when a node is dropped from the DB (evicted, expired or removed)
 - `meshtastic.log.line(line)` - a raw unparsed log line from the radio
 
 We receive position, user, or data packets from the mesh.  You probably only care about `meshtastic.receive.data`.  The first argument for
@@ -82,9 +93,9 @@ import google.protobuf.json_format
 import serial # type: ignore[import-untyped]
 from google.protobuf.json_format import MessageToJson
 from pubsub import pub # type: ignore[import-untyped]
-from tabulate import tabulate
 
 from meshtastic.node import Node
+from meshtastic.nodedb import summarizePacket
 from meshtastic.util import DeferredExecution, Timeout, catchAndIgnore, fixme, stripnl
 
 from .protobuf import (
@@ -178,7 +189,7 @@ def _onPositionReceive(iface, asDict):
             p = iface._fixupPosition(p)
             logging.debug(f"after fixup p:{p}")
             # update node DB as needed
-            iface._getOrCreateByNum(asDict["from"])["position"] = p
+            iface.nodeDB.update(asDict["from"], {"position": p})
 
 
 def _onNodeInfoReceive(iface, asDict):
@@ -188,11 +199,8 @@ def _onNodeInfoReceive(iface, asDict):
         if "user" in asDict["decoded"] and "from" in asDict:
             p = asDict["decoded"]["user"]
             # decode user protobufs and update nodedb, provide decoded version as "position" in the published msg
-            # update node DB as needed
-            n = iface._getOrCreateByNum(asDict["from"])
-            n["user"] = p
-            # We now have a node ID, make sure it is up-to-date in that table
-            iface.nodes[p["id"]] = n
+            # update node DB as needed, we now have a node ID so it also gets indexed by that
+            iface.nodeDB.update(asDict["from"], {"user": p})
             _receiveInfoUpdate(iface, asDict)
 
 def _onTelemetryReceive(iface, asDict):
@@ -218,25 +226,36 @@ def _onTelemetryReceive(iface, asDict):
     else:
         return
 
+    if getattr(iface, "telemetryStore", None) is not None:
+        iface.telemetryStore.add_packet(asDict)
+
     updateObj = telemetry.get(toUpdate)
-    newMetrics = node.get(toUpdate, {})
+    newMetrics = dict(node.get(toUpdate, {}))
     newMetrics.update(updateObj)
     logging.debug(f"updating {toUpdate} metrics for {asDict['from']} to {newMetrics}")
-    node[toUpdate] = newMetrics
+    iface.nodeDB.update(asDict["from"], {toUpdate: newMetrics})
 
 def _receiveInfoUpdate(iface, asDict):
     if "from" in asDict:
-        iface._getOrCreateByNum(asDict["from"])["lastReceived"] = asDict
-        iface._getOrCreateByNum(asDict["from"])["lastHeard"] = asDict.get("rxTime")
-        iface._getOrCreateByNum(asDict["from"])["snr"] = asDict.get("rxSnr")
-        iface._getOrCreateByNum(asDict["from"])["hopLimit"] = asDict.get("hopLimit")
+        fields = {
+            "lastHeard": asDict.get("rxTime"),
+            "snr": asDict.get("rxSnr"),
+            "hopLimit": asDict.get("hopLimit"),
+        }
+        mode = getattr(iface, "lastReceivedMode", "full")
+        if mode == "summary":
+            fields["lastReceived"] = summarizePacket(asDict)
+        elif mode != "none":
+            fields["lastReceived"] = asDict
+        iface.nodeDB.update(asDict["from"], fields)
 
 def _onAdminReceive(iface, asDict):
     """Special auto parsing for received messages"""
     logging.debug(f"in _onAdminReceive() asDict:{asDict}")
     if "decoded" in asDict and "from" in asDict and "admin" in asDict["decoded"]:
         adminMessage = asDict["decoded"]["admin"]["raw"]
-        iface._getOrCreateByNum(asDict["from"])["adminSessionPassKey"] = adminMessage.session_passkey
+        iface.nodeDB.update(asDict["from"], {"adminSessionPassKey": adminMessage.session_passkey})
+        iface.sessionKeys.put(asDict["from"], adminMessage.session_passkey)
 
 """Well known message payloads can register decoders for automatic protobuf parsing"""
 protocols = {
@@ -5,7 +5,7 @@
 # later we can have a separate changelist to refactor main.py into smaller files
 # pylint: disable=too-many-lines
 
-from typing import List, Optional, Union
+from typing import List, NoReturn, Optional, Union
 from types import ModuleType
 
 import argparse
@@ -21,47 +21,29 @@ import platform
 import sys
 import time
 
-try:
-    import pyqrcode  # type: ignore[import-untyped]
-except ImportError as e:
-    pyqrcode = None
-
-import yaml
 from google.protobuf.json_format import MessageToDict
 from pubsub import pub  # type: ignore[import-untyped]
 
-try:
-    import meshtastic.test
-    have_test = True
-except ImportError as e:
-    have_test = False
-
+# Only what every command needs is imported here. The dependencies of optional features (BLE, QR codes, YAML,
+# powermon and slog, the self test) are imported when the option using them is given, keeping startup fast.
 import meshtastic.util
 import meshtastic.serial_interface
 import meshtastic.tcp_interface
 
 from meshtastic import BROADCAST_ADDR, mt_config, remote_hardware
-from meshtastic.ble_interface import BLEInterface
 from meshtastic.mesh_interface import MeshInterface
-try:
-    from meshtastic.powermon import (
-        PowerMeter,
-        PowerStress,
-        PPK2PowerSupply,
-        RidenPowerSupply,
-        SimPowerSupply,
-    )
-    from meshtastic.slog import LogSet
-    have_powermon = True
-    powermon_exception = None
-    meter: Optional[PowerMeter] = None
-except ImportError as e:
-    have_powermon = False
-    powermon_exception = e
-    meter = None
 from meshtastic.protobuf import channel_pb2, config_pb2, portnums_pb2
 from meshtastic.version import get_active_version
 
+meter = None  # the meshtastic.powermon.PowerMeter in use, if any
+
+
+def powermonMissing(ex: ImportError) -> NoReturn:
+    """Exit explaining that the optional powermon dependencies are not installed"""
+    meshtastic.util.our_exit("The powermon module could not be loaded. "
+                             "You may need to run `poetry install --with powermon`. "
+                             f"Import Error was: {ex}")
+
 def onReceive(packet, interface) -> None:
     """Callback invoked when a packet arrives"""
     args = mt_config.args
@@ -296,11 +278,12 @@ def onConnected(interface):
         # convenient place to store any keyword args we pass to getNode
         getNode_kwargs = {
             "requestChannelAttempts": args.channel_fetch_attempts,
-            "timeout": args.timeout
+            "timeout": args.timeout,
+            "channelWindow": args.channel_fetch_window,
         }
 
-        # do not print this line if we are exporting the config
-        if not args.export_config:
+        # do not print this line if we are exporting the config or writing packets as JSON lines
+        if not args.export_config and args.format != "jsonl":
             print("Connected to radio")
 
         if args.set_time is not None:
@@ -652,10 +635,17 @@ def onConnected(interface):
 
         if args.configure:
             with open(args.configure[0], encoding="utf8") as file:
+                import yaml  # pylint: disable=C0415
+
                 configuration = yaml.safe_load(file)
                 closeNow = True
 
-                interface.getNode(args.dest, False, **getNode_kwargs).beginSettingsTransaction()
+                # one Node for the whole file: a remote node is only downloaded once (with its channels if we
+                # set them), and the config session sees the edits made to it
+                node = interface.getNode(
+                    args.dest, "channel_url" in configuration or "channelUrl" in configuration, **getNode_kwargs
+                )
+                node.beginSettingsTransaction()
 
                 if "owner" in configuration:
                     # Validate owner name before setting
@@ -664,7 +654,7 @@ def onConnected(interface):
                         meshtastic.util.our_exit("ERROR: Long Name cannot be empty or contain only whitespace characters")
                     print(f"Setting device owner to {configuration['owner']}")
                     waitForAckNak = True
-                    interface.getNode(args.dest, False, **getNode_kwargs).setOwner(configuration["owner"])
+                    node.setOwner(configuration["owner"])
                     time.sleep(0.5)
 
                 if "owner_short" in configuration:
@@ -676,7 +666,7 @@ def onConnected(interface):
                         f"Setting device owner short to {configuration['owner_short']}"
                     )
                     waitForAckNak = True
-                    interface.getNode(args.dest, False, **getNode_kwargs).setOwner(
+                    node.setOwner(
                         long_name=None, short_name=configuration["owner_short"]
                     )
                     time.sleep(0.5)
@@ -690,19 +680,19 @@ def onConnected(interface):
                         f"Setting device owner short to {configuration['ownerShort']}"
                     )
                     waitForAckNak = True
-                    interface.getNode(args.dest, False, **getNode_kwargs).setOwner(
+                    node.setOwner(
                         long_name=None, short_name=configuration["ownerShort"]
                     )
                     time.sleep(0.5)
 
                 if "channel_url" in configuration:
                     print("Setting channel url to", configuration["channel_url"])
-                    interface.getNode(args.dest, **getNode_kwargs).setURL(configuration["channel_url"])
+                    node.setURL(configuration["channel_url"])
                     time.sleep(0.5)
 
                 if "channelUrl" in configuration:
                     print("Setting channel url to", configuration["channelUrl"])
-                    interface.getNode(args.dest, **getNode_kwargs).setURL(configuration["channelUrl"])
+                    node.setURL(configuration["channelUrl"])
                     time.sleep(0.5)
 
                 if "location" in configuration:
@@ -724,31 +714,32 @@ def onConnected(interface):
                     interface.localNode.setFixedPosition(lat, lon, alt)
                     time.sleep(0.5)
 
+                # only the sections (and fields) the file actually changes are written
+                session = node.configSession()
+
                 if "config" in configuration:
-                    localConfig = interface.getNode(args.dest, **getNode_kwargs).localConfig
+                    localConfig = node.localConfig
                     for section in configuration["config"]:
                         traverseConfig(
                             section, configuration["config"][section], localConfig
                         )
-                        interface.getNode(args.dest, **getNode_kwargs).writeConfig(
-                            meshtastic.util.camel_to_snake(section)
-                        )
-                        time.sleep(0.5)
 
                 if "module_config" in configuration:
-                    moduleConfig = interface.getNode(args.dest, **getNode_kwargs).moduleConfig
+                    moduleConfig = node.moduleConfig
                     for section in configuration["module_config"]:
                         traverseConfig(
                             section,
                             configuration["module_config"][section],
                             moduleConfig,
                         )
-                        interface.getNode(args.dest, **getNode_kwargs).writeConfig(
-                            meshtastic.util.camel_to_snake(section)
-                        )
-                        time.sleep(0.5)
 
-                interface.getNode(args.dest, False, **getNode_kwargs).commitSettingsTransaction()
+                changes = session.commit(transaction=False)
+                for section in changes.sections:
+                    print(f"Writing {section} configuration to device")
+                if changes.fields:
+                    print(f"Changed {len(changes.fields)} field(s): {', '.join(sorted(changes.fields))}")
+
+                node.commitSettingsTransaction()
                 print("Writing modified configuration to device")
 
         if args.export_config:
@@ -970,10 +961,10 @@ def onConnected(interface):
             if args.dest != BROADCAST_ADDR:
                 print("Showing node list of a remote node is not supported.")
                 return
-            interface.showNodes(True, args.show_fields)
+            interface.showNodes(True, args.show_fields, printFmt=args.nodes_format, sortField=args.sort_field)
 
-        if args.show_fields and not args.nodes:
-            print("--show-fields can only be used with --nodes")
+        if (args.show_fields or args.nodes_format != "table" or args.sort_field != "lastHeard") and not args.nodes:
+            print("--show-fields, --nodes-format and --sort-field can only be used with --nodes")
             return
 
         if args.qr or args.qr_all:
@@ -984,31 +975,39 @@ def onConnected(interface):
             else:
                 urldesc = "Primary channel URL"
             print(f"{urldesc}: {url}")
-            if pyqrcode is not None:
+            try:
+                import pyqrcode  # type: ignore[import-untyped] # pylint: disable=C0415
+            except ImportError:
+                print("Install pyqrcode to view a QR code printed to terminal.")
+            else:
                 qr = pyqrcode.create(url)
                 print(qr.terminal())
-            else:
-                print("Install pyqrcode to view a QR code printed to terminal.")
 
         log_set: Optional = None  # type: ignore[annotation-unchecked]
         # we need to keep a reference to the logset so it doesn't get GCed early
 
         if args.slog or args.power_stress:
-            if have_powermon:
-                # Setup loggers
-                global meter  # pylint: disable=global-variable-not-assigned
-                log_set = LogSet(
-                    interface, args.slog if args.slog != "default" else None, meter
-                )
+            try:
+                from meshtastic.powermon import PowerStress  # pylint: disable=C0415
+                from meshtastic.slog import LogSet  # pylint: disable=C0415
+            except ImportError as ex:
+                powermonMissing(ex)
+            # Setup loggers
+            global meter  # pylint: disable=global-variable-not-assigned
+            log_set = LogSet(
+                interface,
+                args.slog if args.slog != "default" else None,
+                meter,
+                rotate_bytes=int(args.slog_rotate_mb * 1e6) if args.slog_rotate_mb else None,
+                rotate_secs=args.slog_rotate_minutes * 60 if args.slog_rotate_minutes else None,
+                keep_runs=args.slog_keep_runs,
+                max_age_days=args.slog_max_age_days,
+            )
 
-                if args.power_stress:
-                    stress = PowerStress(interface)
-                    stress.run()
-                    closeNow = True  # exit immediately after stress test
-            else:
-                meshtastic.util.our_exit("The powermon module could not be loaded. "
-                                         "You may need to run `poetry install --with powermon`. "
-                                         "Import Error was: " + powermon_exception)
+            if args.power_stress:
+                stress = PowerStress(interface)
+                stress.run()
+                closeNow = True  # exit immediately after stress test
 
 
         if args.listen:
@@ -1091,6 +1090,8 @@ def subscribe() -> None:
 
 def export_config(interface) -> str:
     """used in --export-config"""
+    import yaml  # pylint: disable=C0415
+
     configObj = {}
 
     owner = interface.getLongName()
@@ -1177,6 +1178,17 @@ def create_power_meter():
         if v < 0.8 or v > 5.0:
             meshtastic.util.our_exit("Voltage must be between 0.8 and 5.0")
 
+    if not (args.power_riden or args.power_ppk2_supply or args.power_ppk2_meter or args.power_sim):
+        return
+    try:
+        from meshtastic.powermon import (  # pylint: disable=C0415
+            PPK2PowerSupply,
+            RidenPowerSupply,
+            SimPowerSupply,
+        )
+    except ImportError as ex:
+        powermonMissing(ex)
+
     if args.power_riden:
         meter = RidenPowerSupply(args.power_riden)
     elif args.power_ppk2_supply or args.power_ppk2_meter:
@@ -1199,13 +1211,101 @@ def create_power_meter():
             time.sleep(5)
 
 
+SHARED_UNSUPPORTED = (
+    "listen", "reply", "tunnel", "noproto", "slog", "power_stress", "test", "ble_scan", "daemon", "batch"
+)
+"""Options that make no sense (or are unsafe) for a command run on an already open connection (daemon or batch)"""
+
+
+def runViaDaemon(path: str) -> NoReturn:
+    """Send our command line to a running daemon, print its output and exit with its status"""
+    # pylint: disable=C0415
+    from meshtastic import daemon
+
+    if path == "default":
+        path = daemon.defaultSocketPath()
+    try:
+        status, output = daemon.sendCommand(path, sys.argv[1:])
+    except (OSError, ValueError) as ex:
+        meshtastic.util.our_exit(f"Could not run the command in the daemon at {path}: {ex}", 1)
+    print(output, end="")
+    sys.exit(status)
+
+
+def runSharedCommand(interface, argv: List[str], mode: str):
+    """Run a command line with an already connected interface, returns (exit status, output)"""
+    # pylint: disable=C0415
+    from meshtastic.daemon import SharedInterface, captureOutput
+
+    if not isinstance(interface, SharedInterface):
+        interface = SharedInterface(interface)
+
+    def run():
+        args = mt_config.parser.parse_args(argv)
+        unsupported = [f"--{o.replace('_', '-')}" for o in SHARED_UNSUPPORTED if getattr(args, o, None)]
+        if unsupported:
+            meshtastic.util.our_exit(f"{', '.join(unsupported)} can not be used with {mode}", 2)
+        if not args.dest:
+            args.dest = BROADCAST_ADDR
+        mt_config.args = args
+        mt_config.channel_index = int(args.ch_index) if args.ch_index is not None else None
+        onConnected(interface)
+
+    logging.debug(f"Running {argv}")
+    saved = (mt_config.args, mt_config.channel_index)
+    try:
+        return captureOutput(run)
+    finally:
+        mt_config.args, mt_config.channel_index = saved
+
+
+def runBatch(interface, path: str) -> bool:
+    """Run the steps of a batch script (see meshtastic.batch) with interface and print a JSON report.
+    Returns True if all went well."""
+    # pylint: disable=C0415
+    import json
+    from meshtastic import batch
+
+    try:
+        if path == "-":
+            text = sys.stdin.read()
+        else:
+            with open(path, encoding="utf8") as f:
+                text = f.read()
+        steps = batch.parseSteps(text)
+    except (OSError, ValueError) as ex:
+        meshtastic.util.our_exit(f"Could not read batch {path}: {ex}", 1)
+    report = batch.runSteps(steps, lambda argv: runSharedCommand(interface, argv, "--batch"))
+    print(json.dumps(report, indent=2))
+    return report["ok"]
+
+
+def serveDaemon(interface, path: str) -> None:
+    """Run the commands of --via-daemon invocations with interface, until interrupted"""
+    # pylint: disable=C0415
+    from meshtastic import daemon
+
+    if path == "default":
+        path = daemon.defaultSocketPath()
+    shared = daemon.SharedInterface(interface)
+    server = daemon.CommandServer(path, lambda argv: runSharedCommand(shared, argv, "--via-daemon"))
+    print(f"Connected to radio, serving commands on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Exiting due to keyboard interrupt")
+    finally:
+        server.server_close()
+        interface.close()
+
+
 def common():
     """Shared code for all of our command line wrappers."""
     logfile = None
     args = mt_config.args
     parser = mt_config.parser
     logging.basicConfig(
-        level=logging.DEBUG if (args.debug or args.listen) else logging.INFO,
+        level=logging.DEBUG if (args.debug or (args.listen and args.format == "text")) else logging.INFO,
         format="%(levelname)s file:%(filename)s %(funcName)s line:%(lineno)s %(message)s",
     )
 
@@ -1217,6 +1317,9 @@ def common():
             meshtastic.util.support_info()
             meshtastic.util.our_exit("", 0)
 
+        if args.format == "jsonl" and not args.listen:
+            meshtastic.util.our_exit("--format jsonl can only be used with --listen", 2)
+
         # Early validation for owner names before attempting device connection
         if hasattr(args, 'set_owner') and args.set_owner is not None:
             stripped_long_name = args.set_owner.strip()
@@ -1233,8 +1336,10 @@ def common():
             if not stripped_ham_name:
                 meshtastic.util.our_exit("ERROR: Ham radio callsign cannot be empty or contain only whitespace characters")
 
-        if have_powermon:
-            create_power_meter()
+        if args.via_daemon:
+            runViaDaemon(args.via_daemon)
+
+        create_power_meter()
 
         if args.ch_index is not None:
             channelIndex = int(args.ch_index)
@@ -1256,10 +1361,12 @@ def common():
             parser.print_help(sys.stderr)
             meshtastic.util.our_exit("", 1)
         elif args.test:
-            if not have_test:
+            try:
+                from meshtastic import test as selfTest  # pylint: disable=C0415
+            except ImportError:
                 meshtastic.util.our_exit("Test module could not be important. Ensure you have the 'dotmap' module installed.")
             else:
-                result = meshtastic.test.testAll()
+                result = selfTest.testAll()
                 if not result:
                     meshtastic.util.our_exit("Warning: Test was not successful.")
                 else:
@@ -1279,12 +1386,26 @@ def common():
                 mt_config.logfile = logfile
 
             subscribe()
+            packetWriter = None
+            if args.listen and args.format == "jsonl":
+                # pylint: disable=C0415
+                from meshtastic.packet_writer import JsonlPacketWriter
+
+                packetWriter = JsonlPacketWriter(
+                    sys.stdout,
+                    fields=args.listen_fields.split(",") if args.listen_fields else None,
+                    payload=args.listen_payload,
+                    flushInterval=args.flush_interval,
+                )
+                pub.subscribe(packetWriter.onReceive, "meshtastic.receive")
             if args.ble_scan:
+                from meshtastic.ble_interface import BLEInterface  # pylint: disable=C0415
                 logging.debug("BLE scan starting")
                 for x in BLEInterface.scan():
                     print(f"Found: name='{x.name}' address='{x.address}'")
                 meshtastic.util.our_exit("BLE scan finished", 0)
             elif args.ble:
+                from meshtastic.ble_interface import BLEInterface  # pylint: disable=C0415
                 client = BLEInterface(
                     args.ble if args.ble != "any" else None,
                     debugOut=logfile,
@@ -1358,6 +1479,15 @@ def common():
                         )
 
             # We assume client is fully connected now
+            if args.daemon:
+                serveDaemon(client, args.daemon)
+                return
+            if args.batch:
+                ok = runBatch(client, args.batch)
+                client.close()
+                if not ok:
+                    sys.exit(1)
+                return
             onConnected(client)
 
             have_tunnel = platform.system() == "Linux"
@@ -1372,6 +1502,8 @@ def common():
                         time.sleep(1000)
                 except KeyboardInterrupt:
                     logging.info("Exiting due to keyboard interrupt")
+            if packetWriter is not None:
+                packetWriter.close()
 
         # don't call exit, background threads might be running still
         # sys.exit(0)
@@ -1414,6 +1546,33 @@ def addConnectionArgs(parser: argparse.ArgumentParser) -> argparse.ArgumentParse
         const="any",
     )
 
+    group.add_argument(
+        "--via-daemon",
+        help="Run the command in a running 'meshtastic --daemon' instead of connecting to the device, "
+        "optionally passing the path of the daemon's socket",
+        nargs="?",
+        default=None,
+        const="default",
+        metavar="SOCKET",
+    )
+
+    outer.add_argument(
+        "--batch",
+        help="Run the command lines listed in a YAML or JSON lines file ('-' for stdin) one after the other "
+        "over one connection, and print a JSON report of how each went",
+        metavar="FILE",
+    )
+
+    outer.add_argument(
+        "--daemon",
+        help="Stay connected to the device and run the commands of 'meshtastic --via-daemon' invocations, "
+        "optionally passing the path of the socket to listen on",
+        nargs="?",
+        default=None,
+        const="default",
+        metavar="SOCKET",
+    )
+
     outer.add_argument(
         "--ble-scan",
         help="Scan for Meshtastic BLE devices that may be available to connect to",
@@ -1640,6 +1799,15 @@ def addChannelConfigArgs(parser: argparse.ArgumentParser) -> argparse.ArgumentPa
         metavar="ATTEMPTS",
     )
 
+    group.add_argument(
+        "--channel-fetch-window",
+        help=("How many channel requests to keep in flight at once when retrieving channel settings from a remote "
+              "node. Values above 1 are much faster over multi-hop links. Default %(default)s."),
+        default=1,
+        type=int,
+        metavar="REQUESTS",
+    )
+
     group.add_argument(
         "--qr",
         help=(
@@ -1741,6 +1909,20 @@ def addLocalActionArgs(parser: argparse.ArgumentParser) -> argparse.ArgumentPars
         default=None
     )
 
+    group.add_argument(
+        "--nodes-format",
+        help="Output format when using --nodes: a table (default), or csv, jsonl or arrow (an Arrow IPC stream) "
+        "with unformatted values for scripts",
+        choices=["table", "csv", "jsonl", "arrow"],
+        default="table",
+    )
+
+    group.add_argument(
+        "--sort-field",
+        help="Field to sort by (descending) when using --nodes (default: lastHeard)",
+        default="lastHeard",
+    )
+
     return parser
 
 def addRemoteActionArgs(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
@@ -1998,6 +2180,34 @@ def initParser():
         action="store_true",
     )
 
+    group.add_argument(
+        "--format",
+        help="How --listen shows received packets: as debug log messages (text), or one JSON object per line (jsonl)",
+        choices=["text", "jsonl"],
+        default="text",
+    )
+
+    group.add_argument(
+        "--listen-fields",
+        help="With --format jsonl, the comma separated (dotted) packet fields to write, e.g. 'from,rxTime,decoded.portnum'."
+        " Default is the whole packet.",
+        metavar="FIELDS",
+    )
+
+    group.add_argument(
+        "--listen-payload",
+        help="With --format jsonl, also write the raw payload (base64 encoded)",
+        action="store_true",
+    )
+
+    group.add_argument(
+        "--flush-interval",
+        help="With --format jsonl, write out buffered packets at least this often. Default %(default)ss.",
+        default=1.0,
+        type=float,
+        metavar="SECONDS",
+    )
+
     group.add_argument(
         "--no-time",
         help="Deprecated. Retained for backwards compatibility in scripts, but is a no-op.",
@@ -2058,6 +2268,30 @@ def initParser():
         const="default",
     )
 
+    power_group.add_argument(
+        "--slog-rotate-mb",
+        help="Start new slog/power/raw segment files once the current ones reach this size (in MB)",
+        type=float,
+    )
+
+    power_group.add_argument(
+        "--slog-rotate-minutes",
+        help="Start new slog/power/raw segment files after this many minutes",
+        type=float,
+    )
+
+    power_group.add_argument(
+        "--slog-keep-runs",
+        help="Delete older runs in the default slog directory, keeping this many (including this one)",
+        type=int,
+    )
+
+    power_group.add_argument(
+        "--slog-max-age-days",
+        help="Delete runs in the default slog directory older than this many days",
+        type=float,
+    )
+
 
     remoteHardwareArgs = parser.add_argument_group(
         "Remote Hardware", "Arguments related to the Remote Hardware module"
@@ -2,6 +2,7 @@
 
 import argparse
 import logging
+from datetime import datetime
 from typing import cast, List
 
 import dash_bootstrap_components as dbc  # type: ignore[import-untyped]
@@ -11,10 +12,10 @@ import plotly.express as px  # type: ignore[import-untyped]
 import plotly.graph_objects as go  # type: ignore[import-untyped]
 import pyarrow as pa
 from dash import Dash, dcc, html  # type: ignore[import-untyped]
-from pyarrow import feather
 
 from .. import mesh_pb2, powermon_pb2
 from ..slog import root_dir
+from ..slog.runs import clock_offset, read_run
 
 # Configure panda options
 pd.options.mode.copy_on_write = True
@@ -38,10 +39,11 @@ def to_pmon_names(arr) -> List[str]:
     return [to_pmon_name(x) for x in arr]
 
 
-def read_pandas(filepath: str) -> pd.DataFrame:
-    """Read a feather file and convert it to a pandas DataFrame.
+def read_pandas(slog_path: str, stream: str) -> pd.DataFrame:
+    """Read a stream of a slog run (all its segments) and convert it to a pandas DataFrame.
 
-    filepath (str): Path to the feather file.
+    slog_path (str): Path to the slog directory.
+    stream (str): The stream to read ("slog" or "power").
 
     Returns the pandas DataFrame.
     """
@@ -62,7 +64,11 @@ def read_pandas(filepath: str) -> pd.DataFrame:
         pa.string(): pd.StringDtype(),
     }
 
-    return cast(pd.DataFrame, feather.read_table(filepath).to_pandas(types_mapper=dtype_mapping.get))  # type: ignore[arg-type]
+    df = cast(pd.DataFrame, read_run(slog_path, stream).to_pandas(types_mapper=dtype_mapping.get))  # type: ignore[arg-type]
+    if df["time"].dt.tz is not None:
+        # times are stored in UTC, show them in local time (as older runs, stored without a time zone, are)
+        df["time"] = df["time"].dt.tz_convert(datetime.now().astimezone().tzinfo).dt.tz_localize(None)
+    return df
 
 
 def get_pmon_raises(dslog: pd.DataFrame) -> pd.DataFrame:
@@ -143,8 +149,12 @@ def create_dash(slog_path: str) -> Dash:
     """
     app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
 
-    dpwr = read_pandas(f"{slog_path}/power.feather")
-    dslog = read_pandas(f"{slog_path}/slog.feather")
+    dpwr = read_pandas(slog_path, "power")
+    dslog = read_pandas(slog_path, "slog")
+    offset = clock_offset(slog_path)
+    if offset:
+        # line the device's events up with the power readings
+        dslog["time"] = dslog["time"] - pd.Timedelta(offset, unit="ns")
 
     pmon_raises = get_pmon_raises(dslog)
 
@@ -0,0 +1,108 @@
+"""Reading and reporting the steps of a batch script (meshtastic --batch)
+
+A batch is a list of CLI command lines to run one after the other over one connection. It is either a YAML
+list or JSON lines, each step being a command line string ("--set lora.hop_limit 5"), a list of arguments,
+or a dictionary with "args" (either of those), an optional "name", and "ignore_errors" to carry on if it fails
+(by default the batch stops at the first failed step).
+"""
+
+import json
+import shlex
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class BatchStep(NamedTuple):
+    """One command line of a batch"""
+
+    name: str
+    argv: List[str]
+    ignoreErrors: bool = False
+
+
+def parseSteps(text: str) -> List[BatchStep]:
+    """Parse a batch script (JSON lines, or a YAML list), raises ValueError if it is not one"""
+    try:
+        items = [json.loads(line) for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    except ValueError as jsonError:
+        import yaml  # pylint: disable=C0415
+
+        try:
+            items = yaml.safe_load(text)
+        except yaml.YAMLError as ex:
+            raise ValueError(f"Not JSON lines or YAML: {ex}") from ex
+        if not isinstance(items, list):
+            raise ValueError("A YAML batch must be a list of steps") from jsonError
+    return [_toStep(i, item) for i, item in enumerate(items, 1)]
+
+
+def _toStep(index: int, item: Any) -> BatchStep:
+    ignoreErrors = False
+    name = None
+    if isinstance(item, dict):
+        name = item.get("name")
+        ignoreErrors = bool(item.get("ignore_errors", False))
+        item = item.get("args")
+    if isinstance(item, str):
+        argv = shlex.split(item)
+    elif isinstance(item, list) and all(isinstance(a, (str, int, float)) for a in item):
+        argv = [str(a) for a in item]
+    else:
+        raise ValueError(f"Step {index}: expected a command line, a list of arguments or a dictionary with args")
+    if not argv:
+        raise ValueError(f"Step {index}: no arguments")
+    return BatchStep(str(name) if name is not None else " ".join(argv), argv, ignoreErrors)
+
+
+def _onlySets(argv: List[str]) -> bool:
+    """True if a command line is nothing but --set FIELD VALUE options"""
+    return len(argv) % 3 == 0 and all(argv[i] == "--set" for i in range(0, len(argv), 3))
+
+
+def groupSteps(steps: List[BatchStep]) -> List[List[int]]:
+    """Return the indexes of the steps to run together. Runs of steps that only --set preferences are merged,
+    so the device gets each changed config section once (in one transaction) instead of once per step."""
+    groups: List[List[int]] = []
+    for i, step in enumerate(steps):
+        if groups and _onlySets(step.argv) and all(_onlySets(steps[j].argv) for j in groups[-1]):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
+def runSteps(steps: List[BatchStep], runCommand: Callable[[List[str]], Tuple[int, str]]) -> Dict[str, Any]:
+    """Run the steps with runCommand(argv) -> (exit status, output), returns the report"""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(steps)
+    start = time.monotonic()
+    stopped = False
+    for group in groupSteps(steps):
+        if stopped:
+            break
+        argv = [a for i in group for a in steps[i].argv]
+        t0 = time.monotonic()
+        status, output = runCommand(argv)
+        seconds = round(time.monotonic() - t0, 3)
+        for i in group:
+            results[i] = {
+                "step": i + 1,
+                "name": steps[i].name,
+                "args": steps[i].argv,
+                "ok": status == 0,
+                "status": status,
+                "seconds": seconds,
+                "output": output,
+            }
+            if len(group) > 1:
+                results[i]["mergedWith"] = [j + 1 for j in group if j != i]  # type: ignore[index]
+        stopped = status != 0 and not all(steps[i].ignoreErrors for i in group)
+    report = [
+        r if r is not None else {"step": i + 1, "name": steps[i].name, "args": steps[i].argv, "ok": False,
+                                 "skipped": True}
+        for i, r in enumerate(results)
+    ]
+    return {
+        "ok": all(r["ok"] or (steps[r["step"] - 1].ignoreErrors and not r.get("skipped")) for r in report),
+        "seconds": round(time.monotonic() - start, 3),
+        "steps": report,
+    }
@@ -37,9 +37,11 @@ class BLEInterface(MeshInterface):
         noProto: bool = False,
         debugOut: Optional[io.TextIOWrapper]=None,
         noNodes: bool = False,
+        *,
+        snapshotDir: Optional[str] = None,
     ) -> None:
         MeshInterface.__init__(
-            self, debugOut=debugOut, noProto=noProto, noNodes=noNodes
+            self, debugOut=debugOut, noProto=noProto, noNodes=noNodes, snapshotDir=snapshotDir
         )
 
         self.should_read = False
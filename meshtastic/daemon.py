@@ -0,0 +1,132 @@
+"""Serve CLI commands from one connected interface over a local socket (meshtastic --daemon / --via-daemon)
+
+The daemon keeps the radio connection (and its node DB and config) open, so a client only pays for sending
+its command line over a Unix socket instead of reconnecting and downloading the config every time.
+Commands run one at a time, so any number of clients can share the radio.
+
+The protocol is one JSON line each way: the client sends {"argv": [...]}, the daemon answers with
+{"status": exit status, "output": what the command printed}.
+
+The output is captured by redirecting sys.stdout and sys.stderr, which is process wide: while a command runs,
+whatever other threads print (e.g. packets printed by the receive thread) is part of its reply.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def defaultSocketPath() -> str:
+    """Where the daemon listens unless told otherwise: in the user's runtime directory if there is one"""
+    runtimeDir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(runtimeDir, f"meshtastic-{uid}.sock")
+
+
+class SharedInterface:
+    """Passes everything through to an interface, except close(): commands must not close the shared connection"""
+
+    def __init__(self, iface) -> None:
+        self._iface = iface
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._iface, name)
+
+    def close(self) -> None:
+        """Does nothing, the daemon closes the interface when it stops"""
+
+
+def captureOutput(func: Callable[[], Any]) -> Tuple[int, str]:
+    """Run func, returning its exit status (0 unless it calls sys.exit) and everything printed while it ran
+    (by any thread, see above)"""
+    buf = io.StringIO()
+    status = 0
+    with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+        try:
+            func()
+        except SystemExit as ex:
+            if isinstance(ex.code, int):
+                status = ex.code
+            elif ex.code is not None:
+                print(ex.code)
+                status = 1
+        except Exception as ex:  # pylint: disable=W0718
+            logging.exception("Command failed")
+            print(f"Aborting due to: {ex}")
+            status = 1
+    return status, buf.getvalue()
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server: CommandServer = self.server  # type: ignore[assignment]
+        try:
+            argv = json.loads(self.rfile.readline())["argv"]
+            if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+                raise TypeError("argv must be a list of strings")
+        except (ValueError, KeyError, TypeError) as ex:
+            status, output = 2, f"Bad request: {ex}\n"
+        else:
+            with server.lock:
+                status, output = server.runCommand(argv)
+        try:
+            self.wfile.write((json.dumps({"status": status, "output": output}) + "\n").encode("utf-8"))
+        except OSError as ex:
+            logging.debug(f"Could not answer a client that went away: {ex}")
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Accepts command lines on a Unix socket and runs them (one at a time) with runCommand(argv) -> (status, output)"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, runCommand: Callable[[List[str]], Tuple[int, str]]) -> None:
+        if os.path.exists(path):
+            if _isListening(path):
+                raise OSError(f"A daemon is already listening on {path}")
+            os.unlink(path)  # left over from a daemon that did not shut down cleanly
+        self.path = path
+        self.runCommand = runCommand
+        self.lock = threading.Lock()
+        # the daemon can reconfigure the radio, only its owner may use it: create the socket as 0600 right away
+        oldUmask = os.umask(0o177)
+        try:
+            super().__init__(path, _CommandHandler)
+        finally:
+            os.umask(oldUmask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+def _isListening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def sendCommand(path: str, argv: List[str], timeout: Optional[float] = None) -> Tuple[int, str]:
+    """Run a command line in the daemon listening on path, returns (exit status, output).
+    Raises OSError if there is no daemon."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall((json.dumps({"argv": argv}) + "\n").encode("utf-8"))
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"The daemon on {path} closed the connection without answering")
+    response = json.loads(line)
+    return response["status"], response["output"]
@@ -0,0 +1,202 @@
+"""Apply one configuration to many (remote) nodes at once
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import yaml  # type: ignore[import-untyped]
+from google.protobuf.json_format import ParseDict, ParseError
+from google.protobuf.message import Message
+
+from meshtastic.mesh_interface import MeshInterface
+from meshtastic.protobuf import localonly_pb2
+from meshtastic.util import camel_to_snake
+
+
+class FleetError(Exception):
+    """An attempt to configure a node failed"""
+
+
+class NodeResult(NamedTuple):
+    """What happened to one node"""
+
+    nodeId: str
+    ok: bool
+    attempts: int
+    #: The config sections that were written (empty if the node already had the wanted config)
+    sections: List[str]
+    #: The changed fields by dotted path, e.g. "lora.hop_limit"
+    fields: List[str]
+    error: Optional[str] = None
+
+
+def loadFleetConfig(path: str) -> Dict[str, Any]:
+    """Read a configuration from a YAML file (the --configure format)"""
+    with open(path, encoding="utf8") as file:
+        return yaml.safe_load(file)
+
+
+def _stripBase64(value: Any) -> Any:
+    """Remove the "base64:" markers --export-config puts on bytes fields"""
+    if isinstance(value, dict):
+        return {k: _stripBase64(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_stripBase64(v) for v in value]
+    if isinstance(value, str) and value.startswith("base64:"):
+        return value[len("base64:"):]
+    return value
+
+
+class FleetConfigurator:
+    """Pushes the config and module_config parts of a configuration to a list of nodes.
+
+    Up to concurrency nodes are worked on at once, each with at most window admin requests in flight, so
+    concurrency * window bounds what we add to the mesh. For each node only the sections the configuration
+    mentions are read, merged with it, and written back if anything differs (see Node.configSession), so
+    running the same configuration again is harmless. Failed nodes are tried again up to retries times.
+
+    With a checkpoint file, every result is saved as it comes in and a later run with the same
+    configuration skips the nodes that were already done.
+    """
+
+    def __init__(
+        self,
+        iface,
+        configuration: Dict[str, Any],
+        *,
+        concurrency: int = 4,
+        window: int = 2,
+        retries: int = 2,
+        timeout: int = 60,
+        retryDelay: float = 10.0,
+        checkpoint: Optional[str] = None,
+        verify: bool = False,
+    ) -> None:
+        """Constructor
+
+        configuration: a dictionary like the --configure YAML, only config and module_config are used
+            (owner, location and channels are specific to each node). Raises ValueError if it does not parse.
+        timeout: how long to wait for a node to answer before giving up on an attempt
+        verify: read the written sections back and fail the attempt if the node does not have them
+        """
+        self.iface = iface
+        self.concurrency = concurrency
+        self.window = window
+        self.retries = retries
+        self.timeout = timeout
+        self.retryDelay = retryDelay
+        self.checkpoint = checkpoint
+        self.verify = verify
+        self.results: Dict[str, NodeResult] = {}
+        self._lock = threading.Lock()
+
+        self.localConfig: Dict[str, Dict] = {}
+        self.moduleConfig: Dict[str, Dict] = {}
+        target: Dict[str, Dict]
+        message: Message
+        for key, value in configuration.items():
+            key = camel_to_snake(key)
+            if key == "config":
+                target, message = self.localConfig, localonly_pb2.LocalConfig()
+            elif key == "module_config":
+                target, message = self.moduleConfig, localonly_pb2.LocalModuleConfig()
+            else:
+                logging.warning(f"Ignoring {key}, it can not be applied to a whole fleet")
+                continue
+            for section, prefs in (value or {}).items():
+                section = camel_to_snake(section)
+                if section not in message.DESCRIPTOR.fields_by_name:
+                    raise ValueError(f"Unknown {key} section {section}")
+                target[section] = _stripBase64(prefs or {})
+                try:
+                    ParseDict(target[section], getattr(message, section))
+                except ParseError as ex:
+                    raise ValueError(f"Bad {key}.{section}: {ex}") from ex
+        self.sections = list(self.localConfig) + list(self.moduleConfig)
+        self.digest = hashlib.sha256(
+            json.dumps([self.localConfig, self.moduleConfig], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def run(self, nodeIds: Iterable[str]) -> List[NodeResult]:
+        """Configure the nodes, returns a result per node (in the order given)"""
+        nodeIds = list(dict.fromkeys(nodeIds))
+        self._loadCheckpoint()
+        todo = [n for n in nodeIds if not (n in self.results and self.results[n].ok)]
+        if len(todo) < len(nodeIds):
+            logging.info(f"Skipping {len(nodeIds) - len(todo)} nodes already done according to {self.checkpoint}")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for result in pool.map(self.configureNode, todo):
+                logging.info(f"{result.nodeId}: {'done' if result.ok else 'FAILED ' + str(result.error)}")
+        return [self.results[n] for n in nodeIds]
+
+    def configureNode(self, nodeId: str) -> NodeResult:
+        """Configure one node (retrying), record and return the result"""
+        attempt = 0
+        result = NodeResult(nodeId, False, attempt, [], [], "interrupted")
+        try:
+            while True:
+                attempt += 1
+                try:
+                    changes = self._configureOnce(nodeId)
+                    result = NodeResult(nodeId, True, attempt, changes.sections, sorted(changes.fields))
+                    break
+                except (Exception, SystemExit) as ex:  # pylint: disable=broad-exception-caught
+                    # whatever goes wrong is this node's failure, not the run's (Node methods give up through
+                    # our_exit(), i.e. SystemExit)
+                    logging.warning(f"Attempt {attempt} to configure {nodeId} failed: {ex!r}")
+                    if isinstance(ex, (FleetError, MeshInterface.MeshInterfaceError, SystemExit)):
+                        error = str(ex) or type(ex).__name__
+                    else:
+                        error = f"{type(ex).__name__}: {ex}"
+                    result = NodeResult(nodeId, False, attempt, [], [], error)
+                    if attempt > self.retries:
+                        break
+                    time.sleep(self.retryDelay)
+        finally:
+            with self._lock:
+                self.results[nodeId] = result
+                self._saveCheckpoint()
+        return result
+
+    def _configureOnce(self, nodeId: str):
+        node = self.iface.getNode(nodeId, requestChannels=False, timeout=self.timeout)
+        failed = node.fetchAllConfig(window=self.window, timeout=self.timeout, sections=self.sections)
+        if failed:
+            raise FleetError(f"could not read {', '.join(failed)} config")
+        session = node.configSession()
+        for sections, config in ((self.localConfig, node.localConfig), (self.moduleConfig, node.moduleConfig)):
+            for section, prefs in sections.items():
+                ParseDict(prefs, getattr(config, section))
+        changes = session.commit()
+        if self.verify and changes.sections:
+            failed = node.fetchAllConfig(window=self.window, timeout=self.timeout, sections=changes.sections)
+            missing = failed or session.diff().sections
+            if missing:
+                raise FleetError(f"node does not have the written {', '.join(missing)} config")
+        return changes
+
+    def _loadCheckpoint(self) -> None:
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint, encoding="utf8") as f:
+            saved = json.load(f)
+        if saved.get("digest") != self.digest:
+            logging.warning(f"Ignoring {self.checkpoint}, it was written for a different configuration")
+            return
+        for nodeId, result in saved.get("results", {}).items():
+            self.results.setdefault(nodeId, NodeResult(**result))
+
+    def _saveCheckpoint(self) -> None:
+        """Write all results so far, replacing the file at once so it is never half written"""
+        if not self.checkpoint:
+            return
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump({"digest": self.digest, "results": {n: r._asdict() for n, r in self.results.items()}}, f, indent=1)
+        os.replace(tmp, self.checkpoint)
@@ -3,27 +3,27 @@
 # pylint: disable=R0917,C0302
 
 import collections
+import glob
 import json
 import logging
 import math
+import os
 import random
 import secrets
 import sys
 import threading
 import time
 import traceback
-from datetime import datetime
-from decimal import Decimal
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Union
 
 import google.protobuf.json_format
+import google.protobuf.message
 try:
     import print_color  # type: ignore[import-untyped]
 except ImportError as e:
     print_color = None
 
 from pubsub import pub  # type: ignore[import-untyped]
-from tabulate import tabulate
 
 import meshtastic.node
 from meshtastic import (
@@ -35,11 +35,14 @@ from meshtastic import (
     protocols,
     publishingThread,
 )
-from meshtastic.protobuf import mesh_pb2, portnums_pb2, telemetry_pb2
+from meshtastic.nodedb import NodeChange, NodeChangeCoalescer, NodeDB, NodeMapView, SessionKeyCache, readSnapshot, writeSnapshot
+from meshtastic.nodetable import NodeTable, _timeago  # pylint: disable=W0611
+from meshtastic.protobuf import channel_pb2, config_pb2, mesh_pb2, module_config_pb2, portnums_pb2, telemetry_pb2
 from meshtastic.util import (
     Acknowledgment,
     Timeout,
     convert_mac_addr,
+    fixupPositions,
     message_to_json,
     our_exit,
     remove_keys_from_dict,
@@ -47,29 +50,6 @@ from meshtastic.util import (
 )
 
 
-def _timeago(delta_secs: int) -> str:
-    """Convert a number of seconds in the past into a short, friendly string
-    e.g. "now", "30 sec ago",  "1 hour ago"
-    Zero or negative intervals simply return "now"
-    """
-    intervals = (
-        ("year", 60 * 60 * 24 * 365),
-        ("month", 60 * 60 * 24 * 30),
-        ("day", 60 * 60 * 24),
-        ("hour", 60 * 60),
-        ("min", 60),
-        ("sec", 1),
-    )
-    for name, interval_duration in intervals:
-        if delta_secs < interval_duration:
-            continue
-        x = delta_secs // interval_duration
-        plur = "s" if x > 1 else ""
-        return f"{x} {name}{plur} ago"
-
-    return "now"
-
-
 class MeshInterface:  # pylint: disable=R0902
     """Interface class for meshtastic devices
 
@@ -88,7 +68,7 @@ class MeshInterface:  # pylint: disable=R0902
             super().__init__(self.message)
 
     def __init__(
-        self, debugOut=None, noProto: bool = False, noNodes: bool = False
+        self, debugOut=None, noProto: bool = False, noNodes: bool = False, snapshotDir: Optional[str] = None
     ) -> None:
         """Constructor
 
@@ -97,9 +77,17 @@ class MeshInterface:  # pylint: disable=R0902
                        link - just be a dumb serial client.
             noNodes -- If True, instruct the node to not send its nodedb
                        on startup, just other configuration information.
+            snapshotDir -- If set, a directory where we keep a snapshot of the
+                       node DB and config of each device we connect to. On
+                       connect we restore it and only download the node DB
+                       in the background.
         """
         self.debugOut = debugOut
-        self.nodes: Optional[Dict[str, Dict]] = None  # FIXME
+        # Folds bursts of node DB changes into one meshtastic.node.changed event per node, set window to 0 to disable
+        self.nodeChanges: NodeChangeCoalescer = NodeChangeCoalescer(self._publishNodeChange)
+        self._nodeDB: Optional[NodeDB] = None  # We don't have a node DB until we start the config download
+        # Admin session passkeys of remote nodes, kept across reconnects (unlike the node DB)
+        self.sessionKeys: SessionKeyCache = SessionKeyCache()
         self.isConnected: threading.Event = threading.Event()
         self.noProto: bool = noProto
         self.localNode: meshtastic.node.Node = meshtastic.node.Node(
@@ -122,14 +110,28 @@ class MeshInterface:  # pylint: disable=R0902
         self.heartbeatTimer: Optional[threading.Timer] = None
         random.seed()  # FIXME, we should not clobber the random seedval here, instead tell user they must call it
         self.currentPacketId: int = random.randint(0, 0xFFFFFFFF)
-        self.nodesByNum: Optional[Dict[int, Dict]] = None
         self.noNodes: bool = noNodes
         self.configId: Optional[int] = NODELESS_WANT_CONFIG_ID if noNodes else None
         self.gotResponse: bool = False  # used in gpio read
         self.mask: Optional[int] = None  # used in gpio read and gpio watch
         self.queueStatus: Optional[mesh_pb2.QueueStatus] = None
         self.queue: collections.OrderedDict = collections.OrderedDict()
-        self._localChannels = None
+        self._localChannels: Optional[List] = None
+        self.snapshotDir: Optional[str] = snapshotDir
+        self._warmStart: bool = False  # True while doing the nodeless download of a warm start
+        # True if a warm start found no snapshot of the device, so everything is downloaded once the nodeless
+        # download is over
+        self._fullDownloadPending: bool = False
+        self._snapshotNums: Set[int] = set()  # the nodes we restored from the snapshot
+        self._reconcileNums: Optional[Set[int]] = None  # nodes seen during the background node DB download
+        # Limits for the node DB on large (e.g. MQTT fed) meshes, applied when we (re)connect. None means no limit.
+        self.maxNodes: Optional[int] = None  # keep at most this many nodes, evicting the least recently updated
+        self.maxNodeAge: Optional[float] = None  # drop nodes not heard from in this many seconds
+        # What to keep as node["lastReceived"]: "full" (the whole packet), "summary" (see nodedb.summarizePacket)
+        # or "none"
+        self.lastReceivedMode: str = "full"
+        # If set to a meshtastic.timeseries.TelemetryStore, received telemetry is added to it
+        self.telemetryStore: Optional[Any] = None
 
         # We could have just not passed in debugOut to MeshInterface, and instead told consumers to subscribe to
         # the meshtastic.log.line publish instead.  Alas though changing that now would be a breaking API change
@@ -137,11 +139,60 @@ class MeshInterface:  # pylint: disable=R0902
         if debugOut:
             pub.subscribe(MeshInterface._printLogLine, "meshtastic.log.line")
 
+    @property
+    def nodeDB(self) -> Optional[NodeDB]:
+        """The node DB (None until we start talking to the device)"""
+        return self._nodeDB
+
+    @nodeDB.setter
+    def nodeDB(self, db: Optional[NodeDB]) -> None:
+        if db is not None:
+            db.onChange = self.nodeChanges.add
+            db.onRemove = self._publishNodeRemoved
+        self._nodeDB = db
+
+    def _publishNodeChange(self, change: NodeChange) -> None:
+        publishingThread.queueWork(
+            lambda: pub.sendMessage(
+                "meshtastic.node.changed", change=change, interface=self
+            )
+        )
+
+    def _publishNodeRemoved(self, num: int) -> None:
+        publishingThread.queueWork(
+            lambda: pub.sendMessage(
+                "meshtastic.node.removed", num=num, interface=self
+            )
+        )
+
+    @property
+    def nodes(self) -> Optional[NodeMapView]:
+        """Read-only view of the node DB keyed by node ID (only nodes we have seen a User for)"""
+        return self.nodeDB.byId if self.nodeDB is not None else None
+
+    @nodes.setter
+    def nodes(self, value: Optional[Dict[str, Dict]]) -> None:
+        self.nodeDB = NodeDB.fromIdMap(value) if value is not None else None
+
+    @property
+    def nodesByNum(self) -> Optional[NodeMapView]:
+        """Read-only view of the node DB keyed by node number"""
+        return self.nodeDB.byNum if self.nodeDB is not None else None
+
+    @nodesByNum.setter
+    def nodesByNum(self, value: Optional[Dict[int, Dict]]) -> None:
+        self.nodeDB = NodeDB.fromNumMap(value) if value is not None else None
+
     def close(self):
         """Shutdown this interface"""
         if self.heartbeatTimer:
             self.heartbeatTimer.cancel()
 
+        if self.snapshotDir is not None and self.isConnected.is_set():
+            self.saveSnapshot()
+
+        self.nodeChanges.flush()
+
         self._sendDisconnect()
 
     def __enter__(self):
@@ -222,161 +273,74 @@ class MeshInterface:  # pylint: disable=R0902
         return infos
 
     def showNodes(
-        self, includeSelf: bool = True, showFields: Optional[List[str]] = None
-    ) -> str:  # pylint: disable=W0613
+        self,
+        includeSelf: bool = True,
+        showFields: Optional[List[str]] = None,
+        printFmt: str = "table",
+        sortField: Optional[str] = "lastHeard",
+        reverse: bool = True,
+        where: Optional[Callable[[Dict], bool]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        out=None,
+    ) -> Optional[str]:
         """Show table summary of nodes in mesh
 
            Args:
                 includeSelf (bool): Include ourself in the output?
                 showFields (List[str]): List of fields to show in output
+                printFmt (str): One of meshtastic.nodetable.FORMATS, "table" is a formatted text table,
+                    "csv", "jsonl" and "arrow" (an Arrow IPC stream) are streamed a row at a time with raw values
+                sortField (str): The (dotted) field to sort by, most recently heard first by default
+                reverse (bool): Sort in descending order?
+                where (Callable): Only show nodes for which this returns True
+                offset, limit (int): The page of nodes to show
+                out: Where to write to, stdout by default (a binary stream for arrow)
+           Returns the table text for the table format, None otherwise
         """
+        table = NodeTable(showFields)
+        myNodeNum = self.localNode.nodeNum
+        if not includeSelf:
+            keep = where
+
+            def notMe(node: Dict) -> bool:
+                return node["num"] != myNodeNum and (keep is None or keep(node))
+
+            where = notMe
+        nodes = table.select(
+            self.nodesByNum.values() if self.nodesByNum else (),
+            where=where,
+            sortField=sortField,
+            reverse=reverse,
+            offset=offset,
+            limit=limit,
+        )
 
-        def get_human_readable(name):
-            name_map = {
-                "user.longName": "User",
-                "user.id": "ID",
-                "user.shortName": "AKA",
-                "user.hwModel": "Hardware",
-                "user.publicKey": "Pubkey",
-                "user.role": "Role",
-                "position.latitude": "Latitude",
-                "position.longitude": "Longitude",
-                "position.altitude": "Altitude",
-                "deviceMetrics.batteryLevel": "Battery",
-                "deviceMetrics.channelUtilization": "Channel util.",
-                "deviceMetrics.airUtilTx": "Tx air util.",
-                "snr": "SNR",
-                "hopsAway": "Hops",
-                "channel": "Channel",
-                "lastHeard": "LastHeard",
-                "since": "Since",
-
-            }
-
-            if name in name_map:
-                return name_map.get(name)  # Default to a formatted guess
+        if printFmt == "table":
+            text = table.table(nodes, start=offset + 1)
+            if out is None:
+                print(text)
             else:
-                return name
-
-
-        def formatFloat(value, precision=2, unit="") -> Optional[str]:
-            """Format a float value with precision."""
-            return f"{value:.{precision}f}{unit}" if value else None
-
-        def getLH(ts) -> Optional[str]:
-            """Format last heard"""
-            return (
-                datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
-            )
-
-        def getTimeAgo(ts) -> Optional[str]:
-            """Format how long ago have we heard from this node (aka timeago)."""
-            if ts is None:
-                return None
-            delta = datetime.now() - datetime.fromtimestamp(ts)
-            delta_secs = int(delta.total_seconds())
-            if delta_secs < 0:
-                return None  # not handling a timestamp from the future
-            return _timeago(delta_secs)
-
-        def getNestedValue(node_dict: Dict[str, Any], key_path: str) -> Any:
-            if key_path.index(".") < 0:
-                logging.debug("getNestedValue was called without a nested path.")
-                return None
-            keys = key_path.split(".")
-            value: Optional[Union[str, dict]] = node_dict
-            for key in keys:
-                if isinstance(value, dict):
-                    value = value.get(key)
-                else:
-                    return None
-            return value
-
-        if showFields is None or len(showFields) == 0:
-          # The default set of fields to show (e.g., the status quo)
-            showFields = ["N", "user.longName", "user.id", "user.shortName", "user.hwModel", "user.publicKey",
-                          "user.role", "position.latitude", "position.longitude", "position.altitude",
-                          "deviceMetrics.batteryLevel", "deviceMetrics.channelUtilization",
-                          "deviceMetrics.airUtilTx", "snr", "hopsAway", "channel", "lastHeard", "since"]
-        else:
-            # Always at least include the row number.
-            showFields.insert(0, "N")
-
-        rows: List[Dict[str, Any]] = []
-        if self.nodesByNum:
-            logging.debug(f"self.nodes:{self.nodes}")
-            for node in self.nodesByNum.values():
-                if not includeSelf and node["num"] == self.localNode.nodeNum:
-                    continue
+                out.write(text + "\n")
+            return text
 
-                presumptive_id = f"!{node['num']:08x}"
-
-                # This allows the user to specify fields that wouldn't otherwise be included.
-                fields = {}
-                for field in showFields:
-                    if "." in field:
-                        raw_value = getNestedValue(node, field)
-                    else:
-                        # The "since" column is synthesized, it's not retrieved from the device. Get the
-                        # lastHeard value here, and then we'll format it properly below.
-                        if field == "since":
-                            raw_value = node.get("lastHeard")
-                        else:
-                            raw_value = node.get(field)
-
-                    formatted_value: Optional[str] = ""
-
-                    # Some of these need special formatting or processing.
-                    if field == "channel":
-                        if raw_value is None:
-                            formatted_value = "0"
-                    elif field == "deviceMetrics.channelUtilization":
-                        formatted_value = formatFloat(raw_value, 2, "%")
-                    elif field == "deviceMetrics.airUtilTx":
-                        formatted_value = formatFloat(raw_value, 2, "%")
-                    elif field == "deviceMetrics.batteryLevel":
-                        if raw_value in (0, 101):
-                            formatted_value = "Powered"
-                        else:
-                            formatted_value = formatFloat(raw_value, 0, "%")
-                    elif field == "lastHeard":
-                        formatted_value = getLH(raw_value)
-                    elif field == "position.latitude":
-                        formatted_value = formatFloat(raw_value, 4, "°")
-                    elif field == "position.longitude":
-                        formatted_value = formatFloat(raw_value, 4, "°")
-                    elif field == "position.altitude":
-                        formatted_value = formatFloat(raw_value, 0, "m")
-                    elif field == "since":
-                        formatted_value = getTimeAgo(raw_value) or "N/A"
-                    elif field == "snr":
-                        formatted_value = formatFloat(raw_value, 0, " dB")
-                    elif field == "user.shortName":
-                        formatted_value = raw_value if raw_value is not None else f'Meshtastic {presumptive_id[-4:]}'
-                    elif field == "user.id":
-                        formatted_value = raw_value if raw_value is not None else presumptive_id
-                    else:
-                        formatted_value = raw_value  # No special formatting
-
-                    fields[field] = formatted_value
-
-                # Filter out any field in the data set that was not specified.
-                filteredData = {get_human_readable(k): v for k, v in fields.items() if k in showFields}
-                filteredData.update({get_human_readable(k): v for k, v in fields.items()})
-                rows.append(filteredData)
-
-        rows.sort(key=lambda r: r.get("LastHeard") or "0000", reverse=True)
-        for i, row in enumerate(rows):
-            row["N"] = i + 1
-
-        table = tabulate(rows, headers="keys", missingval="N/A", tablefmt="fancy_grid")
-        print(table)
-        return table
+        if out is None:
+            out = sys.stdout.buffer if printFmt == "arrow" else sys.stdout
+        table.write(out, nodes, printFmt, start=offset + 1)
+        return None
 
     def getNode(
-        self, nodeId: str, requestChannels: bool = True, requestChannelAttempts: int = 3, timeout: int = 300
+        self,
+        nodeId: str,
+        requestChannels: bool = True,
+        requestChannelAttempts: int = 3,
+        timeout: int = 300,
+        channelWindow: int = 1,
     ) -> meshtastic.node.Node:
-        """Return a node object which contains device settings and channel info"""
+        """Return a node object which contains device settings and channel info
+
+        channelWindow is the number of channel requests kept in flight at once (see Node.requestChannels)
+        """
         if nodeId in (LOCAL_ADDR, BROADCAST_ADDR):
             return self.localNode
         else:
@@ -384,7 +348,7 @@ class MeshInterface:  # pylint: disable=R0902
             # Only request device settings and channel info when necessary
             if requestChannels:
                 logging.debug("About to requestChannels")
-                n.requestChannels()
+                n.requestChannels(window=channelWindow)
                 retries_left = requestChannelAttempts
                 last_index: int = 0
                 while retries_left > 0:
@@ -397,7 +361,7 @@ class MeshInterface:  # pylint: disable=R0902
                         if retries_left <= 0:
                             our_exit("Error: Timed out waiting for channels, giving up")
                         print("Timed out trying to retrieve channel info, retrying")
-                        n.requestChannels(startingIndex=new_index)
+                        n.requestChannels(startingIndex=new_index, window=channelWindow)
                         last_index = new_index
                     else:
                         break
@@ -997,6 +961,14 @@ class MeshInterface:  # pylint: disable=R0902
         else:
             logging.debug(f"Sending packet: {stripnl(meshPacket)}")
             self._sendToRadio(toRadio)
+            sent = toRadio.packet
+            publishingThread.queueWork(
+                lambda: pub.sendMessage(
+                    "meshtastic.sent",
+                    packet={**google.protobuf.json_format.MessageToDict(sent), "raw": sent},
+                    interface=self,
+                )
+            )
         return meshPacket
 
     def waitForConfig(self):
@@ -1010,9 +982,15 @@ class MeshInterface:  # pylint: disable=R0902
                 "Timed out waiting for interface config"
             )
 
-    def waitForAckNak(self):
-        """Wait for the ack/nak"""
-        success = self._timeout.waitForAckNak(self._acknowledgment)
+    def waitForAckNak(self, acknowledgment: Optional[Acknowledgment] = None) -> None:
+        """Wait for the ack/nak (of any request, or with acknowledgment those of one node, see Node._acknowledgment)"""
+        if acknowledgment is None:
+            success = self._timeout.waitForAckNak(self._acknowledgment)
+        else:
+            # a timer of our own, so waits for different nodes can run at the same time
+            timeout = Timeout(maxSecs=self._timeout.expireTimeout)
+            timeout.sleepInterval = self._timeout.sleepInterval
+            success = timeout.waitForAckNak(acknowledgment)
         if not success:
             raise MeshInterface.MeshInterfaceError(
                 "Timed out waiting for an acknowledgment"
@@ -1145,15 +1123,23 @@ class MeshInterface:  # pylint: disable=R0902
 
     def _startConfig(self):
         """Start device packets flowing"""
+        lastNodeNum = self.myInfo.my_node_num if self.myInfo is not None else None
         self.myInfo = None
-        self.nodes = {}  # nodes keyed by ID
-        self.nodesByNum = {}  # nodes keyed by nodenum
+        self.nodeDB = NodeDB(maxNodes=self.maxNodes, maxAge=self.maxNodeAge)
         self._localChannels = (
             []
         )  # empty until we start getting channels pushed from the device (during config)
+        self._snapshotNums = set()
+        self._reconcileNums = None
+        self._fullDownloadPending = False
 
         startConfig = mesh_pb2.ToRadio()
-        if self.configId is None or not self.noNodes:
+        if self.snapshotDir is not None and not self.noNodes and self._hasSnapshots(lastNodeNum):
+            # Warm start: only ask for our own node, the rest comes from the snapshot until
+            # the full node DB has been downloaded in the background (see _handleConfigComplete)
+            self._warmStart = True
+            self.configId = NODELESS_WANT_CONFIG_ID
+        elif self.configId is None or not self.noNodes:
             self.configId = random.randint(0, 0xFFFFFFFF)
             if self.configId == NODELESS_WANT_CONFIG_ID:
                 self.configId = self.configId + 1
@@ -1235,13 +1221,135 @@ class MeshInterface:  # pylint: disable=R0902
         Done with initial config messages, now send regular MeshPackets
         to ask for settings and channels
         """
+        if self._fullDownloadPending:
+            # a warm start without a snapshot of this device: now that the nodeless download is over (asking
+            # for more while it streams would mix the two), download everything before we call it connected
+            self._fullDownloadPending = False
+            self._startReconcile()
+            return
+
         # This is no longer necessary because the current protocol statemachine has already proactively sent us the locally visible channels
         # self.localNode.requestChannels()
         self.localNode.setChannels(self._localChannels)
 
+        if self._reconcileNums is not None:
+            self._finishReconcile()
+        elif self.snapshotDir is not None and not self._warmStart:
+            self.saveSnapshot()
+
         # the following should only be called after we have settings and channels
         self._connected()  # Tell everyone else we are ready to go
 
+        if self._warmStart:
+            self._warmStart = False
+            self._startReconcile()
+
+    def _startReconcile(self) -> None:
+        """After a warm start, download the full node DB to bring the restored snapshot up to date"""
+        logging.debug("Downloading the node DB in the background")
+        self._reconcileNums = set()
+        self._localChannels = []
+        self.configId = random.randint(0, 0xFFFFFFFF)
+        if self.configId == NODELESS_WANT_CONFIG_ID:
+            self.configId = self.configId + 1
+        startConfig = mesh_pb2.ToRadio()
+        startConfig.want_config_id = self.configId
+        self._sendToRadio(startConfig)
+
+    def _finishReconcile(self) -> None:
+        """The background node DB download is complete: drop restored nodes the device no longer knows and save"""
+        stale = self._snapshotNums - (self._reconcileNums or set())
+        for num in stale:
+            self.nodeDB.remove(num)  # type: ignore[union-attr]
+        logging.debug(f"Node DB download complete, dropped {len(stale)} stale nodes from the snapshot")
+        self._snapshotNums = set()
+        self._reconcileNums = None
+        self.saveSnapshot()
+
+    def _hasSnapshots(self, nodeNum: Optional[int] = None) -> bool:
+        """Is there a snapshot of the device nodeNum (the one we were connected to before) in snapshotDir?
+        If we do not know it, is there one of any device (we only learn which device we talk to later)?"""
+        if nodeNum is not None:
+            return os.path.exists(os.path.join(self.snapshotDir or "", f"nodedb-{nodeNum:08x}.bin"))
+        return bool(glob.glob(os.path.join(glob.escape(self.snapshotDir or ""), "nodedb-*.bin")))
+
+    def _snapshotPath(self) -> Optional[str]:
+        """The snapshot file for the device we are connected to"""
+        if self.snapshotDir is None or self.myInfo is None:
+            return None
+        return os.path.join(self.snapshotDir, f"nodedb-{self.myInfo.my_node_num:08x}.bin")
+
+    def saveSnapshot(self) -> None:
+        """Write the node DB, config and channels of the connected device to its snapshot file"""
+        path = self._snapshotPath()
+        if path is None or self.nodeDB is None:
+            return
+
+        messages = []
+        for node in self.nodeDB.byNum.values():
+            f = mesh_pb2.FromRadio()
+            try:
+                google.protobuf.json_format.ParseDict(node, f.node_info, ignore_unknown_fields=True)
+            except (google.protobuf.json_format.ParseError, AttributeError, TypeError) as ex:
+                logging.debug(f"Not saving node {node.get('num')} in snapshot: {ex}")
+                continue
+            messages.append(f)
+        for field, value in self.localNode.localConfig.ListFields():
+            if field.name in config_pb2.Config.DESCRIPTOR.fields_by_name:
+                f = mesh_pb2.FromRadio()
+                getattr(f.config, field.name).CopyFrom(value)
+                messages.append(f)
+        for field, value in self.localNode.moduleConfig.ListFields():
+            if field.name in module_config_pb2.ModuleConfig.DESCRIPTOR.fields_by_name:
+                f = mesh_pb2.FromRadio()
+                getattr(f.moduleConfig, field.name).CopyFrom(value)
+                messages.append(f)
+        channel: channel_pb2.Channel
+        for channel in self.localNode.channels or []:
+            f = mesh_pb2.FromRadio()
+            f.channel.CopyFrom(channel)
+            messages.append(f)
+
+        try:
+            os.makedirs(self.snapshotDir, exist_ok=True)  # type: ignore[arg-type]
+            writeSnapshot(path, messages)
+            logging.debug(f"Saved {len(self.nodeDB)} nodes to {path}")
+        except OSError as ex:
+            logging.warning(f"Could not save node DB snapshot {path}: {ex}")
+
+    def _loadSnapshot(self) -> bool:
+        """Restore the node DB, config and channels from the snapshot of the device we just connected to.
+        Returns False if there is no (readable) snapshot of it"""
+        path = self._snapshotPath()
+        if path is None or not os.path.exists(path):
+            return False
+        try:
+            messages = readSnapshot(path)
+        except (OSError, ValueError, google.protobuf.message.DecodeError) as ex:
+            logging.warning(f"Ignoring unreadable node DB snapshot {path}: {ex}")
+            return False
+
+        channels = []
+        for m in messages:
+            variant = m.WhichOneof("payload_variant")
+            if variant == "node_info":
+                node = self._handleNodeInfo(google.protobuf.json_format.MessageToDict(m.node_info))
+                self._snapshotNums.add(node["num"])
+            elif variant == "config":
+                configName = m.config.WhichOneof("payload_variant")
+                if configName is not None:
+                    getattr(self.localNode.localConfig, configName).CopyFrom(getattr(m.config, configName))
+            elif variant == "moduleConfig":
+                moduleName = m.moduleConfig.WhichOneof("payload_variant")
+                if moduleName is not None:
+                    getattr(self.localNode.moduleConfig, moduleName).CopyFrom(getattr(m.moduleConfig, moduleName))
+            elif variant == "channel":
+                channels.append(m.channel)
+        if channels:
+            self.localNode.setChannels(channels)
+        logging.debug(f"Restored {len(self._snapshotNums)} nodes from {path}")
+        return True
+
     def _handleQueueStatusFromRadio(self, queueStatus) -> None:
         self.queueStatus = queueStatus
         logging.debug(
@@ -1266,6 +1374,7 @@ class MeshInterface:  # pylint: disable=R0902
         Handle a packet that arrived from the radio(update model and publish events)
 
         Called by subclasses."""
+        rxMonotonic = time.monotonic()
         fromRadio = mesh_pb2.FromRadio()
         logging.debug(
             f"in mesh_interface.py _handleFromRadio() fromRadioBytes: {fromRadioBytes}"
@@ -1283,7 +1392,13 @@ class MeshInterface:  # pylint: disable=R0902
         if fromRadio.HasField("my_info"):
             self.myInfo = fromRadio.my_info
             self.localNode.nodeNum = self.myInfo.my_node_num
+            if self.nodeDB is not None:
+                self.nodeDB.keep.add(self.myInfo.my_node_num)
             logging.debug(f"Received myinfo: {stripnl(fromRadio.my_info)}")
+            if self._warmStart and not self._loadSnapshot():
+                # no snapshot of this device after all, so download everything once this download is done
+                self._warmStart = False
+                self._fullDownloadPending = True
 
         elif fromRadio.HasField("metadata"):
             self.metadata = fromRadio.metadata
@@ -1292,24 +1407,9 @@ class MeshInterface:  # pylint: disable=R0902
         elif fromRadio.HasField("node_info"):
             logging.debug(f"Received nodeinfo: {asDict['nodeInfo']}")
 
-            node = self._getOrCreateByNum(asDict["nodeInfo"]["num"])
-            node.update(asDict["nodeInfo"])
-            try:
-                newpos = self._fixupPosition(node["position"])
-                node["position"] = newpos
-            except:
-                logging.debug("Node without position")
-
-            # no longer necessary since we're mutating directly in nodesByNum via _getOrCreateByNum
-            # self.nodesByNum[node["num"]] = node
-            if "user" in node:  # Some nodes might not have user/ids assigned yet
-                if "id" in node["user"]:
-                    self.nodes[node["user"]["id"]] = node
-            publishingThread.queueWork(
-                lambda: pub.sendMessage(
-                    "meshtastic.node.updated", node=node, interface=self
-                )
-            )
+            node = self._handleNodeInfo(asDict["nodeInfo"])
+            if self._reconcileNums is not None:
+                self._reconcileNums.add(node["num"])
         elif fromRadio.config_complete_id == self.configId:
             # we ignore the config_complete_id, it is unneeded for our
             # stream API fromRadio.config_complete_id
@@ -1318,7 +1418,7 @@ class MeshInterface:  # pylint: disable=R0902
         elif fromRadio.HasField("channel"):
             self._handleChannel(fromRadio.channel)
         elif fromRadio.HasField("packet"):
-            self._handlePacketFromRadio(fromRadio.packet)
+            self._handlePacketFromRadio(fromRadio.packet, rxMonotonic=rxMonotonic)
         elif fromRadio.HasField("log_record"):
             self._handleLogRecord(fromRadio.log_record)
         elif fromRadio.HasField("queueStatus"):
@@ -1366,6 +1466,22 @@ class MeshInterface:  # pylint: disable=R0902
         else:
             logging.debug("Unexpected FromRadio payload")
 
+    def _handleNodeInfo(self, info: Dict) -> Dict:
+        """Merge a NodeInfo (as a dictionary) into the node DB and publish the change"""
+        if "position" in info:
+            info["position"] = self._fixupPosition(info["position"])
+        else:
+            logging.debug("Node without position")
+
+        # Some nodes might not have user/ids assigned yet, the DB only indexes them by ID once they do
+        node = self.nodeDB.update(info["num"], info)  # type: ignore[union-attr]
+        publishingThread.queueWork(
+            lambda: pub.sendMessage(
+                "meshtastic.node.updated", node=node, interface=self
+            )
+        )
+        return node
+
     def _fixupPosition(self, position: Dict) -> Dict:
         """Convert integer lat/lon into floats
 
@@ -1373,10 +1489,7 @@ class MeshInterface:  # pylint: disable=R0902
             position {Position dictionary} -- object to fix up
         Returns the position with the updated keys
         """
-        if "latitudeI" in position:
-            position["latitude"] = float(position["latitudeI"] * Decimal("1e-7"))
-        if "longitudeI" in position:
-            position["longitude"] = float(position["longitudeI"] * Decimal("1e-7"))
+        fixupPositions((position,))
         return position
 
     def _nodeNumToId(self, num: int, isDest = True) -> Optional[str]:
@@ -1396,7 +1509,7 @@ class MeshInterface:  # pylint: disable=R0902
                 return "Unknown"
 
         try:
-            return self.nodesByNum[num]["user"]["id"]  # type: ignore[index]
+            return self.nodeDB.get(num)["user"]["id"]  # type: ignore[union-attr,index]
         except:
             logging.debug(f"Node {num} not found for fromId")
             return None
@@ -1408,27 +1521,13 @@ class MeshInterface:  # pylint: disable=R0902
                 "Can not create/find nodenum by the broadcast num"
             )
 
-        if nodeNum in self.nodesByNum:
-            return self.nodesByNum[nodeNum]
-        else:
-            presumptive_id = f"!{nodeNum:08x}"
-            n = {
-                "num": nodeNum,
-                "user": {
-                    "id": presumptive_id,
-                    "longName": f"Meshtastic {presumptive_id[-4:]}",
-                    "shortName": f"{presumptive_id[-4:]}",
-                    "hwModel": "UNSET",
-                },
-            }  # Create a minimal node db entry
-            self.nodesByNum[nodeNum] = n
-            return n
+        return self.nodeDB.getOrCreate(nodeNum)  # type: ignore[union-attr]
 
     def _handleChannel(self, channel):
         """During initial config the local node will proactively send all N (8) channels it knows"""
         self._localChannels.append(channel)
 
-    def _handlePacketFromRadio(self, meshPacket, hack=False):
+    def _handlePacketFromRadio(self, meshPacket, hack=False, rxMonotonic: Optional[float] = None):
         """Handle a MeshPacket that just arrived from the radio
 
         hack - well, since we used 'from', which is a python keyword,
@@ -1437,6 +1536,8 @@ class MeshInterface:  # pylint: disable=R0902
                     meshPacket = mesh_pb2.MeshPacket()
                     meshPacket.from = 123
                If hack is True, we can unit test this code.
+        rxMonotonic - time.monotonic() when the packet arrived (now if not given), passed on as
+               packet["rxMonotonic"] so subscribers can tell how long decoding and publishing took
 
         Will publish one of the following events:
         - meshtastic.receive.text(packet = MeshPacket dictionary)
@@ -1450,6 +1551,7 @@ class MeshInterface:  # pylint: disable=R0902
         # doesn't need to understand protobufs.  But advanced clients might
         # want the raw protobuf, so we provide it in "raw"
         asDict["raw"] = meshPacket
+        asDict["rxMonotonic"] = time.monotonic() if rxMonotonic is None else rxMonotonic
 
         # from might be missing if the nodenum was zero.
         if not hack and "from" not in asDict:
@@ -1533,18 +1635,18 @@ class MeshInterface:  # pylint: disable=R0902
                     "errorReason" not in routing or routing["errorReason"] == "NONE"
                 )
                 # we keep the responseHandler in dict until we actually call it
-                handler = self.responseHandlers.get(requestId, None)
-                if handler is not None:
+                responseHandler = self.responseHandlers.get(requestId, None)
+                if responseHandler is not None:
                     if (
                         (not isAck)
-                        or handler.callback.__name__ == "onAckNak"
-                        or handler.ackPermitted
+                        or responseHandler.callback.__name__ == "onAckNak"
+                        or responseHandler.ackPermitted
                     ):
-                        handler = self.responseHandlers.pop(requestId, None)
+                        self.responseHandlers.pop(requestId, None)
                         logging.debug(
                             f"Calling response handler for requestId {requestId}"
                         )
-                        handler.callback(asDict)
+                        responseHandler.callback(asDict)
 
         logging.debug(f"Publishing {topic}: packet={stripnl(asDict)} ")
         publishingThread.queueWork(
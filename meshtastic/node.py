@@ -2,13 +2,19 @@
 """
 
 import base64
+import collections
 import logging
+import threading
 import time
 
-from typing import Optional, Union, List
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Union, List, Tuple
 
+from google.protobuf.json_format import MessageToDict
+
+from meshtastic.nodedb import diffNodeInfo
 from meshtastic.protobuf import admin_pb2, apponly_pb2, channel_pb2, localonly_pb2, mesh_pb2, portnums_pb2
 from meshtastic.util import (
+    Acknowledgment,
     Timeout,
     camel_to_snake,
     fromPSK,
@@ -18,6 +24,115 @@ from meshtastic.util import (
     message_to_json,
 )
 
+MODULE_CONFIG_TYPE_NAMES = {
+    "external_notification": "EXTNOTIF_CONFIG",
+    "canned_message": "CANNEDMSG_CONFIG",
+}
+"""AdminMessage.ModuleConfigType names of the LocalModuleConfig fields whose name is not simply the field name
+without underscores (e.g. store_forward -> STOREFORWARD_CONFIG)"""
+
+
+class ConfigChanges(NamedTuple):
+    """What a ConfigSession found changed (and wrote)"""
+
+    #: The localConfig/moduleConfig sections, e.g. ["lora", "mqtt"]
+    sections: List[str]
+    #: The channel indexes
+    channels: List[int]
+    #: The changed fields by dotted path (e.g. "lora.hop_limit", "channels.1.settings.name") with (old, new) values.
+    #: Values that are not set (or only have their default value) are None.
+    fields: Dict[str, Tuple[Any, Any]]
+
+
+class ConfigSession:
+    """A snapshot of a node's localConfig, moduleConfig and channels, to write back only what was changed since.
+
+    Edit the node's localConfig/moduleConfig/channels as usual, then commit() (or use the session as a
+    context manager) to write the sections and channels that differ from the snapshot. A section we had no
+    copy of when the snapshot was taken (e.g. config of a remote node we did not read) is written if it
+    was touched at all, as we can not tell what changed.
+    """
+
+    def __init__(self, node: "Node") -> None:
+        self.node = node
+        self.localConfig = localonly_pb2.LocalConfig()
+        self.moduleConfig = localonly_pb2.LocalModuleConfig()
+        self.channels: List[channel_pb2.Channel] = []
+        self.snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def snapshot(self) -> None:
+        """Take a new snapshot of the node's current config"""
+        self.localConfig.CopyFrom(self.node.localConfig)
+        self.moduleConfig.CopyFrom(self.node.moduleConfig)
+        self.channels = []
+        for c in self.node.channels or []:
+            copy = channel_pb2.Channel()
+            copy.CopyFrom(c)
+            self.channels.append(copy)
+
+    def diff(self) -> ConfigChanges:
+        """Compare the node's config with the snapshot"""
+        changes = ConfigChanges([], [], {})
+        old: Union[localonly_pb2.LocalConfig, localonly_pb2.LocalModuleConfig]
+        new: Union[localonly_pb2.LocalConfig, localonly_pb2.LocalModuleConfig]
+        for old, new in ((self.localConfig, self.node.localConfig), (self.moduleConfig, self.node.moduleConfig)):
+            for field in new.DESCRIPTOR.fields:
+                if field.message_type is None:
+                    continue  # the version fields
+                name = field.name
+                if old.HasField(name) == new.HasField(name) and getattr(old, name) == getattr(new, name):
+                    continue
+                changes.sections.append(name)
+                diffNodeInfo(self._asDict(old, name), self._asDict(new, name), name + ".", changes.fields)
+        for c in self.node.channels or []:
+            before = self.channels[c.index] if c.index < len(self.channels) else None
+            if before != c:
+                changes.channels.append(c.index)
+                diffNodeInfo(
+                    MessageToDict(before, preserving_proto_field_name=True) if before is not None else {},
+                    MessageToDict(c, preserving_proto_field_name=True),
+                    f"channels.{c.index}.",
+                    changes.fields,
+                )
+        return changes
+
+    @staticmethod
+    def _asDict(config, name: str) -> Dict:
+        if not config.HasField(name):
+            return {}
+        return MessageToDict(getattr(config, name), preserving_proto_field_name=True)
+
+    def commit(self, transaction: bool = True) -> ConfigChanges:
+        """Write the changed sections and channels to the node, inside a settings transaction unless
+        transaction is False (e.g. because the caller already opened one). Nothing is sent if nothing changed.
+
+        Returns what was written, and takes a new snapshot
+        """
+        changes = self.diff()
+        if not changes.sections and not changes.channels:
+            logging.debug("Config unchanged, nothing to write")
+            return changes
+        if transaction:
+            self.node.beginSettingsTransaction()
+        for name in changes.sections:
+            self.node.writeConfig(name)
+        for index in changes.channels:
+            self.node.writeChannel(index)
+        if transaction:
+            self.node.commitSettingsTransaction()
+        logging.info(
+            f"Wrote config sections {changes.sections} and channels {changes.channels} ({len(changes.fields)} fields)"
+        )
+        self.snapshot()
+        return changes
+
 
 class Node:
     """A model of a (local or remote) node in the mesh
@@ -31,9 +146,15 @@ class Node:
         self.nodeNum = nodeNum
         self.localConfig = localonly_pb2.LocalConfig()
         self.moduleConfig = localonly_pb2.LocalModuleConfig()
-        self.channels = None
+        self.channels: Optional[List] = None
         self._timeout = Timeout(maxSecs=timeout)
         self.partialChannels: Optional[List] = None
+        # the ACK/NAK state of our requests to this node, so waits for different nodes do not see each other's answers
+        self._acknowledgment: Acknowledgment = Acknowledgment()
+        self._channelWindow: int = 1  # how many channel requests we keep in flight, see requestChannels()
+        self._channelRequests: Dict[int, int] = {}  # outstanding channel requests, request id -> channel index
+        self._channelAttempts: Dict[int, int] = collections.Counter()  # channel index -> requests sent
+        self._channelRetries: int = 1  # see requestChannels()
         self.noProto = noProto
         self.cannedPluginMessage = None
         self.cannedPluginMessageMessages = None
@@ -86,14 +207,44 @@ class Node:
         self.channels = channels
         self._fixupChannels()
 
-    def requestChannels(self, startingIndex: int = 0):
-        """Send regular MeshPackets to ask channels."""
+    def requestChannels(self, startingIndex: int = 0, window: int = 1, retries: int = 1):
+        """Send regular MeshPackets to ask channels.
+
+        With a window of 1 the channels are requested one after the other. With a larger window up to
+        that many requests are kept in flight at once, which is much faster over multi-hop links. Calling
+        it again with a startingIndex other than 0 then only re-requests the channels still missing.
+        While pipelining, a channel whose request is only ACKed is requested again up to retries times,
+        after that we give up waiting (see waitForConfig).
+        """
         logging.debug(f"requestChannels for nodeNum:{self.nodeNum}")
         # only initialize if we're starting out fresh
         if startingIndex == 0:
             self.channels = None
             self.partialChannels = []  # We keep our channels in a temp array until finished
-        self._requestChannel(startingIndex)
+        self._channelWindow = window
+        if window <= 1:
+            self._requestChannel(startingIndex)
+        else:
+            # forget requests from an earlier attempt, their responses are still used if they turn up
+            self._channelRequests = {}
+            self._channelAttempts = collections.Counter()
+            self._channelRetries = retries
+            self._fillChannelWindow()
+
+    def _fillChannelWindow(self):
+        """Request missing channels until there are _channelWindow requests in flight"""
+        have = {c.index for c in self.partialChannels or []}
+        inFlight = set(self._channelRequests.values())
+        missing = [
+            i
+            for i in range(8)
+            if i not in have and i not in inFlight and self._channelAttempts[i] <= self._channelRetries
+        ]
+        for index in missing[: max(0, self._channelWindow - len(self._channelRequests))]:
+            self._channelAttempts[index] += 1
+            p = self._requestChannel(index)
+            if p is not None:
+                self._channelRequests[p.id] = index
 
     def onResponseRequestSettings(self, p):
         """Handle the response packets for requesting settings _requestSettings()"""
@@ -102,9 +253,9 @@ class Node:
         if "routing" in p["decoded"]:
             if p["decoded"]["routing"]["errorReason"] != "NONE":
                 print(f'Error on response: {p["decoded"]["routing"]["errorReason"]}')
-                self.iface._acknowledgment.receivedNak = True
+                self._receivedAckNak("receivedNak")
         else:
-            self.iface._acknowledgment.receivedAck = True
+            self._receivedAckNak("receivedAck")
             print("")
             adminMessage = p["decoded"]["admin"]
             if "getConfigResponse" in adminMessage:
@@ -152,9 +303,108 @@ class Node:
             else:
                 p.get_module_config_request = msgIndex
 
+        self._acknowledgment.reset()
         self._sendAdmin(p, wantResponse=True, onResponse=onResponse)
         if onResponse:
-            self.iface.waitForAckNak()
+            self.iface.waitForAckNak(self._acknowledgment)
+
+    def configSections(self) -> List[Tuple[str, bool, int]]:
+        """Return (name, isModuleConfig, config type) for each section of localConfig and moduleConfig
+        we can request from a node"""
+        sections: List[Tuple[str, bool, int]] = []
+        for field in self.localConfig.DESCRIPTOR.fields:
+            name = f"{field.name.upper()}_CONFIG"
+            if field.message_type is not None and name in admin_pb2.AdminMessage.ConfigType.keys():
+                sections.append((field.name, False, admin_pb2.AdminMessage.ConfigType.Value(name)))
+        for field in self.moduleConfig.DESCRIPTOR.fields:
+            name = MODULE_CONFIG_TYPE_NAMES.get(field.name, f"{field.name.replace('_', '').upper()}_CONFIG")
+            if field.message_type is not None and name in admin_pb2.AdminMessage.ModuleConfigType.keys():
+                sections.append((field.name, True, admin_pb2.AdminMessage.ModuleConfigType.Value(name)))
+        return sections
+
+    def fetchAllConfig(
+        self,
+        window: int = 4,
+        timeout: Optional[float] = None,
+        retries: int = 1,
+        sections: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """Request every config and module config section (or just the named sections), keeping up to window
+        requests in flight at once, and fill localConfig and moduleConfig with the answers.
+
+        A section whose request is NAKed is requested again up to retries times. We give up on what is
+        still outstanding when nothing has arrived for timeout seconds (the node's timeout by default).
+        Returns the names of the sections we did not get (e.g. ["lora", "mqtt"]), empty if we got them all.
+        """
+        if timeout is None:
+            timeout = self._timeout.expireTimeout
+        todo = collections.deque(self.configSections())
+        if sections is not None:
+            wanted = set(sections)
+            todo = collections.deque(section for section in todo if section[0] in wanted)
+        inFlight: Dict[int, Tuple[str, bool, int]] = {}  # request id -> section
+        attempts: Dict[str, int] = collections.Counter()
+        failed: List[str] = []
+        lock = threading.Lock()
+        progress = [time.time()]  # when we last heard something
+
+        def onResponse(p):
+            decoded = p["decoded"]
+            with lock:
+                section = inFlight.pop(decoded.get("requestId"), None)
+                if section is None:
+                    return  # we have given up on this one
+                progress[0] = time.time()
+                routing = decoded.get("routing")
+                if routing is not None:
+                    logging.warning(f"Request for {section[0]} config failed: {routing.get('errorReason')}")
+                    if attempts[section[0]] <= retries:
+                        todo.append(section)
+                    else:
+                        failed.append(section[0])
+                    return
+                admin = decoded["admin"]["raw"]
+                if section[1]:
+                    resp = admin.get_module_config_response
+                    target = self.moduleConfig
+                else:
+                    resp = admin.get_config_response
+                    target = self.localConfig
+                name = resp.WhichOneof("payload_variant")
+                if name != section[0]:
+                    logging.warning(f"Unexpected answer to the request for {section[0]} config: {name}")
+                    failed.append(section[0])
+                    return
+                getattr(target, name).CopyFrom(getattr(resp, name))
+                logging.debug(f"Received {name} config")
+
+        while True:
+            with lock:
+                while todo and len(inFlight) < window:
+                    name, isModule, configType = section = todo.popleft()
+                    attempts[name] += 1
+                    req = admin_pb2.AdminMessage()
+                    if isModule:
+                        req.get_module_config_request = configType  # type: ignore[assignment]
+                    else:
+                        req.get_config_request = configType  # type: ignore[assignment]
+                    packet = self._sendAdmin(req, wantResponse=True, onResponse=onResponse)
+                    if packet is None:
+                        failed.append(name)
+                    else:
+                        inFlight[packet.id] = section
+                if not inFlight and not todo:
+                    break
+                if time.time() - progress[0] > timeout:
+                    failed.extend(section[0] for section in inFlight.values())
+                    failed.extend(section[0] for section in todo)
+                    inFlight.clear()
+                    break
+            time.sleep(self._timeout.sleepInterval)
+
+        if failed:
+            logging.warning(f"Could not fetch config sections: {', '.join(failed)}")
+        return failed
 
     def turnOffEncryptionOnPrimaryChannel(self):
         """Turn off encryption on primary channel."""
@@ -231,6 +481,10 @@ class Node:
             onResponse = self.onAckNak
         self._sendAdmin(p, onResponse=onResponse)
 
+    def configSession(self) -> ConfigSession:
+        """Snapshot the current config, see ConfigSession"""
+        return ConfigSession(self)
+
     def writeChannel(self, channelIndex, adminIndex=0):
         """Write the current (edited) channel to the device"""
         self.ensureSessionKey()
@@ -663,10 +917,11 @@ class Node:
         p.get_device_metadata_request = True
         logging.info(f"Requesting device metadata")
 
+        self._acknowledgment.reset()
         self._sendAdmin(
             p, wantResponse=True, onResponse=self.onRequestGetMetadata
         )
-        self.iface.waitForAckNak()
+        self.iface.waitForAckNak(self._acknowledgment)
 
     def factoryReset(self, full: bool = False):
         """Tell the node to factory reset."""
@@ -874,9 +1129,9 @@ class Node:
         if "routing" in p["decoded"]:
             if p["decoded"]["routing"]["errorReason"] != "NONE":
                 print(f'Error on response: {p["decoded"]["routing"]["errorReason"]}')
-                self.iface._acknowledgment.receivedNak = True
+                self._receivedAckNak("receivedNak")
         else:
-            self.iface._acknowledgment.receivedAck = True
+            self._receivedAckNak("receivedAck")
             if p["decoded"]["portnum"] == portnums_pb2.PortNum.Name(
                 portnums_pb2.PortNum.ROUTING_APP
             ):
@@ -909,6 +1164,17 @@ class Node:
                 )
                 self._timeout.expireTime = time.time()  # Do not wait any longer
                 return  # Don't try to parse this routing message
+            if self._channelWindow > 1:
+                index = self._channelRequests.pop(p["decoded"].get("requestId"), None)
+                if index is None:
+                    return  # not a request we are still waiting for
+                if self._channelAttempts[index] > self._channelRetries:
+                    logging.warning(f"Channel {index} was not sent after {self._channelAttempts[index]} requests")
+                    self._timeout.expireTime = time.time()  # Do not wait any longer
+                    return
+                logging.debug(f"Retrying missing channel requests.")
+                self._fillChannelWindow()
+                return
             lastTried = 0
             if len(self.partialChannels) > 0:
                 lastTried = self.partialChannels[-1].index
@@ -917,6 +1183,9 @@ class Node:
             return
 
         c = p["decoded"]["admin"]["raw"].get_channel_response
+        if self._channelWindow > 1:
+            self._onPipelinedChannel(p["decoded"].get("requestId"), c)
+            return
         self.partialChannels.append(c)
         self._timeout.reset()  # We made forward progress
         logging.debug(f"Received channel {stripnl(c)}")
@@ -930,22 +1199,50 @@ class Node:
         else:
             self._requestChannel(index + 1)
 
+    def _onPipelinedChannel(self, requestId: Optional[int], c: channel_pb2.Channel):
+        """Handle a channel received while pipelining requests, channels can arrive in any order"""
+        # the request tells us which index this is, the index is left out of the protobuf for channel 0
+        index = self._channelRequests.pop(requestId, c.index) if requestId is not None else c.index
+        if self.partialChannels is None or self.channels is not None:
+            return  # a late answer to a request from a download that has finished
+        if index in [ch.index for ch in self.partialChannels]:
+            logging.debug(f"Ignoring duplicate channel {index}")
+        else:
+            c.index = index
+            self.partialChannels.append(c)
+            self.partialChannels.sort(key=lambda ch: ch.index)
+            self._timeout.reset()  # We made forward progress
+            logging.debug(f"Received channel {stripnl(c)}")
+
+        if len(self.partialChannels) >= 8:
+            logging.debug("Finished downloading channels")
+            self._channelRequests = {}
+            self.channels = self.partialChannels
+            self._fixupChannels()
+        else:
+            self._fillChannelWindow()
+
+    def _receivedAckNak(self, attr: str) -> None:
+        """Record an ACK/NAK from this node, for waits on this node and on the interface"""
+        setattr(self._acknowledgment, attr, True)
+        setattr(self.iface._acknowledgment, attr, True)
+
     def onAckNak(self, p):
         """Informative handler for ACK/NAK responses"""
         if p["decoded"]["routing"]["errorReason"] != "NONE":
             print(
                 f'Received a NAK, error reason: {p["decoded"]["routing"]["errorReason"]}'
             )
-            self.iface._acknowledgment.receivedNak = True
+            self._receivedAckNak("receivedNak")
         else:
             if int(p["from"]) == self.iface.localNode.nodeNum:
                 print(
                     f"Received an implicit ACK. Packet will likely arrive, but cannot be guaranteed."
                 )
-                self.iface._acknowledgment.receivedImplAck = True
+                self._receivedAckNak("receivedImplAck")
             else:
                 print(f"Received an ACK.")
-                self.iface._acknowledgment.receivedAck = True
+                self._receivedAckNak("receivedAck")
 
     def _requestChannel(self, channelNum: int):
         """Done with initial config messages, now send regular
@@ -992,8 +1289,9 @@ class Node:
                 nodeid = self.nodeNum
             else: # assume string starting with !
                 nodeid = int(self.nodeNum[1:],16)
-            if "adminSessionPassKey" in self.iface._getOrCreateByNum(nodeid):
-                p.session_passkey = self.iface._getOrCreateByNum(nodeid).get("adminSessionPassKey")
+            passkey = self.iface.sessionKeys.get(nodeid)
+            if passkey is not None:
+                p.session_passkey = passkey
             return self.iface.sendData(
                 p,
                 self.nodeNum,
@@ -1006,7 +1304,7 @@ class Node:
             )
 
     def ensureSessionKey(self):
-        """If our entry in iface.nodesByNum doesn't already have an adminSessionPassKey, make a request to get one"""
+        """If we have no admin session passkey for the node (or it is about to expire), make a request to get one"""
         if self.noProto:
             logging.warning(
                 f"Not ensuring session key, because protocol use is disabled by noProto"
@@ -1016,5 +1314,5 @@ class Node:
                 nodeid = self.nodeNum
             else: # assume string starting with !
                 nodeid = int(self.nodeNum[1:],16)
-            if self.iface._getOrCreateByNum(nodeid).get("adminSessionPassKey") is None:
+            if self.iface.sessionKeys.needsRefresh(nodeid):
                 self.requestConfig(admin_pb2.AdminMessage.SESSIONKEY_CONFIG)
@@ -0,0 +1,543 @@
+"""Node database class
+"""
+
+import bisect
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from meshtastic.protobuf import mesh_pb2
+from meshtastic.spatial import SpatialIndex
+
+SNAPSHOT_MAGIC = b"MTNDB\x01"
+"""Header of node DB snapshot files, the last byte is the format version"""
+
+UNTRACKED_KEYS = frozenset(("lastReceived", "raw"))
+"""NodeInfo keys (at any level) that we never report in change records, they hold whole packets/protobufs"""
+
+SECRET_KEYS = frozenset(("adminSessionPassKey",))
+"""NodeInfo keys (at any level) that we never report in change records, they hold secrets"""
+
+PACKET_SUMMARY_KEYS = ("id", "from", "to", "channel", "rxTime", "rxSnr", "rxRssi", "hopLimit", "hopStart", "viaMqtt")
+"""The MeshPacket fields kept by summarizePacket()"""
+
+
+def summarizePacket(asDict: Dict) -> Dict:
+    """Return a small copy of a received packet dictionary, without the payload, decoded protobufs or raw packet"""
+    summary = {key: asDict[key] for key in PACKET_SUMMARY_KEYS if key in asDict}
+    decoded = asDict.get("decoded")
+    if isinstance(decoded, dict) and "portnum" in decoded:
+        summary["portnum"] = decoded["portnum"]
+    return summary
+
+
+class NodeChange(NamedTuple):
+    """A set of changes to one node in the DB"""
+
+    #: The node number
+    num: int
+    #: The changed fields, keyed by dotted path (e.g. "position.latitude"), with their (old, new) values.
+    #: A value is None if the field did not exist before (or does not any more).
+    changes: Dict[str, Tuple[Any, Any]]
+
+
+def diffNodeInfo(old: Dict, new: Dict, prefix: str = "", out: Optional[Dict] = None) -> Dict[str, Tuple[Any, Any]]:
+    """Compare two (nested) NodeInfo dictionaries, returns the changed leaf values keyed by dotted path"""
+    if out is None:
+        out = {}
+    for key in old.keys() | new.keys():
+        if key in UNTRACKED_KEYS or key in SECRET_KEYS:
+            continue
+        o = old.get(key)
+        n = new.get(key)
+        path = prefix + key
+        if isinstance(o, dict) and isinstance(n, dict):
+            diffNodeInfo(o, n, path + ".", out)
+        elif isinstance(o, dict) or isinstance(n, dict):
+            # a whole sub-dictionary appeared or went away, report its leaves
+            diffNodeInfo(o if isinstance(o, dict) else {}, n if isinstance(n, dict) else {}, path + ".", out)
+        elif o != n:
+            out[path] = (o, n)
+    return out
+
+
+class NodeChangeCoalescer:
+    """Folds bursts of changes to the same node into one NodeChange.
+
+    The first change starts a window of `window` seconds, at the end of which one NodeChange per
+    changed node is passed to publish (keeping the oldest old value and newest new value of each field).
+    With a window of 0, changes are passed on immediately.
+    """
+
+    def __init__(self, publish: Callable[[NodeChange], None], window: float = 0.5) -> None:
+        self.window = window
+        self._publish = publish
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Dict[str, Tuple[Any, Any]]] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, num: int, changes: Dict[str, Tuple[Any, Any]]) -> None:
+        """Queue the changes to a node"""
+        if self.window <= 0:
+            self._publish(NodeChange(num, changes))
+            return
+        with self._lock:
+            pending = self._pending.setdefault(num, {})
+            for path, (old, new) in changes.items():
+                if path in pending:
+                    old = pending[path][0]
+                pending[path] = (old, new)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        """Publish everything queued so far"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+        for num, changes in pending.items():
+            # a field may have changed back to where it was during the window
+            changes = {path: v for path, v in changes.items() if v[0] != v[1]}
+            if changes:
+                self._publish(NodeChange(num, changes))
+
+
+class NodeRecord:
+    """The indexed bookkeeping for one node in the DB.
+
+    info is the NodeInfo dictionary handed out to clients, the other slots are the
+    values it is currently indexed under. Only this bookkeeping is slotted: the NodeInfo itself stays the
+    MessageToDict dictionary, as clients read and edit it in place through iface.nodes.
+    """
+
+    __slots__ = ("num", "nodeId", "shortName", "lastHeard", "info")
+
+    def __init__(self, num: int, info: Any) -> None:
+        self.num: int = num
+        self.nodeId: Optional[str] = None
+        self.shortName: Optional[str] = None
+        self.lastHeard: Optional[int] = None
+        self.info: Any = info
+
+    def __repr__(self):
+        return f"NodeRecord(0x{self.num:08x}, nodeId={self.nodeId!r}, lastHeard={self.lastHeard!r})"
+
+
+class NodeMapView(Mapping):
+    """A read-only mapping from one of the NodeDB indexes to NodeInfo dictionaries"""
+
+    def __init__(self, db: "NodeDB", index: Dict) -> None:
+        self._db = db
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._index[key].info
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self) -> Iterator:
+        # iterate over a snapshot so the reader thread can keep updating the DB underneath us
+        with self._db._lock:
+            keys = list(self._index)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class NodeDB:
+    """The set of nodes known to an interface, indexed by node number, user ID, short name, lastHeard and position.
+
+    All updates go through the methods of this class (which hold a lock and keep the indexes consistent),
+    clients normally only see the read-only `byNum` and `byId` views. If set, onChange(num, changes) is
+    called (with the lock held) for every update() that changed something, see diffNodeInfo(), and
+    onRemove(num) for every node dropped from the DB (removed, evicted or expired).
+
+    The DB can be bounded: with maxNodes set, adding a node evicts the least recently updated one, with
+    maxAge set, nodes not heard from in that many seconds are dropped. Nodes in `keep` (our own node)
+    and favorites are never evicted. Updates to lastHeard check for expired nodes at most once every
+    expireInterval seconds, call expire() to check right away.
+    """
+
+    def __init__(self, maxNodes: Optional[int] = None, maxAge: Optional[float] = None) -> None:
+        self.onChange: Optional[Callable[[int, Dict[str, Tuple[Any, Any]]], None]] = None
+        self.onRemove: Optional[Callable[[int], None]] = None
+        self.maxNodes: Optional[int] = maxNodes
+        self.maxAge: Optional[float] = maxAge
+        self.expireInterval: float = 60.0  # seconds between the expire() runs done by update()
+        self._lastExpire: Optional[float] = None  # time.monotonic() of the last expire() run
+        self.keep: Set[int] = set()  # node numbers never evicted
+        self.evictions: int = 0  # number of nodes dropped because of maxNodes/maxAge
+        self._lock = threading.RLock()
+        self._byNum: Dict[int, NodeRecord] = {}
+        self._byId: Dict[str, NodeRecord] = {}
+        self._byShortName: Dict[str, Set[int]] = {}
+        self._heardOrder: List[Tuple[int, int]] = []  # sorted (lastHeard, num) pairs
+        self._recent: "OrderedDict[int, None]" = OrderedDict()  # node numbers, least recently updated first
+        self.spatial: SpatialIndex = SpatialIndex()  # node positions, for proximity/bounding box queries
+        self.byNum: NodeMapView = NodeMapView(self, self._byNum)
+        self.byId: NodeMapView = NodeMapView(self, self._byId)
+
+    @staticmethod
+    def fromNumMap(nodesByNum: Dict) -> "NodeDB":
+        """Build a DB from a dictionary of NodeInfo keyed by node number"""
+        db = NodeDB()
+        for num, info in nodesByNum.items():
+            db._insert(num, info)
+        return db
+
+    @staticmethod
+    def fromIdMap(nodesById: Dict) -> "NodeDB":
+        """Build a DB from a dictionary of NodeInfo keyed by node ID"""
+        db = NodeDB()
+        for nodeId, info in nodesById.items():
+            num = info.get("num") if isinstance(info, dict) else None
+            if num is None:
+                try:
+                    num = int(nodeId[-8:], 16)
+                except ValueError:
+                    logging.debug(f"Can not find a node number for {nodeId}, skipping")
+                    continue
+            db._insert(num, info)
+            # keep the caller's key even if the record does not (yet) say so
+            db._setId(db._byNum[num], nodeId)
+        return db
+
+    def __len__(self) -> int:
+        return len(self._byNum)
+
+    def __contains__(self, num) -> bool:
+        return num in self._byNum
+
+    def get(self, num: int) -> Optional[Dict]:
+        """Return the NodeInfo for a node number, or None"""
+        rec = self._byNum.get(num)
+        return rec.info if rec is not None else None
+
+    def getById(self, nodeId: str) -> Optional[Dict]:
+        """Return the NodeInfo for a node ID (e.g. !9388f81c), or None"""
+        rec = self._byId.get(nodeId)
+        return rec.info if rec is not None else None
+
+    def getByShortName(self, shortName: str) -> List[Dict]:
+        """Return all nodes using a short name (short names are not unique)"""
+        with self._lock:
+            return [self._byNum[num].info for num in self._byShortName.get(shortName, ())]
+
+    def getOrCreate(self, num: int) -> Dict:
+        """Given a nodenum find the NodeInfo in the DB (or create a minimal entry if necessary)"""
+        with self._lock:
+            rec = self._byNum.get(num)
+            if rec is None:
+                presumptive_id = f"!{num:08x}"
+                info = {
+                    "num": num,
+                    "user": {
+                        "id": presumptive_id,
+                        "longName": f"Meshtastic {presumptive_id[-4:]}",
+                        "shortName": f"{presumptive_id[-4:]}",
+                        "hwModel": "UNSET",
+                    },
+                }
+                # placeholders are only findable by number until we hear a real User for them
+                rec = NodeRecord(num, info)
+                self._byNum[num] = rec
+                self._recent[num] = None
+                if self.maxNodes is not None and len(self._byNum) > self.maxNodes:
+                    self._evictOldest(num)
+            return rec.info
+
+    def update(self, num: int, fields: Dict) -> Dict:
+        """Merge fields into the top level of a node's NodeInfo (creating it as needed) and reindex it.
+
+        Values replace the current ones, so pass new sub-dictionaries rather than ones from the
+        NodeInfo modified in place (or the change can not be seen).
+        Returns the updated NodeInfo
+        """
+        with self._lock:
+            info = self.getOrCreate(num)
+            changes = None
+            if self.onChange is not None:
+                changes = diffNodeInfo({key: info[key] for key in fields if key in info}, fields)
+            info.update(fields)
+            self._reindex(self._byNum[num], "user" in fields)
+            self._recent.move_to_end(num)
+            if changes:
+                self.onChange(num, changes)  # type: ignore[misc]
+            if self.maxAge is not None and "lastHeard" in fields and (
+                self._lastExpire is None or time.monotonic() - self._lastExpire >= self.expireInterval
+            ):
+                self.expire(exclude=num)
+            return info
+
+    def reindex(self, num: int) -> None:
+        """Refresh the indexes of a node whose NodeInfo was changed in place"""
+        with self._lock:
+            rec = self._byNum.get(num)
+            if rec is not None:
+                self._reindex(rec, rec.nodeId is not None)
+
+    def remove(self, num: int) -> Optional[Dict]:
+        """Drop a node from the DB, returns its NodeInfo (or None if it was unknown)"""
+        with self._lock:
+            rec = self._byNum.pop(num, None)
+            if rec is None:
+                return None
+            self._recent.pop(num, None)
+            self._setId(rec, None)
+            self._setShortName(rec, None)
+            self._setLastHeard(rec, None)
+            self.spatial.remove(num)
+            if self.onRemove is not None:
+                self.onRemove(num)
+            return rec.info
+
+    def clear(self) -> None:
+        """Forget all nodes"""
+        with self._lock:
+            if self.onRemove is not None:
+                for num in list(self._byNum):
+                    self.onRemove(num)
+            self._byNum.clear()
+            self._byId.clear()
+            self._byShortName.clear()
+            self._heardOrder.clear()
+            self._recent.clear()
+            self.spatial.clear()
+
+    def isProtected(self, num: int) -> bool:
+        """True if a node is never evicted (it is in keep or a favorite)"""
+        if num in self.keep:
+            return True
+        info = self.get(num)
+        return isinstance(info, dict) and bool(info.get("isFavorite"))
+
+    def expire(self, now: Optional[float] = None, exclude: Optional[int] = None) -> List[int]:
+        """Drop the nodes (other than exclude) not heard from in maxAge seconds, returns their numbers"""
+        if self.maxAge is None:
+            return []
+        cutoff = (time.time() if now is None else now) - self.maxAge
+        with self._lock:
+            self._lastExpire = time.monotonic()
+            if not self._heardOrder or self._heardOrder[0][0] >= cutoff:
+                return []
+            victims = []
+            for lastHeard, num in self._heardOrder:
+                if lastHeard >= cutoff:
+                    break
+                if num != exclude and not self.isProtected(num):
+                    victims.append(num)
+            for num in victims:
+                self.remove(num)
+            self.evictions += len(victims)
+            if victims:
+                logging.debug(f"Expired {len(victims)} nodes not heard from in {self.maxAge}s")
+            return victims
+
+    def nodesByLastHeard(self, limit: Optional[int] = None) -> List[Dict]:
+        """Return NodeInfos, most recently heard first. Nodes we have never heard from come last."""
+        with self._lock:
+            heard = [self._byNum[num].info for _, num in reversed(self._heardOrder)]
+            if limit is not None and len(heard) >= limit:
+                return heard[:limit]
+            heard.extend(rec.info for rec in self._byNum.values() if rec.lastHeard is None)
+            return heard if limit is None else heard[:limit]
+
+    def _insert(self, num: int, info: Any) -> None:
+        rec = NodeRecord(num, info)
+        self._byNum[num] = rec
+        self._recent[num] = None
+        self._reindex(rec, True)
+
+    def _evictOldest(self, exclude: int) -> None:
+        """Remove least recently updated nodes until we are back at maxNodes"""
+        skipped = []
+        while len(self._byNum) > self.maxNodes:  # type: ignore[operator]
+            victim = None
+            for num in self._recent:
+                if num == exclude or self.isProtected(num):
+                    skipped.append(num)
+                else:
+                    victim = num
+                    break
+            # move what we skipped out of the way, so we do not look at it again for every eviction
+            for num in skipped:
+                self._recent.move_to_end(num)
+            skipped.clear()
+            if victim is None:
+                break  # everything left is protected
+            self.remove(victim)
+            self.evictions += 1
+
+    def _reindex(self, rec: NodeRecord, indexId: bool) -> None:
+        info = rec.info
+        if not isinstance(info, dict):
+            return  # not a NodeInfo dictionary, we can only find it by number
+        user = info.get("user")
+        if not isinstance(user, dict):
+            user = {}
+        if indexId:
+            self._setId(rec, user.get("id"))
+        self._setShortName(rec, user.get("shortName"))
+        self._setLastHeard(rec, info.get("lastHeard"))
+        position = info.get("position")
+        lat = lon = None
+        if isinstance(position, dict):
+            lat = position.get("latitude")
+            lon = position.get("longitude")
+        if lat is not None and lon is not None:
+            self.spatial.update(rec.num, lat, lon)
+        else:
+            self.spatial.remove(rec.num)
+
+    def _setId(self, rec: NodeRecord, nodeId: Optional[str]) -> None:
+        if rec.nodeId == nodeId:
+            return
+        if rec.nodeId is not None and self._byId.get(rec.nodeId) is rec:
+            del self._byId[rec.nodeId]
+        rec.nodeId = nodeId
+        if nodeId is not None:
+            self._byId[nodeId] = rec
+
+    def _setShortName(self, rec: NodeRecord, shortName: Optional[str]) -> None:
+        if rec.shortName == shortName:
+            return
+        if rec.shortName is not None:
+            nums = self._byShortName.get(rec.shortName)
+            if nums is not None:
+                nums.discard(rec.num)
+                if not nums:
+                    del self._byShortName[rec.shortName]
+        rec.shortName = shortName
+        if shortName is not None:
+            self._byShortName.setdefault(shortName, set()).add(rec.num)
+
+    def _setLastHeard(self, rec: NodeRecord, lastHeard: Optional[int]) -> None:
+        if rec.lastHeard == lastHeard:
+            return
+        if rec.lastHeard is not None:
+            key = (rec.lastHeard, rec.num)
+            i = bisect.bisect_left(self._heardOrder, key)
+            if i < len(self._heardOrder) and self._heardOrder[i] == key:
+                del self._heardOrder[i]
+        rec.lastHeard = lastHeard
+        if lastHeard is not None:
+            bisect.insort(self._heardOrder, (lastHeard, rec.num))
+
+
+SESSION_KEY_LIFETIME = 300
+"""Seconds a node accepts an admin session passkey for, counted from when it handed it out"""
+
+SESSION_KEY_REFRESH_MARGIN = 60
+"""Get a new passkey when the one we have is this close to expiring"""
+
+
+class SessionKeyCache:
+    """The admin session passkeys remote nodes gave us, and when we got them.
+
+    Nodes include their current passkey in every admin response and only change it once it is a while old,
+    so seeing the same key again does not make it any younger. Kept separately from the node DB, so the
+    keys survive reconnects (which start a new node DB).
+    """
+
+    def __init__(self, lifetime: float = SESSION_KEY_LIFETIME, margin: float = SESSION_KEY_REFRESH_MARGIN) -> None:
+        self.lifetime = lifetime
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._keys: Dict[int, Tuple[bytes, float]] = {}  # node number -> (passkey, when we first saw it)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def put(self, num: int, key: bytes, now: Optional[float] = None) -> None:
+        """Remember a passkey a node sent us (empty keys are ignored)"""
+        if not key:
+            return
+        with self._lock:
+            old = self._keys.get(num)
+            if old is None or old[0] != key:
+                self._keys[num] = (key, time.time() if now is None else now)
+
+    def get(self, num: int, now: Optional[float] = None) -> Optional[bytes]:
+        """Return the passkey for a node, or None if we have none that is still valid"""
+        with self._lock:
+            entry = self._keys.get(num)
+            if entry is None:
+                return None
+            if (time.time() if now is None else now) - entry[1] >= self.lifetime:
+                del self._keys[num]
+                return None
+            return entry[0]
+
+    def needsRefresh(self, num: int, now: Optional[float] = None) -> bool:
+        """True if we have no passkey for a node, or it is about to expire"""
+        with self._lock:
+            entry = self._keys.get(num)
+        return entry is None or (time.time() if now is None else now) - entry[1] >= self.lifetime - self.margin
+
+    def remove(self, num: int) -> None:
+        """Forget the passkey of a node"""
+        with self._lock:
+            self._keys.pop(num, None)
+
+    def clear(self) -> None:
+        """Forget all passkeys"""
+        with self._lock:
+            self._keys.clear()
+
+
+def writeSnapshot(path: str, messages: Iterable[mesh_pb2.FromRadio]) -> None:
+    """Atomically write a node DB snapshot file.
+
+    A snapshot is just the FromRadio messages we would have received during the config download,
+    each prefixed by its length as a little endian uint32.
+    """
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        for m in messages:
+            b = m.SerializeToString()
+            f.write(struct.pack("<I", len(b)))
+            f.write(b)
+    os.replace(tmpPath, path)
+
+
+def readSnapshot(path: str) -> List[mesh_pb2.FromRadio]:
+    """Read the FromRadio messages stored in a snapshot file written by writeSnapshot()
+
+    Raises ValueError if the file is not a (complete) snapshot.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise ValueError(f"{path} is not a node DB snapshot")
+
+    messages = []
+    offset = len(SNAPSHOT_MAGIC)
+    while offset < len(data):
+        if offset + 4 > len(data):
+            raise ValueError(f"{path} is truncated")
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if offset + length > len(data):
+            raise ValueError(f"{path} is truncated")
+        m = mesh_pb2.FromRadio()
+        m.ParseFromString(data[offset : offset + length])
+        messages.append(m)
+        offset += length
+    return messages
@@ -0,0 +1,246 @@
+"""Tabular views of the node DB (used by showNodes and --nodes)
+"""
+
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_FIELDS = [
+    "user.longName", "user.id", "user.shortName", "user.hwModel", "user.publicKey", "user.role",
+    "position.latitude", "position.longitude", "position.altitude", "deviceMetrics.batteryLevel",
+    "deviceMetrics.channelUtilization", "deviceMetrics.airUtilTx", "snr", "hopsAway", "channel",
+    "lastHeard", "since",
+]
+"""The fields shown if none are asked for"""
+
+HEADERS = {
+    "N": "N",
+    "user.longName": "User",
+    "user.id": "ID",
+    "user.shortName": "AKA",
+    "user.hwModel": "Hardware",
+    "user.publicKey": "Pubkey",
+    "user.role": "Role",
+    "position.latitude": "Latitude",
+    "position.longitude": "Longitude",
+    "position.altitude": "Altitude",
+    "deviceMetrics.batteryLevel": "Battery",
+    "deviceMetrics.channelUtilization": "Channel util.",
+    "deviceMetrics.airUtilTx": "Tx air util.",
+    "snr": "SNR",
+    "hopsAway": "Hops",
+    "channel": "Channel",
+    "lastHeard": "LastHeard",
+    "since": "Since",
+}
+"""Human readable column names for the well known fields, other fields use their path"""
+
+FORMATS = ("table", "csv", "jsonl", "arrow")
+"""The output formats NodeTable.write() supports"""
+
+
+def _timeago(delta_secs: int) -> str:
+    """Convert a number of seconds in the past into a short, friendly string
+    e.g. "now", "30 sec ago",  "1 hour ago"
+    Zero or negative intervals simply return "now"
+    """
+    intervals = (
+        ("year", 60 * 60 * 24 * 365),
+        ("month", 60 * 60 * 24 * 30),
+        ("day", 60 * 60 * 24),
+        ("hour", 60 * 60),
+        ("min", 60),
+        ("sec", 1),
+    )
+    for name, interval_duration in intervals:
+        if delta_secs < interval_duration:
+            continue
+        x = delta_secs // interval_duration
+        plur = "s" if x > 1 else ""
+        return f"{x} {name}{plur} ago"
+
+    return "now"
+
+
+def _getter(field: str) -> Callable[[Dict], Any]:
+    """Return a function reading a (possibly dotted) field from a NodeInfo dictionary"""
+    if field == "since":
+        field = "lastHeard"  # the "since" column is synthesized from lastHeard when formatting
+    if "." not in field:
+        return lambda node: node.get(field)
+    keys = field.split(".")
+
+    def get(node: Dict) -> Any:
+        value: Any = node
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    return get
+
+
+def _formatFloat(precision: int, unit: str = "") -> Callable[[Any, Dict], Optional[str]]:
+    return lambda value, node: f"{value:.{precision}f}{unit}" if value else None
+
+
+def _formatBattery(value, _node) -> Optional[str]:
+    return "Powered" if value in (0, 101) else (f"{value:.0f}%" if value else None)
+
+
+def _formatLastHeard(value, _node) -> Optional[str]:
+    return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def _formatSince(value, _node) -> Optional[str]:
+    if value is None:
+        return "N/A"
+    delta_secs = int(time.time() - value)
+    if delta_secs < 0:
+        return "N/A"  # not handling a timestamp from the future
+    return _timeago(delta_secs)
+
+
+FORMATTERS: Dict[str, Callable[[Any, Dict], Any]] = {
+    "channel": lambda value, node: "0" if value is None else value,
+    "deviceMetrics.channelUtilization": _formatFloat(2, "%"),
+    "deviceMetrics.airUtilTx": _formatFloat(2, "%"),
+    "deviceMetrics.batteryLevel": _formatBattery,
+    "lastHeard": _formatLastHeard,
+    "position.latitude": _formatFloat(4, "°"),
+    "position.longitude": _formatFloat(4, "°"),
+    "position.altitude": _formatFloat(0, "m"),
+    "since": _formatSince,
+    "snr": _formatFloat(0, " dB"),
+    "user.shortName": lambda value, node: value if value is not None else f"Meshtastic {node['num'] & 0xFFFF:04x}",
+    "user.id": lambda value, node: value if value is not None else f"!{node['num']:08x}",
+}
+"""How the table format shows the well known fields, other fields are shown as they are"""
+
+
+class NodeTable:
+    """Builds a table of selected fields of the nodes in the node DB.
+
+    The accessors (and formatters) for the fields are worked out once, when the table is created. Rows are
+    selected with where/sortField/offset/limit and can be rendered as a text table, CSV, JSON lines or Arrow.
+    Except for the text table, output is streamed a row at a time. Only the text table formats the values,
+    the other formats keep them as they are in the node DB (which is easier on scripts).
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None) -> None:
+        """Constructor
+
+        fields (List[str]): The fields to show, dotted paths into the NodeInfo (e.g. "position.altitude").
+            "since" shows how long ago lastHeard was. The row number "N" is always shown first.
+        """
+        self.fields: List[str] = [f for f in (fields or DEFAULT_FIELDS) if f != "N"]
+        self.headers: List[str] = ["N"] + [HEADERS.get(f, f) for f in self.fields]
+        self._getters = [_getter(f) for f in self.fields]
+        self._formatters = [FORMATTERS.get(f) for f in self.fields]
+
+    def select(
+        self,
+        nodes: Iterable[Dict],
+        *,
+        where: Optional[Callable[[Dict], bool]] = None,
+        sortField: Optional[str] = "lastHeard",
+        reverse: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Return the nodes to show, in order.
+
+        where: only nodes for which this returns True
+        sortField: a (dotted) field to sort by (default most recently heard first), nodes without it come last.
+            None keeps the order of nodes.
+        offset/limit: the page of the result to return
+        """
+        selected = [n for n in nodes if where(n)] if where is not None else list(nodes)
+        if sortField is not None:
+            get = _getter(sortField)
+            keyed = [(get(n), n) for n in selected]
+            present = [kn for kn in keyed if kn[0] is not None]
+            missing = [n for k, n in keyed if k is None]
+            try:
+                present.sort(key=lambda kn: kn[0], reverse=reverse)
+            except TypeError:
+                present.sort(key=lambda kn: str(kn[0]), reverse=reverse)  # mixed types, fall back to text order
+            selected = [n for _, n in present] + missing
+        end = None if limit is None else offset + limit
+        return selected[offset:end]
+
+    def columns(self, nodes: List[Dict], formatted: bool = False, start: int = 1) -> Dict[str, List[Any]]:
+        """Return the values of each field (keyed by header) for the nodes, plus the row numbers in "N" """
+        cols: Dict[str, List[Any]] = {"N": list(range(start, start + len(nodes)))}
+        for header, get, fmt in zip(self.headers[1:], self._getters, self._formatters):
+            values = [get(n) for n in nodes]
+            if formatted and fmt is not None:
+                values = [fmt(v, n) for v, n in zip(values, nodes)]
+            cols[header] = values
+        return cols
+
+    def rows(self, nodes: Iterable[Dict], formatted: bool = False, start: int = 1) -> Iterator[List[Any]]:
+        """Yield a list of values per node (row number first), one node at a time"""
+        pairs = list(zip(self._getters, self._formatters))
+        for i, n in enumerate(nodes, start):
+            row: List[Any] = [i]
+            for get, fmt in pairs:
+                v = get(n)
+                row.append(fmt(v, n) if formatted and fmt is not None else v)
+            yield row
+
+    def table(self, nodes: List[Dict], start: int = 1) -> str:
+        """Render nodes as a text table"""
+        from tabulate import tabulate  # pylint: disable=C0415
+
+        return tabulate(
+            self.rows(nodes, formatted=True, start=start),
+            headers=self.headers,
+            missingval="N/A",
+            tablefmt="fancy_grid",
+        )
+
+    def toArrow(self, nodes: List[Dict], start: int = 1):
+        """Return the nodes as a pyarrow.Table"""
+        import pyarrow as pa  # pylint: disable=C0415
+
+        return pa.Table.from_pydict({h: _arrowColumn(pa, v) for h, v in self.columns(nodes, start=start).items()})
+
+    def write(self, out: Any, nodes: List[Dict], fmt: str = "table", start: int = 1) -> None:
+        """Write nodes to out in one of FORMATS (out is a binary stream for arrow, a text stream otherwise)"""
+        if fmt == "table":
+            out.write(self.table(nodes, start) + "\n")
+        elif fmt == "csv":
+            w = csv.writer(out)
+            w.writerow(self.headers)
+            for row in self.rows(nodes, start=start):
+                w.writerow(["" if v is None else v for v in row])
+        elif fmt == "jsonl":
+            for row in self.rows(nodes, start=start):
+                out.write(json.dumps(dict(zip(self.headers, row)), default=str) + "\n")
+        elif fmt == "arrow":
+            import pyarrow as pa  # pylint: disable=C0415
+
+            t = self.toArrow(nodes, start)
+            with pa.ipc.new_stream(out, t.schema) as writer:
+                writer.write_table(t)
+        else:
+            raise ValueError(f"Unknown node table format {fmt}, expected one of {', '.join(FORMATS)}")
+
+    def render(self, nodes: List[Dict], fmt: str = "table", start: int = 1) -> str:
+        """Return nodes rendered in a text format"""
+        buf = io.StringIO()
+        self.write(buf, nodes, fmt, start)
+        return buf.getvalue()
+
+
+def _arrowColumn(pa, values: List[Any]):
+    """Make an Arrow array from the values of one field, falling back to strings if their types are mixed"""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values])
@@ -0,0 +1,117 @@
+"""Writing received packets as JSON lines (meshtastic --listen --format jsonl)
+"""
+
+import base64
+import json
+import threading
+from typing import Any, Dict, List, Optional, TextIO
+
+DROPPED_KEYS = frozenset(("raw",))
+"""Keys holding protobuf objects, which have no JSON form (their contents are in the dictionary anyway)"""
+
+
+def _jsonDefault(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return str(value)
+
+
+class JsonlPacketWriter:
+    """Writes one compact JSON object per packet, buffered.
+
+    Lines are collected in memory and written in one go when bufferSize characters are waiting, or every
+    flushInterval seconds (from a background thread, so a quiet mesh does not leave packets unwritten).
+    """
+
+    def __init__(
+        self,
+        out: TextIO,
+        *,
+        fields: Optional[List[str]] = None,
+        payload: bool = False,
+        flushInterval: float = 1.0,
+        bufferSize: int = 1 << 16,
+    ) -> None:
+        """Constructor
+
+        fields: dotted paths (e.g. "decoded.portnum") to write, keyed by path. All of the packet by default.
+            Selected sub-dictionaries are cleaned like whole packets.
+        payload: also write decoded.payload (base64 encoded), which is left out by default
+        """
+        self.out = out
+        self.fields = [(f, f.split(".")) for f in fields] if fields else None
+        self.payload = payload
+        self.flushInterval = flushInterval
+        self.bufferSize = bufferSize
+        self.count = 0  # packets written so far
+        self._encoder = json.JSONEncoder(separators=(",", ":"), default=_jsonDefault, ensure_ascii=False)
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flushInterval > 0:
+            self._flusher = threading.Thread(target=self._flushPeriodically, name="JsonlFlush", daemon=True)
+            self._flusher.start()
+
+    def _select(self, packet: Dict) -> Dict[str, Any]:
+        result = {}
+        for name, keys in self.fields or ():
+            value: Any = packet
+            for key in keys:
+                if not isinstance(value, dict):
+                    value = None
+                    break
+                value = value.get(key)
+            if value is not None:
+                result[name] = self._clean(value) if isinstance(value, dict) else value
+        return result
+
+    def _clean(self, d: Dict) -> Dict[str, Any]:
+        """Copy a packet dictionary without the protobuf objects (and payload unless wanted)"""
+        result = {}
+        for k, v in d.items():
+            if k in DROPPED_KEYS or (k == "payload" and not self.payload):
+                continue
+            result[k] = self._clean(v) if isinstance(v, dict) else v
+        return result
+
+    def write(self, packet: Dict) -> None:
+        """Add a packet"""
+        line = self._encoder.encode(self._select(packet) if self.fields else self._clean(packet)) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered += len(line)
+            self.count += 1
+            if self._buffered >= self.bufferSize:
+                self._flushLocked()
+
+    def onReceive(self, packet, interface) -> None:  # pylint: disable=W0613
+        """A meshtastic.receive listener"""
+        self.write(packet)
+
+    def _flushLocked(self) -> None:
+        if self._buffer:
+            self.out.write("".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+        self.out.flush()
+
+    def flush(self) -> None:
+        """Write out what is buffered"""
+        with self._lock:
+            self._flushLocked()
+
+    def _flushPeriodically(self) -> None:
+        while not self._closed.wait(self.flushInterval):
+            try:
+                self.flush()
+            except (OSError, ValueError):
+                return  # the output was closed (e.g. the reading end of a pipe went away)
+
+    def close(self) -> None:
+        """Stop the flush thread and write out what is buffered"""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
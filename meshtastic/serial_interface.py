@@ -19,13 +19,15 @@ if platform.system() != "Windows":
 class SerialInterface(StreamInterface):
     """Interface class for meshtastic devices over a serial link"""
 
-    def __init__(self, devPath: Optional[str]=None, debugOut=None, noProto: bool=False, connectNow: bool=True, noNodes: bool=False) -> None:
+    def __init__(self, devPath: Optional[str]=None, debugOut=None, noProto: bool=False, connectNow: bool=True, noNodes: bool=False,
+                 *, snapshotDir: Optional[str]=None) -> None:
         """Constructor, opens a connection to a specified serial port, or if unspecified try to
         find one Meshtastic device by probing
 
         Keyword Arguments:
             devPath {string} -- A filepath to a device, i.e. /dev/ttyUSB0 (default: {None})
             debugOut {stream} -- If a stream is provided, any debug serial output from the device will be emitted to that stream. (default: {None})
+            snapshotDir {string} -- Directory for node DB snapshots, see MeshInterface (default: {None})
         """
         self.noProto = noProto
 
@@ -63,7 +65,7 @@ class SerialInterface(StreamInterface):
         time.sleep(0.1)
 
         StreamInterface.__init__(
-            self, debugOut=debugOut, noProto=noProto, connectNow=connectNow, noNodes=noNodes
+            self, debugOut=debugOut, noProto=noProto, connectNow=connectNow, noNodes=noNodes, snapshotDir=snapshotDir
         )
 
     def __repr__(self):
@@ -74,6 +76,8 @@ class SerialInterface(StreamInterface):
             rep += ", noProto=True"
         if hasattr(self, 'noNodes') and self.noNodes:
             rep += ", noNodes=True"
+        if getattr(self, 'snapshotDir', None) is not None:
+            rep += f", snapshotDir={self.snapshotDir!r}"
         rep += ")"
         return rep
 
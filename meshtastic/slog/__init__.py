@@ -1,3 +1,3 @@
 """Structured logging framework (see dev docs for more info)."""
 
-from .slog import LogSet, root_dir
+from .slog import LogSet, MultiLogSet, root_dir
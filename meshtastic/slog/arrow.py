@@ -1,37 +1,151 @@
 """Utilities for Apache Arrow serialization."""
 
 import logging
+import queue
 import threading
 import os
-from typing import Optional, List
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Union
 
 import pyarrow as pa
-from pyarrow import feather
 
 chunk_size = 1000  # disk writes are batched based on this number of rows
+flush_interval = 1.0  # and rows are written at least this often (in seconds)
+
+
+class WriterThread:
+    """A background thread converting and writing the rows of one or more ArrowWriters.
+
+    Each writer's batches are written in order. Writers that have not handed over their rows for their
+    flush_interval are asked to, so slow trickles of rows still reach the disk.
+    """
+
+    def __init__(self, name: str = "ArrowWriter"):
+        self.writers: List["ArrowWriter"] = []
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._next_flush = time.monotonic() + flush_interval
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, writer: "ArrowWriter") -> None:
+        """Start looking after a writer."""
+        self.writers = self.writers + [writer]  # replaced, not changed, as _run iterates over it
+        self._next_flush = min(self._next_flush, time.monotonic() + writer.flush_interval)
+        self._queue.put(())  # wake up _run to wait for the new _next_flush
+
+    def remove(self, writer: "ArrowWriter") -> None:
+        """Stop looking after a writer, once everything it handed over is written."""
+        done = threading.Event()
+        self._queue.put((writer, done))
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                logging.error(f"{self._thread.name} died, the last rows of {writer.sink} may be lost")
+                break
+        self.writers = [w for w in self.writers if w is not writer]
+
+    def put(self, writer: "ArrowWriter", rows: List[dict]) -> None:
+        """Queue rows to be written by writer."""
+        self._queue.put((writer, rows))
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, self._next_flush - time.monotonic()))
+            except queue.Empty:
+                item = ()
+            now = time.monotonic()
+            if now >= self._next_flush:
+                for writer in self.writers:
+                    try:
+                        writer._hand_off_if_due(now)
+                    except Exception:  # pylint: disable=broad-exception-caught
+                        logging.exception("Error handing off rows")
+                self._next_flush = now + min((w.flush_interval for w in self.writers), default=flush_interval)
+            if item is None:
+                return
+            if item:
+                writer, rows = item
+                if isinstance(rows, threading.Event):
+                    rows.set()
+                else:
+                    try:
+                        writer._write_rows(rows)
+                    except Exception:  # pylint: disable=broad-exception-caught
+                        # keep going (a full disk, a failing on_segment...), or close() would never return
+                        logging.exception(f"Dropping {len(rows)} rows that could not be written")
+
+    def close(self) -> None:
+        """Stop the thread, once everything queued is written."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class WriterPool:
+    """Writer threads shared by many ArrowWriters (e.g. when logging many devices at once)."""
+
+    def __init__(self, threads: int = 2):
+        self.threads = [WriterThread(f"ArrowWriter-{i}") for i in range(threads)]
+        self._next = 0
+
+    def assign(self, writer: "ArrowWriter") -> WriterThread:
+        """Pick the thread to look after writer."""
+        thread = self.threads[self._next % len(self.threads)]
+        self._next += 1
+        thread.add(writer)
+        return thread
+
+    def close(self) -> None:
+        """Stop the threads (close the writers first)."""
+        for thread in self.threads:
+            thread.close()
 
 
 class ArrowWriter:
-    """Writes an arrow file in a streaming fashion"""
+    """Writes an arrow file in a streaming fashion.
+
+    The logging threads only append their rows to a list. Every chunk_size rows (or flush_interval seconds)
+    the list is handed to a background thread (our own, or one from a WriterPool), which converts it to a
+    record batch and writes it, so adding a row never waits for a conversion or the disk.
+    """
 
-    def __init__(self, file_name: str):
+    def __init__(
+        self,
+        file_name: str,
+        flush_interval_secs: Optional[float] = None,
+        pool: Optional[WriterPool] = None,
+    ):
         """Create a new ArrowWriter object.
 
         file_name (str): The name of the file to write to.
+        flush_interval_secs (float): Write rows at least this often (default flush_interval)
+        pool (WriterPool): Share its threads instead of starting one for this writer
         """
         self.sink = pa.OSFile(file_name, "wb")  # type: ignore
         self.new_rows: List[dict] = []
         self.schema: Optional[pa.Schema] = None  # haven't yet learned the schema
-        self.writer: Optional[pa.RecordBatchStreamWriter] = None
-        self._lock = threading.Condition()  # Ensure only one thread writes at a time
+        self.writer: Optional[Union[pa.ipc.RecordBatchStreamWriter, pa.ipc.RecordBatchFileWriter]] = None
+        self.flush_interval = flush_interval if flush_interval_secs is None else flush_interval_secs
+        self.rows_written = 0
+        self._lock = threading.Condition()  # Guards new_rows and the schema
+        self._handed_off = time.monotonic()
+        self._own_thread = pool is None
+        if pool is None:
+            self._thread = WriterThread()
+            self._thread.add(self)
+        else:
+            self._thread = pool.assign(self)
 
     def close(self):
         """Close the stream and writes the file as needed."""
         with self._lock:
-            self._write()
-            if self.writer:
-                self.writer.close()
-            self.sink.close()
+            self._hand_off()
+        self._thread.remove(self)
+        if self._own_thread:
+            self._thread.close()
+        if self.writer:
+            self.writer.close()
+        self.sink.close()
 
     def set_schema(self, schema: pa.Schema):
         """Set the schema for the file.
@@ -42,20 +156,49 @@ class ArrowWriter:
         with self._lock:
             assert self.schema is None
             self.schema = schema
-            self.writer = pa.ipc.new_stream(self.sink, schema)
+            self.writer = self._new_writer(schema)
 
-    def _write(self):
-        """Write the new rows to the file."""
-        if len(self.new_rows) > 0:
+    def _new_writer(self, schema: pa.Schema) -> Union[pa.ipc.RecordBatchStreamWriter, pa.ipc.RecordBatchFileWriter]:
+        """Start the file, once we know the schema."""
+        return pa.ipc.new_stream(self.sink, schema)
+
+    def _hand_off(self):
+        """Pass the new rows to the writer thread (the lock must be held)."""
+        self._handed_off = time.monotonic()
+        if self.new_rows:
             if self.schema is None:
                 # only need to look at the first row to learn the schema
                 self.set_schema(pa.Table.from_pylist([self.new_rows[0]]).schema)
-
-            self.writer.write_batch(
-                pa.RecordBatch.from_pylist(self.new_rows, schema=self.schema)
-            )
+            self._thread.put(self, self.new_rows)
             self.new_rows = []
 
+    def _hand_off_if_due(self, now: float):
+        """Called by the writer thread now and then, to flush slow trickles of rows."""
+        if now - self._handed_off >= self.flush_interval:
+            with self._lock:
+                self._hand_off()
+
+    def _write_rows(self, rows: List[dict]):
+        """Convert and write rows (in the writer thread)."""
+        self._before_write()
+        try:
+            table = pa.Table.from_pylist(rows, schema=self.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            # find the rows at fault, so only they are lost
+            good = []
+            for row in rows:
+                try:
+                    pa.Table.from_pylist([row], schema=self.schema)
+                    good.append(row)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError) as ex:
+                    logging.error(f"Dropping a row that does not match the schema: {ex}")
+            table = pa.Table.from_pylist(good, schema=self.schema)
+        self.writer.write_table(table)  # type: ignore[union-attr]
+        self.rows_written += table.num_rows
+
+    def _before_write(self):
+        """Called by the writer thread before writing each batch."""
+
     def add_row(self, row_dict: dict):
         """Add a row to the arrow file.
         We will automatically learn the schema from the first row. But all rows must use that schema.
@@ -63,34 +206,103 @@ class ArrowWriter:
         with self._lock:
             self.new_rows.append(row_dict)
             if len(self.new_rows) >= chunk_size:
-                self._write()
+                self._hand_off()
 
 
 class FeatherWriter(ArrowWriter):
     """A smaller more interoperable version of arrow files.
-    Uses a temporary .arrow file (which could be huge) but converts to a much smaller (but still fast)
-    feather file.
+    Writes a zstd compressed feather (arrow IPC file format) file directly, one compressed record batch at a time.
+    The footer is only written by close(), but until then read_table() can still read every batch written so far.
+
+    Optionally the output is split into segments (file_name-00000.feather, file_name-00001.feather...), a new one
+    being started once the current one is rotate_bytes big or rotate_secs old.
     """
 
-    def __init__(self, file_name: str):
-        super().__init__(file_name + ".arrow")
+    def __init__(
+        self,
+        file_name: str,
+        *,
+        flush_interval_secs: Optional[float] = None,
+        rotate_bytes: Optional[int] = None,
+        rotate_secs: Optional[float] = None,
+        on_segment: Optional[Callable[[dict], None]] = None,
+        pool: Optional[WriterPool] = None,
+    ):
+        """Create a new FeatherWriter object.
+
+        file_name (str): The name of the file to write to, without the .feather extension.
+        on_segment: Called (from the writer thread, or close) with a description of each finished segment.
+        """
         self.base_file_name = file_name
+        self.rotate_bytes = rotate_bytes
+        self.rotate_secs = rotate_secs
+        self.on_segment = on_segment
+        self.segments: List[dict] = []  # the finished segments
+        self.segment_file = self._segment_name(0)
+        self._segment_opened = (time.monotonic(), datetime.now())
+        self._segment_first_row = 0
+        super().__init__(self.segment_file, flush_interval_secs, pool)
+
+    def _segment_name(self, index: int) -> str:
+        if self.rotate_bytes or self.rotate_secs:
+            return f"{self.base_file_name}-{index:05d}.feather"
+        return self.base_file_name + ".feather"
+
+    def _new_writer(self, schema: pa.Schema) -> pa.ipc.RecordBatchFileWriter:
+        return pa.ipc.new_file(self.sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def _before_write(self):
+        """Start a new segment if the current one is full (so no segment is ever left empty)."""
+        if self.rows_written > self._segment_first_row and (
+            (self.rotate_bytes and self.sink.tell() >= self.rotate_bytes)
+            or (self.rotate_secs and time.monotonic() - self._segment_opened[0] >= self.rotate_secs)
+        ):
+            self.writer.close()  # type: ignore[union-attr]
+            self.sink.close()
+            self._segment_done()
+            self.segment_file = self._segment_name(len(self.segments))
+            self._segment_opened = (time.monotonic(), datetime.now())
+            self._segment_first_row = self.rows_written
+            self.sink = pa.OSFile(self.segment_file, "wb")  # type: ignore
+            self.writer = self._new_writer(self.schema)  # type: ignore[arg-type]
+
+    def _segment_done(self):
+        segment = {
+            "file": os.path.basename(self.segment_file),
+            "rows": self.rows_written - self._segment_first_row,
+            "bytes": os.path.getsize(self.segment_file),
+            "opened": self._segment_opened[1].isoformat(),
+            "closed": datetime.now().isoformat(),
+        }
+        self.segments.append(segment)
+        if self.on_segment:
+            self.on_segment(segment)
 
     def close(self):
         super().close()
-        src_name = self.base_file_name + ".arrow"
-        dest_name = self.base_file_name + ".feather"
-        if os.path.getsize(src_name) == 0:
-            logging.warning(f"Discarding empty file: {src_name}")
-            os.remove(src_name)
+        if self.schema is None:
+            logging.warning(f"Discarding empty file: {self.segment_file}")
+            os.remove(self.segment_file)
         else:
-            logging.info(f"Compressing log data into {dest_name}")
+            self._segment_done()
 
-            # note: must use open_stream, not open_file/read_table because the streaming layout is different
-            # data = feather.read_table(src_name)
-            with pa.memory_map(src_name) as source:
-                array = pa.ipc.open_stream(source).read_all()
 
-            # See https://stackoverflow.com/a/72406099 for more info and performance testing measurements
-            feather.write_feather(array, dest_name, compression="zstd")
-            os.remove(src_name)
+def read_table(file_name: str) -> pa.Table:
+    """Read a file written by ArrowWriter or FeatherWriter.
+    Also works if the writer was never closed (e.g. the process died), returning the batches that made it to disk.
+    """
+    with pa.memory_map(file_name) as source:
+        try:
+            return pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            pass  # a stream, or a file without its footer
+        # the IPC file format is the magic number (padded to 8 bytes) followed by the stream format
+        source.seek(8 if source.read(6) == b"ARROW1" else 0)
+        reader = pa.ipc.open_stream(source)
+        batches = []
+        try:
+            for batch in reader:
+                batches.append(batch)
+        except (pa.ArrowInvalid, OSError) as ex:
+            logging.warning(f"{file_name} ends with an incomplete batch: {ex}")
+        return pa.Table.from_batches(batches, schema=reader.schema)
@@ -0,0 +1,85 @@
+"""Timestamps for slog files, and lining up the device's events with the power readings."""
+
+import time
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+import pyarrow as pa
+
+
+class Clock:
+    """Timestamps for log rows, in nanoseconds: time.monotonic_ns() shifted by a wall clock anchor.
+
+    The anchor (the wall clock and monotonic times when the Clock was made) is stored in the metadata of each
+    file, so the monotonic times can be recovered. Loggers sharing a Clock (e.g. those of all the devices in a
+    MultiLogSet) get timestamps that can be compared, and that never jump when the system time is adjusted.
+    Getting one is a single addition, cheap enough for a reading every few ms.
+    """
+
+    def __init__(self) -> None:
+        self.monotonic_ns = time.monotonic_ns()
+        self.wall_ns = time.time_ns()
+        self.offset_ns = self.wall_ns - self.monotonic_ns
+
+    def now(self) -> int:
+        """The current time (ns since the epoch, by the monotonic clock)"""
+        return time.monotonic_ns() + self.offset_ns
+
+    def metadata(self) -> Dict[str, str]:
+        """The anchor, for the schema metadata of the files using this clock"""
+        return {"clock_wall_ns": str(self.wall_ns), "clock_monotonic_ns": str(self.monotonic_ns)}
+
+
+time_type = pa.timestamp("ns", tz="UTC")  # the type of the time columns written with a Clock
+
+
+class ClockOffset(NamedTuple):
+    """How much later than the device's events the host timestamps them"""
+
+    offset_ns: int  # the median delay, subtract it from slog times to line them up with the power readings
+    spread_ns: int  # the median distance of the delays from offset_ns
+    events: int  # how many events it is based on
+
+
+def estimate_clock_offset(
+    slog: pa.Table,
+    power: pa.Table,
+    window_ns: int = 50_000_000,
+    min_step: Optional[float] = None,
+) -> Optional[ClockOffset]:
+    """Estimate how long device events take to reach the host, from the power readings.
+
+    Power state events (pm_mask and ps_state slogs) change the current the device draws, so for each of them
+    we look for the biggest step in average_mW within window_ns before (or after) the event was stamped. The
+    delays to the steps found are summarised by their median. Returns None if no event had a step of at least
+    min_step (by default 5 times the median step, i.e. well above the noise).
+
+    slog, power: the tables of a run (see read_run), both timestamped with the same Clock
+    """
+    names = [n for n in ("pm_mask", "ps_state") if n in slog.column_names]
+    if not names or slog.num_rows == 0 or power.num_rows < 2:
+        return None
+    is_event = np.zeros(slog.num_rows, dtype=bool)
+    for name in names:
+        is_event |= slog.column(name).is_valid().to_numpy()
+    event_times = slog.column("time").cast(pa.int64()).to_numpy()[is_event]
+
+    power = power.sort_by([("time", "ascending")])
+    power_times = power.column("time").cast(pa.int64()).to_numpy()
+    current = power.column("average_mW").to_numpy().astype(float)
+    steps = np.abs(np.diff(current))
+    step_times = power_times[1:]
+    if min_step is None:
+        min_step = 5 * float(np.nanmedian(steps))
+
+    delays = []
+    for t in event_times:
+        lo, hi = np.searchsorted(step_times, [t - window_ns, t + window_ns])
+        if hi > lo and not np.all(np.isnan(steps[lo:hi])):
+            i = lo + int(np.nanargmax(steps[lo:hi]))
+            if steps[i] >= min_step and steps[i] > 0:
+                delays.append(int(t - step_times[i]))
+    if not delays:
+        return None
+    offset = int(np.median(delays))
+    return ClockOffset(offset, int(np.median(np.abs(np.array(delays) - offset))), len(delays))
@@ -0,0 +1,263 @@
+"""Run directories: segment manifests, retention of old runs, and reading a run back."""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, TextIO
+
+import pyarrow as pa
+
+from .arrow import read_table
+
+MANIFEST_NAME = "manifest.json"
+
+
+class Manifest:
+    """The manifest.json of a run directory, listing the finished segment files of each stream (slog, power, raw).
+
+    It is rewritten (atomically) every time a segment is added, so it is always complete up to the last rotation.
+    """
+
+    def __init__(self, dir_name: str) -> None:
+        self.path = os.path.join(dir_name, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.data: dict = {"version": 1, "started": datetime.now().isoformat(), "closed": None, "streams": {}}
+        self.save()
+
+    def add_segment(self, stream: str, segment: dict) -> None:
+        """Record a finished segment of stream."""
+        with self.lock:
+            self.data["streams"].setdefault(stream, []).append(segment)
+            self.save()
+
+    def update(self, **fields) -> None:
+        """Add or replace (run level) fields."""
+        with self.lock:
+            self.data.update(fields)
+            self.save()
+
+    def close(self) -> None:
+        """Mark the run as finished."""
+        with self.lock:
+            self.data["closed"] = datetime.now().isoformat()
+            self.save()
+
+    def save(self) -> None:
+        """Write the manifest, replacing the file at once so it is never half written."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+class SegmentedTextFile:
+    """A text file (like raw.txt) split into segments the same way as FeatherWriter splits its output."""
+
+    def __init__(
+        self,
+        base_name: str,
+        *,
+        extension: str = ".txt",
+        rotate_bytes: Optional[int] = None,
+        rotate_secs: Optional[float] = None,
+        on_segment=None,
+    ) -> None:
+        """Create a new SegmentedTextFile object.
+
+        base_name (str): The name of the file to write to, without the extension.
+        on_segment: Called with a description of each finished segment.
+        """
+        self.base_name = base_name
+        self.extension = extension
+        self.rotate_bytes = rotate_bytes
+        self.rotate_secs = rotate_secs
+        self.on_segment = on_segment
+        self.segments: List[dict] = []
+        self.file: Optional[TextIO] = None
+        self._open()
+
+    def _open(self) -> None:
+        if self.rotate_bytes or self.rotate_secs:
+            self.file_name = f"{self.base_name}-{len(self.segments):05d}{self.extension}"
+        else:
+            self.file_name = self.base_name + self.extension
+        self.file = open(self.file_name, "w", encoding="utf8")  # pylint: disable=consider-using-with
+        self.lines = 0
+        self.opened = (time.monotonic(), datetime.now())
+
+    def _segment_done(self) -> None:
+        self.file.close()  # type: ignore[union-attr]
+        segment = {
+            "file": os.path.basename(self.file_name),
+            "rows": self.lines,
+            "bytes": os.path.getsize(self.file_name),
+            "opened": self.opened[1].isoformat(),
+            "closed": datetime.now().isoformat(),
+        }
+        self.segments.append(segment)
+        if self.on_segment:
+            self.on_segment(segment)
+
+    def write(self, line: str) -> None:
+        """Write a line (including its line ending)."""
+        if self.file is None:
+            return
+        if self.lines and (
+            (self.rotate_bytes and self.file.tell() >= self.rotate_bytes)
+            or (self.rotate_secs and time.monotonic() - self.opened[0] >= self.rotate_secs)
+        ):
+            self._segment_done()
+            self._open()
+        self.file.write(line)  # type: ignore[union-attr]
+        self.lines += 1
+
+    def close(self) -> None:
+        """Finish the last segment."""
+        if self.file is not None:
+            self._segment_done()
+            self.file = None
+
+
+def segment_files(dir_name: str, stream: str, extension: str = ".feather") -> List[str]:
+    """The files holding stream (e.g. "slog" or "power") in a run directory, oldest first.
+    Includes the segment still being written by a run that is going on (or crashed)."""
+    segments = sorted(glob.glob(os.path.join(glob.escape(dir_name), f"{stream}-[0-9]*{extension}")))
+    single = os.path.join(dir_name, stream + extension)
+    return segments if segments or not os.path.exists(single) else [single]
+
+
+def iter_run(dir_name: str, stream: str) -> Iterator[pa.Table]:
+    """Read a stream of a run one segment at a time, for runs too big to load at once."""
+    files = segment_files(dir_name, stream)
+    if not files:
+        raise FileNotFoundError(f"No {stream} data in {dir_name}")
+    for file_name in files:
+        yield read_table(file_name)
+
+
+def read_run(dir_name: str, stream: str) -> pa.Table:
+    """Read all segments of a stream of a run as one table."""
+    return pa.concat_tables(list(iter_run(dir_name, stream)))
+
+
+def clock_offset(dir_name: str) -> Optional[int]:
+    """The estimated clock offset (ns) of a run's slog events, if LogSet stored one in its manifest"""
+    try:
+        with open(os.path.join(dir_name, MANIFEST_NAME), encoding="utf8") as f:
+            offset = json.load(f).get("clock_offset")
+    except (OSError, ValueError):
+        return None
+    return offset["offset_ns"] if offset else None
+
+
+def devices(dir_name: str) -> List[str]:
+    """The devices of a run captured by a MultiLogSet (the subdirectories holding slogs)"""
+    return sorted(
+        name
+        for name in os.listdir(dir_name)
+        if os.path.isdir(os.path.join(dir_name, name)) and _has_slogs(os.path.join(dir_name, name))
+    )
+
+
+def read_capture(dir_name: str, stream: str) -> pa.Table:
+    """Read a stream of all the devices of a MultiLogSet run as one table, with a device column"""
+    tables = []
+    for device in devices(dir_name):
+        if segment_files(os.path.join(dir_name, device), stream):
+            table = read_run(os.path.join(dir_name, device), stream)
+            column = pa.repeat(device, table.num_rows).dictionary_encode()
+            tables.append(table.append_column("device", column))
+    if not tables:
+        raise FileNotFoundError(f"No {stream} data in {dir_name}")
+    return pa.concat_tables(tables, promote_options="default")  # type: ignore[call-arg]
+
+
+def _dir_size(dir_name: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(dir_name) for f in files)
+
+
+def _last_written(dir_name: str) -> float:
+    """When anything in a run was last written (the directory's own mtime only changes when files are added)"""
+    return max(
+        (os.path.getmtime(os.path.join(d, f)) for d, _, files in os.walk(dir_name) for f in files),
+        default=os.path.getmtime(dir_name),
+    )
+
+
+def _is_open(dir_name: str) -> bool:
+    """Is a run still being written (or did it crash)? Its manifest, or that of one of its devices, is not closed.
+    Runs without a manifest count as closed."""
+    for d in [dir_name] + [os.path.join(dir_name, device) for device in devices(dir_name)]:
+        try:
+            with open(os.path.join(d, MANIFEST_NAME), encoding="utf8") as f:
+                if json.load(f).get("closed") is None:
+                    return True
+        except (OSError, ValueError):
+            pass
+    return False
+
+
+def _has_slogs(dir_name: str) -> bool:
+    return os.path.exists(os.path.join(dir_name, MANIFEST_NAME)) or any(
+        segment_files(dir_name, stream, extension)
+        for stream, extension in (("slog", ".feather"), ("power", ".feather"), ("raw", ".txt"))
+    )
+
+
+def _is_run(dir_name: str) -> bool:
+    """Does a directory look like it holds slogs, of one device or several (so we never delete anything else)?"""
+    return _has_slogs(dir_name) or bool(devices(dir_name))
+
+
+def prune_runs(
+    root: str,
+    keep_runs: Optional[int] = None,
+    max_age_days: Optional[float] = None,
+    max_total_bytes: Optional[int] = None,
+    keep: Optional[str] = None,
+) -> List[str]:
+    """Delete old run directories under root, returns the deleted directories.
+
+    keep_runs: keep at most this many runs
+    max_age_days: delete runs last written longer ago than this
+    max_total_bytes: delete the oldest runs until the rest take at most this much space
+    keep: a run directory never to delete (the current one)
+
+    Runs that are not closed (see _is_open) are never deleted, and do not count against the limits.
+    """
+    keep_path = os.path.realpath(keep) if keep else None
+    runs = [
+        d
+        for d in (os.path.join(root, n) for n in os.listdir(root))
+        if os.path.isdir(d)
+        and not os.path.islink(d)
+        and _is_run(d)
+        and os.path.realpath(d) != keep_path
+        and not _is_open(d)
+    ]
+    last_written = {run: _last_written(run) for run in runs}
+    runs.sort(key=last_written.__getitem__, reverse=True)  # newest first
+    # the run to keep counts against the limits first
+    kept, total = 0, 0
+    if keep_path and os.path.isdir(keep_path):
+        kept, total = 1, _dir_size(keep_path)
+    now = time.time()
+    deleted = []
+    for run in runs:
+        size = _dir_size(run)
+        too_many = keep_runs is not None and kept >= keep_runs
+        too_old = max_age_days is not None and now - last_written[run] > max_age_days * 86400
+        too_big = max_total_bytes is not None and total + size > max_total_bytes
+        if too_many or too_old or too_big:
+            logging.info(f"Deleting old slogs in {run}")
+            shutil.rmtree(run)
+            deleted.append(run)
+        else:
+            kept += 1
+            total += size
+    return deleted
@@ -1,7 +1,6 @@
 """code logging power consumption of meshtastic devices."""
 
 import atexit
-import io
 import logging
 import os
 import re
@@ -10,7 +9,7 @@ import time
 from dataclasses import dataclass
 from datetime import datetime
 from functools import reduce
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
 
 import parse  # type: ignore[import-untyped]
 import platformdirs
@@ -20,7 +19,9 @@ from pubsub import pub  # type: ignore[import-untyped]
 from meshtastic.mesh_interface import MeshInterface
 from meshtastic.powermon import PowerMeter
 
-from .arrow import FeatherWriter
+from .arrow import FeatherWriter, WriterPool
+from .clock import Clock, estimate_clock_offset, time_type
+from .runs import Manifest, SegmentedTextFile, prune_runs, read_run
 
 
 def root_dir() -> str:
@@ -34,6 +35,20 @@ def root_dir() -> str:
     return dir_name
 
 
+def _fast_int(s: str) -> Optional[int]:
+    """Convert plain decimal or 0x hex digits, None for anything else (signs, spaces, other bases...)"""
+    if not s.isascii():
+        return None
+    if s.isdigit():
+        return int(s)
+    if s[:2] in ("0x", "0X") and s[2:].isalnum():
+        try:
+            return int(s[2:], 16)
+        except ValueError:
+            return None
+    return None
+
+
 @dataclass(init=False)
 class LogDef:
     """Log definition."""
@@ -66,6 +81,58 @@ class LogDef:
             fmt
         )  # We include a catchall matcher at the end - to ignore stuff we don't understand
 
+        # For parse_args: the (name, is a string, is the last field) of each field
+        self._fast_fields = [
+            (name, typ == pa.string(), idx == len(fields) - 1)
+            for idx, (name, typ) in enumerate(fields)
+        ]
+
+    def parse_args(self, args: str) -> Optional[Dict[str, Any]]:
+        """Parse the arguments of a log line into a dict of field values (None if they do not match).
+
+        The common cases (decimal or hex ints, comma separated fields) are handled with split and int,
+        anything unusual goes to the (slow) parse.Parser, so the results are always the same as its own.
+        """
+        parts = args.split(",", len(self._fast_fields) - 1)
+        if len(parts) == len(self._fast_fields):
+            di: Dict[str, Any] = {}
+            for (name, is_str, is_last), part in zip(self._fast_fields, parts):
+                if is_str:
+                    if is_last:
+                        part = part.strip()
+                        if not part:
+                            continue  # an empty last string is left out
+                    elif not part:
+                        break
+                    di[name] = part
+                else:
+                    value = _fast_int(part)
+                    if value is None:
+                        break
+                    di[name] = value
+            else:
+                return di
+        return self._parse_args_slow(args)
+
+    def _parse_args_slow(self, args: str) -> Optional[Dict[str, Any]]:
+        last_field = self.fields[-1]
+        last_is_str = last_field[1] == pa.string()
+        if last_is_str:
+            args += " "
+            # append a space so that if the last arg is an empty str
+            # it will still be accepted as a match for a str
+
+        r = self.format.parse(args)  # get the values with the correct types
+        if not r:
+            return None
+        di = r.named
+        if last_is_str:
+            di[last_field[0]] = di[last_field[0]].strip()  # remove the trailing space we added
+            if di[last_field[0]] == "":
+                # If the last field is an empty string, remove it
+                del di[last_field[0]]
+        return di
+
 
 """A dictionary mapping from logdef code to logdef"""
 log_defs = {
@@ -79,13 +146,64 @@ log_defs = {
 log_regex = re.compile(".*S:([0-9A-Za-z]+):(.*)")
 
 
+def match_slog(line: str) -> Optional[Tuple[str, str]]:
+    """Find the structured log (code, args) in a log line, the same as log_regex.match(line) would.
+    That is the last S:code: on the first line, with args running to the end of that line."""
+    end = line.find("\n")
+    if end >= 0:
+        line = line[:end]
+    start = line.rfind("S:")
+    while start >= 0:
+        colon = line.find(":", start + 2)
+        code = line[start + 2 : colon]
+        if colon > start + 2 and code.isascii() and code.isalnum():
+            return code, line[colon + 1 :]
+        start = line.rfind("S:", 0, start)
+    return None
+
+
 class PowerLogger:
     """Logs current watts reading periodically using PowerMeter and ArrowWriter."""
 
-    def __init__(self, pMeter: PowerMeter, file_path: str, interval=0.002) -> None:
-        """Initialize the PowerLogger object."""
+    def __init__(
+        self,
+        pMeter: PowerMeter,
+        file_path: str,
+        interval=0.002,
+        *,
+        rotate_bytes: Optional[int] = None,
+        rotate_secs: Optional[float] = None,
+        manifest: Optional[Manifest] = None,
+        pool: Optional[WriterPool] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        """Initialize the PowerLogger object.
+
+        rotate_bytes, rotate_secs: split the output into segments (see FeatherWriter)
+        manifest: the run manifest to record the segments in
+        pool: the writer threads to use (see WriterPool)
+        clock: where to get timestamps from
+        """
         self.pMeter = pMeter
-        self.writer = FeatherWriter(file_path)
+        self.clock = clock or Clock()
+        self.writer = FeatherWriter(
+            file_path,
+            rotate_bytes=rotate_bytes,
+            rotate_secs=rotate_secs,
+            on_segment=_manifest_recorder(manifest, "power"),
+            pool=pool,
+        )
+        self.writer.set_schema(
+            pa.schema(
+                [
+                    pa.field("time", time_type),
+                    pa.field("average_mW", pa.float64()),
+                    pa.field("max_mW", pa.float64()),
+                    pa.field("min_mW", pa.float64()),
+                ],
+                metadata=self.clock.metadata(),
+            )
+        )
         self.interval = interval
         self.is_logging = True
         self.thread = threading.Thread(
@@ -93,10 +211,13 @@ class PowerLogger:
         )
         self.thread.start()
 
-    def store_current_reading(self, now: Optional[datetime] = None) -> None:
-        """Store current power measurement."""
+    def store_current_reading(self, now: Optional[int] = None) -> None:
+        """Store current power measurement.
+
+        now: the timestamp to use (from our clock), instead of the current time
+        """
         if now is None:
-            now = datetime.now()
+            now = self.clock.now()
         d = {
             "time": now,
             "average_mW": self.pMeter.get_average_current_mA(),
@@ -121,6 +242,13 @@ class PowerLogger:
             self.writer.close()
 
 
+def _manifest_recorder(manifest: Optional[Manifest], stream: str):
+    """An on_segment callback adding segments of stream to manifest (if we have one)"""
+    if manifest is None:
+        return None
+    return lambda segment: manifest.add_segment(stream, segment)
+
+
 # FIXME move these defs somewhere else
 TOPIC_MESHTASTIC_LOG_LINE = "meshtastic.log.line"
 
@@ -135,16 +263,33 @@ class StructuredLogger:
         dir_path: str,
         power_logger: Optional[PowerLogger] = None,
         include_raw=True,
+        *,
+        rotate_bytes: Optional[int] = None,
+        rotate_secs: Optional[float] = None,
+        manifest: Optional[Manifest] = None,
+        pool: Optional[WriterPool] = None,
+        clock: Optional[Clock] = None,
     ) -> None:
         """Initialize the StructuredLogger object.
 
-        client (MeshInterface): The MeshInterface object to monitor.
+        client (MeshInterface): The MeshInterface object to monitor (log lines of other interfaces are ignored).
+        rotate_bytes, rotate_secs: split slog and raw.txt into segments (see FeatherWriter)
+        manifest: the run manifest to record the segments in
+        pool: the writer threads to use (see WriterPool)
+        clock: where to get timestamps from
         """
         self.client = client
         self.power_logger = power_logger
+        self.clock = clock or (power_logger.clock if power_logger else Clock())
 
         # Setup the arrow writer (and its schema)
-        self.writer = FeatherWriter(f"{dir_path}/slog")
+        self.writer = FeatherWriter(
+            f"{dir_path}/slog",
+            rotate_bytes=rotate_bytes,
+            rotate_secs=rotate_secs,
+            on_segment=_manifest_recorder(manifest, "slog"),
+            pool=pool,
+        )
         all_fields = reduce(
             (lambda x, y: x + y), map(lambda x: x.fields, log_defs.values())
         )
@@ -154,22 +299,27 @@ class StructuredLogger:
             all_fields.append(("raw", pa.string()))
 
         # Use timestamp as the first column
-        all_fields.insert(0, ("time", pa.timestamp("us")))
+        all_fields.insert(0, ("time", time_type))
 
         # pass in our name->type tuples a pa.fields
         self.writer.set_schema(
-            pa.schema(map(lambda x: pa.field(x[0], x[1]), all_fields))
+            pa.schema(
+                map(lambda x: pa.field(x[0], x[1]), all_fields),
+                metadata=self.clock.metadata(),
+            )
         )
 
-        self.raw_file: Optional[
-            io.TextIOWrapper
-        ] = open(  # pylint: disable=consider-using-with
-            f"{dir_path}/raw.txt", "w", encoding="utf8"
+        self.raw_file: Optional[SegmentedTextFile] = SegmentedTextFile(
+            f"{dir_path}/raw",
+            rotate_bytes=rotate_bytes,
+            rotate_secs=rotate_secs,
+            on_segment=_manifest_recorder(manifest, "raw"),
         )
 
         # We need a closure here because the subscription API is very strict about exact arg matching
-        def listen_glue(line, interface):  # pylint: disable=unused-argument
-            self._onLogMessage(line)
+        def listen_glue(line, interface):
+            if interface is self.client:
+                self._onLogMessage(line)
 
         self._listen_glue = (
             listen_glue  # we must save this so it doesn't get garbage collected
@@ -193,31 +343,16 @@ class StructuredLogger:
 
         di = {}  # the dictionary of the fields we found to log
 
-        m = log_regex.match(line)
+        m = match_slog(line) if "S:" in line else None
         if m:
-            src = m.group(1)
-            args = m.group(2)
+            src, args = m
             logging.debug(f"SLog {src}, args: {args}")
 
             d = log_defs.get(src)
             if d:
-                last_field = d.fields[-1]
-                last_is_str = last_field[1] == pa.string()
-                if last_is_str:
-                    args += " "
-                    # append a space so that if the last arg is an empty str
-                    # it will still be accepted as a match for a str
-
-                r = d.format.parse(args)  # get the values with the correct types
-                if r:
-                    di = r.named
-                    if last_is_str:
-                        di[last_field[0]] = di[
-                            last_field[0]
-                        ].strip()  # remove the trailing space we added
-                        if di[last_field[0]] == "":
-                            # If the last field is an empty string, remove it
-                            del di[last_field[0]]
+                r = d.parse_args(args)  # get the values with the correct types
+                if r is not None:
+                    di = r
                 else:
                     logging.warning(f"Failed to parse slog {line} with {d.format}")
             else:
@@ -225,7 +360,7 @@ class StructuredLogger:
 
         # Store our structured log record
         if di or self.include_raw:
-            now = datetime.now()
+            now = self.clock.now()
             di["time"] = now
             if self.include_raw:
                 di["raw"] = line
@@ -239,6 +374,120 @@ class StructuredLogger:
             self.raw_file.write(line + "\n")  # Write the raw log
 
 
+TOPIC_MESHTASTIC_RECEIVE = "meshtastic.receive"
+TOPIC_MESHTASTIC_SENT = "meshtastic.sent"
+
+packet_schema = pa.schema(
+    [
+        pa.field("time", time_type),
+        pa.field("direction", pa.string()),  # "rx" or "tx"
+        pa.field("from", pa.uint32()),
+        pa.field("to", pa.uint32()),
+        pa.field("id", pa.uint32()),
+        pa.field("portnum", pa.int32()),  # None if we could not decrypt the packet
+        pa.field("rx_time", pa.uint32()),
+        pa.field("rx_snr", pa.float32()),
+        pa.field("rx_rssi", pa.int32()),
+        pa.field("hop_start", pa.uint32()),
+        pa.field("hop_limit", pa.uint32()),
+        pa.field("payload_len", pa.uint32()),
+        pa.field("decode_latency", pa.float32()),  # seconds from the bytes arriving to the packet being published
+    ]
+)
+
+
+class PacketLogger:
+    """Records every mesh packet received or sent by a MeshInterface into an arrow file (packets.feather)."""
+
+    def __init__(
+        self,
+        client: MeshInterface,
+        dir_path: str,
+        *,
+        rotate_bytes: Optional[int] = None,
+        rotate_secs: Optional[float] = None,
+        manifest: Optional[Manifest] = None,
+        pool: Optional[WriterPool] = None,
+        clock: Optional[Clock] = None,
+    ) -> None:
+        """Initialize the PacketLogger object.
+
+        client (MeshInterface): The MeshInterface object to monitor.
+        rotate_bytes, rotate_secs: split the output into segments (see FeatherWriter)
+        manifest: the run manifest to record the segments in
+        pool: the writer threads to use (see WriterPool)
+        clock: where to get timestamps from
+        """
+        self.client = client
+        self.clock = clock or Clock()
+        self.writer = FeatherWriter(
+            f"{dir_path}/packets",
+            rotate_bytes=rotate_bytes,
+            rotate_secs=rotate_secs,
+            on_segment=_manifest_recorder(manifest, "packets"),
+            pool=pool,
+        )
+        self.writer.set_schema(pa.schema(packet_schema, metadata=self.clock.metadata()))
+
+        # Closures, because the subscription API is very strict about exact arg matching
+        def on_receive(packet, interface):
+            if interface is self.client:
+                rx_monotonic = packet.get("rxMonotonic")
+                self._add(packet["raw"], "rx", None if rx_monotonic is None else time.monotonic() - rx_monotonic)
+
+        def on_sent(packet, interface):
+            if interface is self.client:
+                self._add(packet["raw"], "tx", None)
+
+        self._on_receive = on_receive  # we must save these so they don't get garbage collected
+        self._on_sent = on_sent
+        pub.subscribe(on_receive, TOPIC_MESHTASTIC_RECEIVE)
+        pub.subscribe(on_sent, TOPIC_MESHTASTIC_SENT)
+
+    def _add(self, p, direction: str, latency: Optional[float]) -> None:
+        decoded = p.HasField("decoded")
+        self.writer.add_row(
+            {
+                "time": self.clock.now(),
+                "direction": direction,
+                "from": getattr(p, "from"),
+                "to": p.to,
+                "id": p.id,
+                "portnum": p.decoded.portnum if decoded else None,
+                "rx_time": p.rx_time or None,
+                "rx_snr": p.rx_snr if p.rx_snr or p.rx_rssi else None,
+                "rx_rssi": p.rx_rssi or None,
+                "hop_start": p.hop_start,
+                "hop_limit": p.hop_limit,
+                "payload_len": len(p.decoded.payload) if decoded else len(p.encrypted),
+                "decode_latency": latency,
+            }
+        )
+
+    def close(self) -> None:
+        """Stop logging."""
+        pub.unsubscribe(self._on_receive, TOPIC_MESHTASTIC_RECEIVE)
+        pub.unsubscribe(self._on_sent, TOPIC_MESHTASTIC_SENT)
+        self.writer.close()
+
+
+def _new_run_dir(keep_runs: Optional[int], max_age_days: Optional[float]) -> str:
+    """Make a timestamped directory for a run in root_dir() (deleting old runs as asked)"""
+    app_dir = root_dir()
+    if keep_runs is not None or max_age_days is not None:
+        # the run we are about to start counts as one of the runs to keep
+        prune_runs(app_dir, None if keep_runs is None else keep_runs - 1, max_age_days)
+    dir_name = f"{app_dir}/{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    os.makedirs(dir_name, exist_ok=True)
+
+    # Also make a 'latest' directory that always points to the most recent logs
+    # symlink might fail on some platforms, if it does fail silently
+    if os.path.exists(f"{app_dir}/latest"):
+        os.unlink(f"{app_dir}/latest")
+    os.symlink(dir_name, f"{app_dir}/latest", target_is_directory=True)
+    return dir_name
+
+
 class LogSet:
     """A complete set of meshtastic log/metadata for a particular run."""
 
@@ -247,36 +496,50 @@ class LogSet:
         client: MeshInterface,
         dir_name: Optional[str] = None,
         power_meter: Optional[PowerMeter] = None,
+        *,
+        include_packets: bool = True,
+        keep_runs: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        estimate_offset: bool = False,
+        **logger_opts,
     ) -> None:
         """Initialize the PowerMonClient object.
 
         power (PowerSupply): The power supply object.
         client (MeshInterface): The MeshInterface object to monitor.
+        include_packets: also record the mesh packets sent and received (packets.feather)
+        keep_runs, max_age_days: delete older runs in root_dir() (only used if dir_name is not given)
+        estimate_offset: when closing, estimate how late slog events are stamped compared to the power readings
+            (see estimate_clock_offset) and store it in the manifest as clock_offset
+        logger_opts: passed on to each logger
+            rotate_bytes, rotate_secs: split each file into segments of about this size or duration
+            pool, clock: writer threads and clock shared with other LogSets (see MultiLogSet)
         """
 
         if not dir_name:
-            app_dir = root_dir()
-            dir_name = f"{app_dir}/{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            os.makedirs(dir_name, exist_ok=True)
-
-            # Also make a 'latest' directory that always points to the most recent logs
-            # symlink might fail on some platforms, if it does fail silently
-            if os.path.exists(f"{app_dir}/latest"):
-                os.unlink(f"{app_dir}/latest")
-            os.symlink(dir_name, f"{app_dir}/latest", target_is_directory=True)
-
+            dir_name = _new_run_dir(keep_runs, max_age_days)
+        os.makedirs(dir_name, exist_ok=True)
         self.dir_name = dir_name
 
         logging.info(f"Writing slogs to {dir_name}")
+        self.manifest = Manifest(dir_name)
+        self.clock = logger_opts.get("clock") or Clock()
+        self.manifest.update(clock=self.clock.metadata())
+        self.estimate_offset = estimate_offset
+        opts: Dict[str, Any] = {**logger_opts, "manifest": self.manifest, "clock": self.clock}
 
         self.power_logger: Optional[PowerLogger] = (
             None
             if not power_meter
-            else PowerLogger(power_meter, f"{self.dir_name}/power")
+            else PowerLogger(power_meter, f"{self.dir_name}/power", **opts)
         )
 
         self.slog_logger: Optional[StructuredLogger] = StructuredLogger(
-            client, self.dir_name, power_logger=self.power_logger
+            client, self.dir_name, power_logger=self.power_logger, **opts
+        )
+
+        self.packet_logger: Optional[PacketLogger] = (
+            PacketLogger(client, self.dir_name, **opts) if include_packets else None
         )
 
         # Store a lambda so we can find it again to unregister
@@ -291,6 +554,79 @@ class LogSet:
                 self.atexit_handler
             )  # docs say it will silently ignore if not found
             self.slog_logger.close()
+            if self.packet_logger:
+                self.packet_logger.close()
             if self.power_logger:
                 self.power_logger.close()
+                if self.estimate_offset:
+                    self._estimate_offset()
+            self.manifest.close()
             self.slog_logger = None
+
+    def _estimate_offset(self) -> None:
+        try:
+            offset = estimate_clock_offset(read_run(self.dir_name, "slog"), read_run(self.dir_name, "power"))
+        except FileNotFoundError:
+            offset = None
+        if offset is None:
+            logging.warning("Could not estimate the slog clock offset, no power state event matched a power step")
+        else:
+            logging.info(f"Slog events are stamped {offset.offset_ns / 1e6:.3f} ms after the power readings")
+            self.manifest.update(clock_offset=offset._asdict())
+
+
+class MultiLogSet:
+    """Logs of many devices captured at once, one LogSet per device in a subdirectory named after it.
+
+    All the LogSets share the writer threads (instead of starting a few per device) and the clock, so
+    timestamps of different devices can be compared.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, MeshInterface],
+        dir_name: Optional[str] = None,
+        power_meters: Optional[Dict[str, PowerMeter]] = None,
+        *,
+        writer_threads: int = 2,
+        keep_runs: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        **kwargs,
+    ) -> None:
+        """Initialize the MultiLogSet object.
+
+        clients: the interfaces to capture, by device name (used as the subdirectory name)
+        power_meters: the power meters of (some of) the devices, by device name
+        writer_threads: how many threads convert and write the rows of all the devices
+        kwargs: passed on to each LogSet (include_packets, rotate_bytes, rotate_secs)
+        """
+        self.dir_name = dir_name or _new_run_dir(keep_runs, max_age_days)
+        self.pool = WriterPool(writer_threads)
+        self.clock = Clock()
+        self.kwargs = kwargs
+        self.log_sets: Dict[str, LogSet] = {}
+        for name, client in clients.items():
+            self.add(name, client, (power_meters or {}).get(name))
+
+    def add(self, name: str, client: MeshInterface, power_meter: Optional[PowerMeter] = None) -> LogSet:
+        """Start capturing another device"""
+        if name in self.log_sets or os.sep in name or name in ("", ".", ".."):
+            raise ValueError(f"Bad or duplicate device name {name}")
+        log_set = LogSet(
+            client,
+            os.path.join(self.dir_name, name),
+            power_meter,
+            pool=self.pool,
+            clock=self.clock,
+            **self.kwargs,
+        )
+        self.log_sets[name] = log_set
+        return log_set
+
+    def close(self) -> None:
+        """Close all the log sets."""
+        try:
+            for log_set in self.log_sets.values():
+                log_set.close()
+        finally:
+            self.pool.close()
@@ -0,0 +1,175 @@
+"""Spatial index over node positions
+"""
+
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+"""Mean earth radius, used for great-circle distances"""
+
+METERS_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_M / 180
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in meters between two points given in degrees"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """A grid of fixed size lat/lon cells holding node positions.
+
+    Updates are O(1), queries only look at the cells overlapping the area of interest, so they stay fast
+    no matter how many nodes are elsewhere in the world.
+    """
+
+    def __init__(self, cell_deg: float = 0.05) -> None:
+        """Constructor
+
+        cell_deg (float): The size of a grid cell in degrees (0.05 is about 5km)
+        """
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._positions: Dict[int, Tuple[float, float, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, num) -> bool:
+        return num in self._positions
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def get(self, num: int) -> Optional[Tuple[float, float]]:
+        """Return the (lat, lon) we have for a node, or None"""
+        p = self._positions.get(num)
+        return (p[0], p[1]) if p is not None else None
+
+    def update(self, num: int, lat: float, lon: float) -> None:
+        """Add or move a node"""
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._positions.get(num)
+            if old is not None and old[2] != cell:
+                self._discard(num, old[2])
+            self._cells.setdefault(cell, {})[num] = (lat, lon)
+            self._positions[num] = (lat, lon, cell)
+
+    def remove(self, num: int) -> None:
+        """Forget a node (does nothing if we do not know it)"""
+        with self._lock:
+            old = self._positions.pop(num, None)
+            if old is not None:
+                self._discard(num, old[2])
+
+    def clear(self) -> None:
+        """Forget all nodes"""
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+
+    def _discard(self, num: int, cell: Tuple[int, int]) -> None:
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(num, None)
+            if not members:
+                del self._cells[cell]
+
+    def _candidates(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        """Yield (num, lat, lon) for all nodes in cells overlapping the box (lon ranges must not wrap)"""
+        lat0, lon0 = self._cell(min_lat, min_lon)
+        lat1, lon1 = self._cell(max_lat, max_lon)
+        if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > len(self._cells):
+            # the box covers more cells than are in use, cheaper to look at each used cell
+            for (clat, clon), members in self._cells.items():
+                if lat0 <= clat <= lat1 and lon0 <= clon <= lon1:
+                    for num, (lat, lon) in members.items():
+                        yield num, lat, lon
+        else:
+            for clat in range(lat0, lat1 + 1):
+                for clon in range(lon0, lon1 + 1):
+                    cell = self._cells.get((clat, clon))
+                    if cell:
+                        for num, (lat, lon) in cell.items():
+                            yield num, lat, lon
+
+    def nodes_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+        """Return the nodes inside a lat/lon box. If min_lon > max_lon the box crosses the antimeridian."""
+        boxes = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+        result = []
+        with self._lock:
+            for lo, hi in boxes:
+                for num, lat, lon in self._candidates(min_lat, lo, max_lat, hi):
+                    if min_lat <= lat <= max_lat and lo <= lon <= hi:
+                        result.append(num)
+        return result
+
+    def nodes_within(self, lat: float, lon: float, radius_m: float) -> List[Tuple[int, float]]:
+        """Return (node number, distance in meters) for the nodes within radius_m of a point, nearest first"""
+        dlat = radius_m / METERS_PER_DEGREE_LAT
+        min_lat = max(-90.0, lat - dlat)
+        max_lat = min(90.0, lat + dlat)
+        coslat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+        if coslat <= 0 or dlat / coslat >= 180:
+            boxes = [(-180.0, 180.0)]  # close to a pole, every longitude might be in range
+        else:
+            dlon = dlat / coslat
+            lo, hi = lon - dlon, lon + dlon
+            if lo < -180:
+                boxes = [(lo + 360, 180.0), (-180.0, hi)]
+            elif hi > 180:
+                boxes = [(lo, 180.0), (-180.0, hi - 360)]
+            else:
+                boxes = [(lo, hi)]
+
+        result = []
+        with self._lock:
+            for lo, hi in boxes:
+                for num, plat, plon in self._candidates(min_lat, lo, max_lat, hi):
+                    d = distance_m(lat, lon, plat, plon)
+                    if d <= radius_m:
+                        result.append((num, d))
+        result.sort(key=lambda x: x[1])
+        return result
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, float]]:
+        """Return (node number, distance in meters) for the k nodes closest to a point, nearest first"""
+        with self._lock:
+            if k <= 0 or not self._positions:
+                return []
+            clat, clon = self._cell(lat, lon)
+            found: List[Tuple[float, int]] = []
+            visited = 0
+            ring = 0
+            while (2 * ring + 1) ** 2 <= 4 * len(self._cells):
+                reach = (ring + 1) * self.cell_deg
+                if abs(lat) + reach >= 90 or abs(lon) + reach >= 180:
+                    break  # the grid does not wrap around poles or the antimeridian
+                for dlat in range(-ring, ring + 1):
+                    for dlon in range(-ring, ring + 1):
+                        if max(abs(dlat), abs(dlon)) != ring:
+                            continue  # inner cells were done in an earlier ring
+                        members = self._cells.get((clat + dlat, clon + dlon))
+                        if members:
+                            visited += len(members)
+                            for num, (plat, plon) in members.items():
+                                found.append((distance_m(lat, lon, plat, plon), num))
+                if len(found) >= k:
+                    best = heapq.nsmallest(k, found)
+                    # anything not visited yet is at least ring cells away, and cells get narrower away from the equator
+                    clearance_m = ring * self.cell_deg * METERS_PER_DEGREE_LAT * math.cos(math.radians(abs(lat) + reach))
+                    if best[-1][0] <= clearance_m or visited == len(self._positions):
+                        return [(num, d) for d, num in best]
+                ring += 1
+
+            # sparse index (or close to a pole/the antimeridian), just look at everything
+            found = [(distance_m(lat, lon, p[0], p[1]), num) for num, p in self._positions.items()]
+            return [(num, d) for d, num in heapq.nsmallest(k, found)]
@@ -22,11 +22,14 @@ class TCPInterface(StreamInterface):
         connectNow: bool=True,
         portNumber: int=DEFAULT_TCP_PORT,
         noNodes:bool=False,
+        *,
+        snapshotDir: Optional[str]=None,
     ):
         """Constructor, opens a connection to a specified IP address/hostname
 
         Keyword Arguments:
             hostname {string} -- Hostname/IP address of the device to connect to
+            snapshotDir {string} -- Directory for node DB snapshots, see MeshInterface (default: {None})
         """
 
         self.stream = None
@@ -41,7 +44,7 @@ class TCPInterface(StreamInterface):
         else:
             self.socket = None
 
-        super().__init__(debugOut=debugOut, noProto=noProto, connectNow=connectNow, noNodes=noNodes)
+        super().__init__(debugOut=debugOut, noProto=noProto, connectNow=connectNow, noNodes=noNodes, snapshotDir=snapshotDir)
 
     def __repr__(self):
         rep = f"TCPInterface({self.hostname!r}"
@@ -55,6 +58,8 @@ class TCPInterface(StreamInterface):
             rep += f", portNumber={self.portNumber!r}"
         if self.noNodes:
             rep += ", noNodes=True"
+        if self.snapshotDir is not None:
+            rep += f", snapshotDir={self.snapshotDir!r}"
         rep += ")"
         return rep
 
@@ -0,0 +1,49 @@
+"""Meshtastic unit tests for batch.py"""
+
+import pytest
+
+from ..batch import BatchStep, groupSteps, parseSteps, runSteps
+
+
+@pytest.mark.unit
+def test_parseSteps():
+    """Test the step formats, in JSON lines and YAML"""
+    jsonl = '"--info"\n# a comment\n["--set", "lora.hop_limit", 5]\n{"name": "hello", "args": "--sendtext \'hi there\'", "ignore_errors": true}\n'
+    yml = "- --info\n- [--set, lora.hop_limit, 5]\n- name: hello\n  args: --sendtext 'hi there'\n  ignore_errors: true\n"
+    expected = [
+        BatchStep("--info", ["--info"]),
+        BatchStep("--set lora.hop_limit 5", ["--set", "lora.hop_limit", "5"]),
+        BatchStep("hello", ["--sendtext", "hi there"], True),
+    ]
+    assert parseSteps(jsonl) == expected
+    assert parseSteps(yml) == expected
+    with pytest.raises(ValueError):
+        parseSteps("just: a dict")
+    with pytest.raises(ValueError):
+        parseSteps('[{"nested": 1}]')
+
+
+@pytest.mark.unit
+def test_groupSteps():
+    """Test that consecutive --set steps are merged"""
+    steps = parseSteps("- --set a 1\n- --set b 2 --set c 3\n- --info\n- --set d 4\n")
+    assert groupSteps(steps) == [[0, 1], [2], [3]]
+
+
+@pytest.mark.unit
+def test_runSteps():
+    """Test the report, and that the batch stops at the first failure unless told to ignore it"""
+    steps = parseSteps("- --set a 1\n- --set b 2\n- {args: --bad, ignore_errors: true}\n- --bad\n- --info\n")
+    ran = []
+
+    def runCommand(argv):
+        ran.append(argv)
+        return (1, "failed\n") if "--bad" in argv else (0, "done\n")
+
+    report = runSteps(steps, runCommand)
+    assert ran == [["--set", "a", "1", "--set", "b", "2"], ["--bad"], ["--bad"]]
+    assert not report["ok"]
+    assert [r["ok"] for r in report["steps"]] == [True, True, False, False, False]
+    assert report["steps"][0]["mergedWith"] == [2]
+    assert report["steps"][3]["output"] == "failed\n"
+    assert report["steps"][4]["skipped"]
@@ -0,0 +1,100 @@
+"""Meshtastic unit tests for daemon.py"""
+
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+from ..daemon import CommandServer, SharedInterface, captureOutput, sendCommand
+
+
+@pytest.fixture(name="server")
+def fixture_server(tmp_path):
+    """A CommandServer echoing the command lines it gets"""
+    s = CommandServer(str(tmp_path / "d.sock"), lambda argv: (len(argv), " ".join(argv)))
+    thread = threading.Thread(target=s.serve_forever, daemon=True)
+    thread.start()
+    yield s
+    s.shutdown()
+    s.server_close()
+
+
+@pytest.mark.unit
+def test_sendCommand(server):
+    """Test a round trip, and that several clients can use the server at once"""
+    assert sendCommand(server.path, ["--info"]) == (1, "--info")
+    results = []
+    clients = [threading.Thread(target=lambda i=i: results.append(sendCommand(server.path, ["a"] * i)))
+               for i in range(5)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    assert sorted(results) == [(i, " ".join(["a"] * i)) for i in range(5)]
+
+
+@pytest.mark.unit
+def test_CommandServer_bad_request(server):
+    """Test that malformed requests are answered with an error"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(server.path)
+        s.sendall(b'{"argv": "--info"}\n')
+        assert b'"status": 2' in s.makefile("rb").readline()
+
+
+@pytest.mark.unit
+def test_CommandServer_socket_file(server, tmp_path):
+    """Test that a second daemon on the same socket is refused, and stale sockets are replaced"""
+    with pytest.raises(OSError):
+        CommandServer(server.path, lambda argv: (0, ""))
+    stale = str(tmp_path / "stale.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.bind(stale)  # bound but never listening, like the socket of a daemon that was killed
+    s2 = CommandServer(stale, lambda argv: (0, ""))
+    s2.server_close()
+    assert stat.S_IMODE(os.stat(server.path).st_mode) == 0o600
+
+
+@pytest.mark.unit
+def test_CommandServer_client_went_away(server, capsys):
+    """Test that clients disconnecting before the answer do not cause tracebacks"""
+    for request in (b"", b'{"argv": ["--info"]}\n'):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(server.path)
+            s.sendall(request)
+    time.sleep(0.2)
+    assert sendCommand(server.path, ["--info"]) == (1, "--info")
+    assert "Traceback" not in capsys.readouterr().err
+
+
+@pytest.mark.unit
+def test_captureOutput():
+    """Test that output and exit statuses are captured"""
+    assert captureOutput(lambda: print("hi")) == (0, "hi\n")
+    assert captureOutput(lambda: sys.exit(3)) == (3, "")
+    assert captureOutput(lambda: sys.exit("bye")) == (1, "bye\n")
+    status, output = captureOutput(lambda: 1 / 0)
+    assert status == 1 and "Aborting due to" in output
+
+
+@pytest.mark.unit
+def test_SharedInterface():
+    """Test that the shared interface can not be closed"""
+    class Iface:
+        """An interface that remembers being closed"""
+        closed = False
+        localNode = "node"
+
+        def close(self):
+            """Close"""
+            self.closed = True
+
+    iface = Iface()
+    shared = SharedInterface(iface)
+    shared.close()
+    assert shared.localNode == "node"
+    assert not iface.closed
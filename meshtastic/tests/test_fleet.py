@@ -0,0 +1,161 @@
+"""Meshtastic unit tests for fleet.py"""
+
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..fleet import FleetConfigurator
+from ..mesh_interface import MeshInterface
+from ..node import Node
+from ..protobuf import admin_pb2
+from ..serial_interface import SerialInterface
+
+
+class FakeMesh:
+    """Remote nodes answering config requests from their own LocalConfig"""
+
+    def __init__(self):
+        self.iface = MagicMock(autospec=SerialInterface)
+        self.iface.getNode = self.getNode
+        self.devices = {}  # node id -> (localConfig, moduleConfig) the node has
+        self.written = {}  # node id -> sections written
+        self.unreachable = set()
+
+    def getNode(self, nodeId, requestChannels=True, **_kwargs):
+        """A node whose config requests are answered (or not) by the fake device"""
+        assert not requestChannels
+        node = Node(self.iface, nodeId, noProto=True)
+        local, module = self.devices[nodeId]
+
+        def fetchAllConfig(sections=None, **_kwargs):
+            if nodeId in self.unreachable:
+                return list(sections)
+            for name in sections:
+                src, dst = (local, node.localConfig) if name in local.DESCRIPTOR.fields_by_name else (module, node.moduleConfig)
+                getattr(dst, name).CopyFrom(getattr(src, name))
+            return []
+
+        def writeConfig(name):
+            src, dst = (node.localConfig, local) if name in local.DESCRIPTOR.fields_by_name else (node.moduleConfig, module)
+            getattr(dst, name).CopyFrom(getattr(src, name))
+            self.written.setdefault(nodeId, []).append(name)
+
+        node.fetchAllConfig = fetchAllConfig
+        node.writeConfig = writeConfig
+        node.beginSettingsTransaction = lambda: None
+        node.commitSettingsTransaction = lambda: None
+        return node
+
+    def add(self, nodeId, hopLimit):
+        """Add a device with a hop limit"""
+        local = Node(self.iface, nodeId, noProto=True).localConfig
+        local.lora.hop_limit = hopLimit
+        local.lora.region = 3
+        self.devices[nodeId] = (local, Node(self.iface, nodeId, noProto=True).moduleConfig)
+
+
+@pytest.mark.unit
+def test_FleetConfigurator_bad_configuration():
+    """Test that configurations are checked before any node is touched"""
+    with pytest.raises(ValueError):
+        FleetConfigurator(None, {"config": {"lora": {"noSuchField": 1}}})
+    with pytest.raises(ValueError):
+        FleetConfigurator(None, {"config": {"noSuchSection": {}}})
+
+
+@pytest.mark.unit
+def test_FleetConfigurator_run(tmp_path):
+    """Test that only what differs is written, failures are retried and reported, and runs resume"""
+    mesh = FakeMesh()
+    for i, hops in enumerate([3, 5, 3]):
+        mesh.add(f"!0000000{i}", hops)
+    mesh.unreachable.add("!00000002")
+    configuration = {"owner": "ignored", "config": {"lora": {"hopLimit": 5}}, "moduleConfig": {"mqtt": {"enabled": True}}}
+    checkpoint = str(tmp_path / "fleet.json")
+
+    fleet = FleetConfigurator(mesh.iface, configuration, concurrency=2, retries=1, retryDelay=0, checkpoint=checkpoint)
+    results = fleet.run(["!00000000", "!00000001", "!00000002"])
+    assert [(r.nodeId, r.ok, r.attempts) for r in results] == [
+        ("!00000000", True, 1), ("!00000001", True, 1), ("!00000002", False, 2)
+    ]
+    assert results[0].sections == ["lora", "mqtt"]
+    assert results[0].fields == ["lora.hop_limit", "mqtt.enabled"]
+    assert results[1].sections == ["mqtt"]
+    assert "lora" in results[2].error
+    assert mesh.devices["!00000000"][0].lora.hop_limit == 5
+    assert mesh.devices["!00000000"][0].lora.region == 3  # fields not in the configuration are kept
+    with open(checkpoint, encoding="utf8") as f:
+        assert json.load(f)["results"]["!00000001"]["ok"]
+
+    # a second run only works on the node that failed
+    mesh.unreachable.clear()
+    mesh.written.clear()
+    fleet = FleetConfigurator(mesh.iface, configuration, checkpoint=checkpoint)
+    results = fleet.run(["!00000000", "!00000001", "!00000002"])
+    assert all(r.ok for r in results)
+    assert mesh.written == {"!00000002": ["lora", "mqtt"]}
+
+    # a different configuration starts over, and nodes that already have it are left alone
+    mesh.written.clear()
+    fleet = FleetConfigurator(mesh.iface, {"config": {"lora": {"hop_limit": 5}}}, checkpoint=checkpoint)
+    assert all(r.ok and not r.sections for r in fleet.run(["!00000000", "!00000001"]))
+    assert not mesh.written
+
+
+@pytest.mark.unit
+def test_FleetConfigurator_unexpected_error(tmp_path):
+    """Test that an unexpected error configuring one node is that node's failure, and the others are still saved"""
+    mesh = FakeMesh()
+    for i in range(3):
+        mesh.add(f"!0000000{i}", 3)
+    getNode = mesh.getNode
+
+    def brokenGetNode(nodeId, requestChannels=True, **kwargs):
+        if nodeId == "!00000001":
+            raise RuntimeError("transport went away")
+        return getNode(nodeId, requestChannels, **kwargs)
+
+    mesh.iface.getNode = brokenGetNode
+    checkpoint = str(tmp_path / "fleet.json")
+    fleet = FleetConfigurator(mesh.iface, {"config": {"lora": {"hopLimit": 5}}}, retries=1, retryDelay=0, checkpoint=checkpoint)
+    results = fleet.run(["!00000000", "!00000001", "!00000002"])
+    assert [(r.ok, r.attempts) for r in results] == [(True, 1), (False, 2), (True, 1)]
+    assert results[1].error == "RuntimeError: transport went away"
+    with open(checkpoint, encoding="utf8") as f:
+        saved = json.load(f)["results"]
+    assert saved["!00000000"]["ok"] and saved["!00000002"]["ok"] and not saved["!00000001"]["ok"]
+
+
+@pytest.mark.unit
+def test_ack_waits_of_concurrent_workers():
+    """Test that FleetConfigurator workers waiting for the ACKs of different nodes at once get their own"""
+    iface = MeshInterface(noProto=True)
+    iface._timeout.sleepInterval = 0.001
+    nodes = [Node(iface, f"!0000000{i}") for i in (1, 2, 3)]
+    for node in nodes:
+        node._sendAdmin = MagicMock()
+    done = []
+
+    def worker(node):
+        node.requestConfig(admin_pb2.AdminMessage.SESSIONKEY_CONFIG)
+        done.append(node.nodeNum)
+
+    workers = [threading.Thread(target=worker, args=(node,)) for node in nodes[:2]]
+    for w in workers:
+        w.start()
+    # node 3 ACKs a write of a third worker, which nobody is waiting for
+    nodes[2].onAckNak({"from": 3, "decoded": {"routing": {"errorReason": "NONE"}}})
+    time.sleep(0.05)
+    assert not done
+    # node 2 answers: only its worker is done
+    nodes[1].onResponseRequestSettings({"decoded": {"routing": {"errorReason": "TIMEOUT"}}})
+    workers[1].join(timeout=5)
+    time.sleep(0.05)
+    assert done == ["!00000002"]
+    nodes[0].onResponseRequestSettings({"decoded": {"routing": {"errorReason": "TIMEOUT"}}})
+    workers[0].join(timeout=5)
+    assert done == ["!00000002", "!00000001"]
+    iface.close()
@@ -1,14 +1,18 @@
 """Meshtastic unit tests for __main__.py"""
 # pylint: disable=C0302,W0613,R0917
 
+import json
 import logging
 import os
 import platform
 import re
+import subprocess
 import sys
+import threading
 from unittest.mock import mock_open, MagicMock, patch
 
 import pytest
+from pubsub import pub  # type: ignore[import-untyped]
 
 from meshtastic.__main__ import (
     export_config,
@@ -408,7 +412,7 @@ def test_main_nodes(capsys):
 
     iface = MagicMock(autospec=SerialInterface)
 
-    def mock_showNodes(includeSelf, showFields):
+    def mock_showNodes(includeSelf, showFields, **kwargs):
         print(f"inside mocked showNodes: {includeSelf} {showFields}")
 
     iface.showNodes.side_effect = mock_showNodes
@@ -1080,6 +1084,29 @@ def test_main_configure_with_camel_case_keys(mocked_findports, mocked_serial, mo
         mo.assert_called()
 
 
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_configure_remote(tmp_path, capsys):
+    """Test that --configure of a remote node writes the changed sections to the node it edited"""
+    config = tmp_path / "config.yaml"
+    config.write_text("config:\n  lora:\n    hop_limit: 5\n", encoding="utf8")
+    sys.argv = ["", "--configure", str(config), "--dest", "!12345678"]
+    mt_config.args = sys.argv
+    iface = MagicMock(autospec=SerialInterface)
+    iface.getNode.side_effect = lambda *args, **kwargs: Node(iface, "!12345678", noProto=True)
+    with patch("meshtastic.serial_interface.SerialInterface", return_value=iface):
+        with patch.object(Node, "_sendAdmin", autospec=True) as sendAdmin:
+            main()
+    out, _ = capsys.readouterr()
+    assert "Writing lora configuration to device" in out
+    assert iface.getNode.call_count == 1
+    sent = [call.args[1] for call in sendAdmin.call_args_list]
+    assert [p.WhichOneof("payload_variant") for p in sent] == [
+        "begin_edit_settings", "set_config", "commit_edit_settings"
+    ]
+    assert sent[1].set_config.lora.hop_limit == 5
+
+
 @pytest.mark.unit
 @pytest.mark.usefixtures("reset_mt_config")
 def test_main_ch_add_valid(capsys):
@@ -2801,3 +2828,136 @@ def test_main_set_ham_empty_string(capsys):
     out, _ = capsys.readouterr()
     assert "ERROR: Ham radio callsign cannot be empty or contain only whitespace characters" in out
     assert excinfo.value.code == 1
+
+
+@pytest.mark.unit
+def test_main_import_is_lazy():
+    """Test that starting the CLI does not import the dependencies of optional features"""
+    heavy = ["bleak", "meshtastic.ble_interface", "meshtastic.powermon", "meshtastic.slog", "meshtastic.test",
+             "numpy", "pyarrow", "pyqrcode", "requests", "tabulate", "yaml"]
+    code = f"import sys, meshtastic.__main__; print([m for m in {heavy!r} if m in sys.modules])"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_daemon(tmp_path):
+    """Test that --daemon runs commands against the one interface, without letting them close it"""
+    sock = str(tmp_path / "d.sock")
+    sys.argv = ["", "--daemon", sock]
+    mt_config.args = sys.argv
+    iface = MagicMock(autospec=SerialInterface)
+    iface.showInfo.side_effect = lambda: print("inside mocked showInfo")
+    results = []
+
+    class FakeServer:
+        """Runs some commands instead of listening"""
+
+        def __init__(self, path, runCommand):
+            assert path == sock
+            self.runCommand = runCommand
+
+        def serve_forever(self):
+            """Run the commands"""
+            results.append(self.runCommand(["--info"]))
+            assert not iface.close.called
+            results.append(self.runCommand(["--listen"]))
+            results.append(self.runCommand(["--no-such-option"]))
+
+        def server_close(self):
+            """Nothing to close"""
+
+    with patch("meshtastic.serial_interface.SerialInterface", return_value=iface):
+        with patch("meshtastic.daemon.CommandServer", FakeServer):
+            main()
+    assert results[0][0] == 0
+    assert "Connected to radio" in results[0][1] and "inside mocked showInfo" in results[0][1]
+    assert results[1] == (2, "--listen can not be used with --via-daemon\n")
+    assert results[2][0] == 2 and "unrecognized arguments" in results[2][1]
+    assert mt_config.args.daemon == sock  # the daemon's own arguments are back
+    iface.close.assert_called_once()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_via_daemon(tmp_path, capsys):
+    """Test that --via-daemon hands the command line to the daemon and exits with its status"""
+    from meshtastic.daemon import CommandServer  # pylint: disable=C0415
+
+    sock = str(tmp_path / "d.sock")
+    server = CommandServer(sock, lambda argv: (3, f"ran {argv}\n"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        sys.argv = ["", "--via-daemon", sock, "--info"]
+        mt_config.args = sys.argv
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            main()
+        assert pytest_wrapped_e.value.code == 3
+        out, _ = capsys.readouterr()
+        assert out == f"ran ['--via-daemon', '{sock}', '--info']\n"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        main()
+    assert pytest_wrapped_e.value.code == 1
+    out, _ = capsys.readouterr()
+    assert "Could not run the command in the daemon" in out
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_batch(tmp_path, capsys):
+    """Test that --batch runs the steps over one connection and reports them as JSON"""
+    script = tmp_path / "batch.yaml"
+    script.write_text("- --info\n- --listen\n- --info\n", encoding="utf8")
+    sys.argv = ["", "--batch", str(script)]
+    mt_config.args = sys.argv
+    iface = MagicMock(autospec=SerialInterface)
+    iface.showInfo.side_effect = lambda: print("inside mocked showInfo")
+
+    with patch("meshtastic.serial_interface.SerialInterface", return_value=iface) as mo:
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            main()
+    assert pytest_wrapped_e.value.code == 1
+    mo.assert_called_once()
+    iface.close.assert_called_once()
+    out, _ = capsys.readouterr()
+    report = json.loads(out.strip())
+    assert [(s["ok"], s.get("skipped", False)) for s in report["steps"]] == [(True, False), (False, False), (False, True)]
+    assert "inside mocked showInfo" in report["steps"][0]["output"]
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_listen_jsonl(capsys):
+    """Test that --listen --format jsonl writes received packets as JSON lines, and nothing else"""
+    sys.argv = ["", "--listen", "--format", "jsonl", "--listen-fields", "from,decoded.text", "--flush-interval", "0"]
+    mt_config.args = sys.argv
+    iface = MagicMock(autospec=SerialInterface)
+
+    def receive(seconds):
+        pub.sendMessage("meshtastic.receive", packet={"from": 1, "decoded": {"text": "hi"}}, interface=iface)
+        raise KeyboardInterrupt()
+
+    with patch("meshtastic.serial_interface.SerialInterface", return_value=iface):
+        with patch("time.sleep", side_effect=receive):
+            main()
+    out, _ = capsys.readouterr()
+    assert out == '{"from":1,"decoded.text":"hi"}\n'
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_main_jsonl_needs_listen(capsys):
+    """Test that --format jsonl without --listen is refused instead of silently printing nothing"""
+    sys.argv = ["", "--info", "--format", "jsonl"]
+    mt_config.args = sys.argv
+    with pytest.raises(SystemExit) as excinfo:
+        main()
+    assert excinfo.value.code == 2
+    out, _ = capsys.readouterr()
+    assert "--format jsonl can only be used with --listen" in out
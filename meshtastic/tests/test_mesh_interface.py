@@ -7,8 +7,8 @@ from unittest.mock import MagicMock, patch
 import pytest
 from hypothesis import given, strategies as st
 
-from ..protobuf import mesh_pb2, config_pb2
-from .. import BROADCAST_ADDR, LOCAL_ADDR
+from ..protobuf import channel_pb2, mesh_pb2, config_pb2
+from .. import BROADCAST_ADDR, LOCAL_ADDR, NODELESS_WANT_CONFIG_ID
 from ..mesh_interface import MeshInterface, _timeago
 from ..node import Node
 try:
@@ -335,6 +335,73 @@ def test_handleFromRadio_with_node_info_tbeam_with_bad_data(caplog):
         iface._handleFromRadio(from_radio_bytes)
 
 
+@pytest.mark.unit
+@pytest.mark.usefixtures("reset_mt_config")
+def test_warm_start_from_snapshot(tmp_path):
+    """Test that a snapshot is restored on connect and reconciled with the background node DB download"""
+
+    def fromRadio(**kwargs):
+        f = mesh_pb2.FromRadio(**kwargs)
+        return f.SerializeToString()
+
+    myInfo = mesh_pb2.MyNodeInfo(my_node_num=1)
+    nodes = [mesh_pb2.NodeInfo(num=n, user=mesh_pb2.User(id=f"!{n:08x}", short_name=f"N{n}")) for n in (1, 2, 3)]
+
+    # first connection: no snapshot yet, so a normal full download, which gets saved
+    iface = MeshInterface(noProto=True, snapshotDir=str(tmp_path))
+    iface._startConfig()
+    assert iface.configId != NODELESS_WANT_CONFIG_ID
+    iface._handleFromRadio(fromRadio(my_info=myInfo))
+    for n in nodes:
+        iface._handleFromRadio(fromRadio(node_info=n))
+    iface._handleFromRadio(fromRadio(config_complete_id=iface.configId))
+    assert iface.isConnected.is_set()
+    iface.close()
+    assert (tmp_path / "nodedb-00000001.bin").exists()
+
+    # another device: there is a snapshot, but not of it, so we ask for everything once the nodeless download
+    # (which must not be mixed up with the full one) is over
+    iface = MeshInterface(noProto=True, snapshotDir=str(tmp_path))
+    iface._startConfig()
+    assert iface.configId == NODELESS_WANT_CONFIG_ID
+    iface._handleFromRadio(fromRadio(my_info=mesh_pb2.MyNodeInfo(my_node_num=9)))
+    assert iface.configId == NODELESS_WANT_CONFIG_ID
+    iface._handleFromRadio(fromRadio(channel=channel_pb2.Channel(index=0)))
+    iface._handleFromRadio(fromRadio(config_complete_id=NODELESS_WANT_CONFIG_ID))
+    assert not iface.isConnected.is_set()
+    assert iface.configId != NODELESS_WANT_CONFIG_ID
+    iface._handleFromRadio(fromRadio(node_info=nodes[0]))
+    iface._handleFromRadio(fromRadio(channel=channel_pb2.Channel(index=0)))
+    iface._handleFromRadio(fromRadio(config_complete_id=iface.configId))
+    assert iface.isConnected.is_set()
+    assert sorted(iface.nodesByNum) == [1]
+    assert [c.index for c in iface.localNode.channels] == list(range(8))  # not two channel 0s
+    iface.close()
+    assert (tmp_path / "nodedb-00000009.bin").exists()
+
+    # reconnecting to a device we know to have no snapshot is a cold start
+    (tmp_path / "nodedb-00000009.bin").unlink()
+    iface._startConfig()
+    assert iface.configId != NODELESS_WANT_CONFIG_ID
+
+    # second connection: the nodes are back as soon as we know which device we talk to
+    iface = MeshInterface(noProto=True, snapshotDir=str(tmp_path))
+    iface._startConfig()
+    iface._handleFromRadio(fromRadio(my_info=myInfo))
+    assert sorted(iface.nodesByNum) == [1, 2, 3]
+    assert iface.nodes["!00000002"]["user"]["shortName"] == "N2"
+    iface._handleFromRadio(fromRadio(node_info=nodes[0]))
+    iface._handleFromRadio(fromRadio(config_complete_id=NODELESS_WANT_CONFIG_ID))
+    assert iface.isConnected.is_set()
+
+    # node 3 was dropped from the device DB in the meantime
+    iface._handleFromRadio(fromRadio(node_info=nodes[0]))
+    iface._handleFromRadio(fromRadio(node_info=nodes[1]))
+    iface._handleFromRadio(fromRadio(config_complete_id=iface.configId))
+    assert sorted(iface.nodesByNum) == [1, 2]
+    iface.close()
+
+
 @pytest.mark.unit
 @pytest.mark.usefixtures("reset_mt_config")
 def test_MeshInterface_sendToRadioImpl(caplog):
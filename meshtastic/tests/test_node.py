@@ -2,6 +2,7 @@
 
 import logging
 import re
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -11,6 +12,7 @@ from ..protobuf.channel_pb2 import Channel # pylint: disable=E0611
 from ..node import Node
 from ..serial_interface import SerialInterface
 from ..mesh_interface import MeshInterface
+from ..nodedb import SessionKeyCache
 
 # from ..config_pb2 import Config
 # from ..cannedmessages_pb2 import (CannedMessagePluginMessagePart1, CannedMessagePluginMessagePart2,
@@ -1430,6 +1432,8 @@ def test_requestChannels_non_localNode_starting_index(caplog):
 def test_set_favorite(favorite):
     """Test setFavorite"""
     iface = MagicMock(autospec=SerialInterface)
+    iface.sessionKeys = SessionKeyCache()
+    iface.sessionKeys.put(12345678, b"passkey")  # no need to ask for one first
     node = Node(iface, 12345678)
     amesg = admin_pb2.AdminMessage()
     with patch("meshtastic.admin_pb2.AdminMessage", return_value=amesg):
@@ -1443,6 +1447,8 @@ def test_set_favorite(favorite):
 def test_remove_favorite(favorite):
     """Test setFavorite"""
     iface = MagicMock(autospec=SerialInterface)
+    iface.sessionKeys = SessionKeyCache()
+    iface.sessionKeys.put(12345678, b"passkey")  # no need to ask for one first
     node = Node(iface, 12345678)
     amesg = admin_pb2.AdminMessage()
     with patch("meshtastic.admin_pb2.AdminMessage", return_value=amesg):
@@ -1457,6 +1463,8 @@ def test_remove_favorite(favorite):
 def test_set_ignored(ignored):
     """Test setFavorite"""
     iface = MagicMock(autospec=SerialInterface)
+    iface.sessionKeys = SessionKeyCache()
+    iface.sessionKeys.put(12345678, b"passkey")  # no need to ask for one first
     node = Node(iface, 12345678)
     amesg = admin_pb2.AdminMessage()
     with patch("meshtastic.admin_pb2.AdminMessage", return_value=amesg):
@@ -1470,6 +1478,8 @@ def test_set_ignored(ignored):
 def test_remove_ignored(ignored):
     """Test setFavorite"""
     iface = MagicMock(autospec=SerialInterface)
+    iface.sessionKeys = SessionKeyCache()
+    iface.sessionKeys.put(12345678, b"passkey")  # no need to ask for one first
     node = Node(iface, 12345678)
     amesg = admin_pb2.AdminMessage()
     with patch("meshtastic.admin_pb2.AdminMessage", return_value=amesg):
@@ -1560,3 +1570,29 @@ def test_setOwner_valid_names(caplog):
 #    anode._timeout = Timeout(0.01)
 #    result = anode.waitForConfig()
 #    assert not result
+
+
+@pytest.mark.unit
+def test_sessionKeys_used_and_refreshed():
+    """Test that admin messages carry the cached passkey, and a new one is only asked for when needed"""
+    iface = MagicMock(autospec=SerialInterface)
+    iface.sessionKeys = SessionKeyCache()
+    anode = Node(iface, "!12345678")
+    anode.requestConfig = MagicMock()
+    anode.ensureSessionKey()
+    anode.requestConfig.assert_called_once_with(admin_pb2.AdminMessage.SESSIONKEY_CONFIG)
+
+    iface.sessionKeys.put(0x12345678, b"passkey")
+    anode.requestConfig.reset_mock()
+    anode.ensureSessionKey()
+    anode.requestConfig.assert_not_called()
+    p = admin_pb2.AdminMessage()
+    anode._sendAdmin(p)
+    assert p.session_passkey == b"passkey"
+
+    # about to expire: ask again, but keep using it meanwhile
+    iface.sessionKeys.remove(0x12345678)
+    iface.sessionKeys.put(0x12345678, b"passkey", now=time.time() - 250)
+    anode.ensureSessionKey()
+    anode.requestConfig.assert_called_once()
+    assert iface.sessionKeys.get(0x12345678) == b"passkey"
@@ -0,0 +1,197 @@
+"""Meshtastic unit tests for the channel and config downloads and config sessions of node.py"""
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..protobuf import admin_pb2
+from ..protobuf.channel_pb2 import Channel # pylint: disable=E0611
+from ..node import Node
+from ..serial_interface import SerialInterface
+
+
+def _channelResponse(requestId, index):
+    """A get_channel_response packet, as our response handlers see it"""
+    msg = admin_pb2.AdminMessage()
+    msg.get_channel_response.index = index
+    msg.get_channel_response.role = Channel.Role.SECONDARY if index else Channel.Role.PRIMARY
+    return {"decoded": {"portnum": "ADMIN_APP", "requestId": requestId, "admin": {"raw": msg}}}
+
+
+def _pipelinedNode():
+    """A remote node whose channel requests get consecutive packet ids"""
+    iface = MagicMock(autospec=SerialInterface)
+    anode = Node(iface, "!12345678")
+    sent = []
+
+    def sendAdmin(p, **_kwargs):
+        packet = MagicMock()
+        packet.id = 1000 + len(sent)
+        sent.append((packet.id, p.get_channel_request - 1))
+        return packet
+
+    anode._sendAdmin = sendAdmin
+    return anode, sent
+
+
+@pytest.mark.unit
+def test_requestChannels_pipelined():
+    """Test that a window of channel requests is kept in flight and answers are used in any order"""
+    anode, sent = _pipelinedNode()
+    anode.requestChannels(window=3)
+    assert sent == [(1000, 0), (1001, 1), (1002, 2)]
+
+    # channel 0 comes without an index, the request id tells us what it is
+    anode.onResponseRequestChannel(_channelResponse(1002, 2))
+    anode.onResponseRequestChannel(_channelResponse(1000, 0))
+    assert [c.index for c in anode.partialChannels] == [0, 2]
+    assert sent[3:] == [(1003, 3), (1004, 4)]
+    anode.onResponseRequestChannel(_channelResponse(1000, 0))  # duplicates are ignored
+    assert len(anode.partialChannels) == 2
+
+    # a retry only asks for what is missing
+    anode.requestChannels(startingIndex=2, window=3)
+    assert sent[5:] == [(1005, 1), (1006, 3), (1007, 4)]
+    for requestId, index in list(sent[5:]):
+        anode.onResponseRequestChannel(_channelResponse(requestId, index))
+    assert sent[8:] == [(1008, 5), (1009, 6), (1010, 7)]
+    for requestId, index in list(sent[8:]):
+        anode.onResponseRequestChannel(_channelResponse(requestId, index))
+    assert [c.index for c in anode.channels] == list(range(8))
+    assert len(sent) == 11
+
+
+@pytest.mark.unit
+def test_requestChannels_pipelined_only_acked():
+    """Test that a channel request that is only ACKed is retried a limited number of times"""
+    anode, sent = _pipelinedNode()
+    anode._timeout = MagicMock()
+    anode._timeout.expireTime = None
+    anode.requestChannels(window=3)
+    assert sent == [(1000, 0), (1001, 1), (1002, 2)]
+
+    def ack(requestId):
+        anode.onResponseRequestChannel(
+            {"decoded": {"portnum": "ROUTING_APP", "routing": {"errorReason": "NONE"}, "requestId": requestId}}
+        )
+
+    ack(1001)
+    assert sent[3:] == [(1003, 1)]
+    assert anode._timeout.expireTime is None
+    ack(1003)
+    assert len(sent) == 4
+    assert anode._timeout.expireTime is not None
+    ack(1003)  # an ACK for a request we gave up on changes nothing
+    assert len(sent) == 4
+
+
+@pytest.mark.unit
+def test_configSections():
+    """Test that the config sections map to the right admin config types"""
+    sections = {name: (isModule, configType) for name, isModule, configType in Node(MagicMock(), 1).configSections()}
+    assert sections["security"] == (False, admin_pb2.AdminMessage.ConfigType.SECURITY_CONFIG)
+    assert sections["lora"] == (False, admin_pb2.AdminMessage.ConfigType.LORA_CONFIG)
+    assert sections["external_notification"] == (True, admin_pb2.AdminMessage.ModuleConfigType.EXTNOTIF_CONFIG)
+    assert sections["store_forward"] == (True, admin_pb2.AdminMessage.ModuleConfigType.STOREFORWARD_CONFIG)
+    assert sections["canned_message"] == (True, admin_pb2.AdminMessage.ModuleConfigType.CANNEDMSG_CONFIG)
+    assert "version" not in sections
+    # every module config type is requested
+    assert sorted(t for isModule, t in sections.values() if isModule) == sorted(
+        admin_pb2.AdminMessage.ModuleConfigType.values()
+    )
+
+
+@pytest.mark.unit
+def test_fetchAllConfig():
+    """Test that fetchAllConfig() keeps a window of requests in flight and reports what failed"""
+    anode = Node(MagicMock(autospec=SerialInterface), "!12345678")
+    anode._timeout.sleepInterval = 0.001
+    sent = []
+    maxInFlight = [0]
+    answered = set()
+
+    def sendAdmin(p, onResponse=None, **_kwargs):
+        packet = MagicMock()
+        packet.id = len(sent) + 1
+        sent.append((packet.id, p, onResponse))
+        maxInFlight[0] = max(maxInFlight[0], len(sent) - len(answered))
+        return packet
+
+    def answer():
+        # answer what was sent so far, out of order, NAKing the first lora request and never answering mqtt
+        for requestId, req, onResponse in reversed(list(sent)):
+            if requestId in answered:
+                continue
+            answered.add(requestId)
+            which = req.WhichOneof("payload_variant")
+            resp = admin_pb2.AdminMessage()
+            if which == "get_config_request":
+                name = admin_pb2.AdminMessage.ConfigType.Name(req.get_config_request)[:-7].lower()
+                if name == "lora" and requestId < 10:
+                    onResponse({"decoded": {"requestId": requestId, "routing": {"errorReason": "TIMEOUT"}}})
+                    continue
+                getattr(resp.get_config_response, name).SetInParent()
+                if name == "lora":
+                    resp.get_config_response.lora.hop_limit = 5
+            elif req.get_module_config_request == admin_pb2.AdminMessage.ModuleConfigType.MQTT_CONFIG:
+                continue
+            else:
+                resp.get_module_config_response.telemetry.SetInParent()  # not what we asked for
+            onResponse({"decoded": {"requestId": requestId, "admin": {"raw": resp}}})
+
+    anode._sendAdmin = sendAdmin
+    done = threading.Event()
+
+    def respond():
+        while not done.is_set():
+            answer()
+            time.sleep(0.01)
+
+    responder = threading.Thread(target=respond)
+    responder.start()
+    try:
+        failed = anode.fetchAllConfig(window=3, timeout=1)
+    finally:
+        done.set()
+        responder.join()
+    assert maxInFlight[0] <= 3
+    assert anode.localConfig.lora.hop_limit == 5
+    assert "lora" not in failed
+    assert "mqtt" in failed
+    assert "serial" in failed and "telemetry" not in failed
+    assert len(sent) == len(anode.configSections()) + 1  # lora was asked for twice
+
+
+@pytest.mark.unit
+def test_configSession_writes_only_changes():
+    """Test that a config session writes only the changed sections and channels, in a transaction"""
+    anode = Node(MagicMock(autospec=SerialInterface), "!12345678", noProto=True)
+    anode.localConfig.lora.hop_limit = 3
+    anode.localConfig.display.screen_on_secs = 10
+    anode.channels = [Channel(index=0), Channel(index=1)]
+    calls = []
+    anode.beginSettingsTransaction = lambda: calls.append("begin")
+    anode.commitSettingsTransaction = lambda: calls.append("commit")
+    anode.writeConfig = MagicMock(side_effect=calls.append)
+    anode.writeChannel = MagicMock(side_effect=calls.append)
+
+    session = anode.configSession()
+    assert session.commit() == ([], [], {})
+    assert not calls
+
+    anode.localConfig.lora.hop_limit = 5
+    anode.localConfig.display.screen_on_secs = 10  # same value, not a change
+    anode.moduleConfig.mqtt.enabled = False  # section we did not have, written even though it is default
+    anode.channels[1].settings.name = "admin"
+    changes = session.commit()
+    assert calls == ["begin", "lora", "mqtt", 1, "commit"]
+    assert changes.sections == ["lora", "mqtt"]
+    assert changes.channels == [1]
+    assert changes.fields == {"lora.hop_limit": (3, 5), "channels.1.settings.name": (None, "admin")}
+
+    calls.clear()
+    with anode.configSession():
+        anode.localConfig.display.screen_on_secs = 20
+    assert calls == ["begin", "display", "commit"]
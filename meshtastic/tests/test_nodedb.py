@@ -0,0 +1,242 @@
+"""Meshtastic unit tests for nodedb.py"""
+
+import time
+
+import pytest
+
+from ..mesh_interface import MeshInterface
+from ..nodedb import (NodeChange, NodeChangeCoalescer, NodeDB, SessionKeyCache, diffNodeInfo, readSnapshot,
+                      summarizePacket, writeSnapshot)
+from ..protobuf import mesh_pb2
+
+
+@pytest.mark.unit
+def test_NodeDB_getOrCreate_is_placeholder():
+    """Test that placeholder nodes are only indexed by number"""
+    db = NodeDB()
+    info = db.getOrCreate(123)
+    assert info["user"]["id"] == "!0000007b"
+    assert db.get(123) is info
+    assert 123 in db.byNum
+    assert "!0000007b" not in db.byId
+    assert len(db) == 1
+
+
+@pytest.mark.unit
+def test_NodeDB_update_indexes():
+    """Test that update() maintains the ID and short name indexes"""
+    db = NodeDB()
+    db.update(1, {"user": {"id": "!00000001", "shortName": "AAA"}})
+    db.update(2, {"user": {"id": "!00000002", "shortName": "AAA"}})
+    assert db.getById("!00000001")["num"] == 1
+    assert sorted(n["num"] for n in db.getByShortName("AAA")) == [1, 2]
+
+    db.update(2, {"user": {"id": "!00000022", "shortName": "BBB"}})
+    assert db.getById("!00000002") is None
+    assert db.getById("!00000022")["num"] == 2
+    assert [n["num"] for n in db.getByShortName("AAA")] == [1]
+    assert [n["num"] for n in db.getByShortName("BBB")] == [2]
+
+
+@pytest.mark.unit
+def test_NodeDB_nodesByLastHeard():
+    """Test the lastHeard ordering"""
+    db = NodeDB()
+    db.update(1, {"lastHeard": 100})
+    db.update(2, {"lastHeard": 300})
+    db.update(3, {"lastHeard": 200})
+    db.getOrCreate(4)
+    assert [n["num"] for n in db.nodesByLastHeard()] == [2, 3, 1, 4]
+    db.update(1, {"lastHeard": 400})
+    assert [n["num"] for n in db.nodesByLastHeard(limit=2)] == [1, 2]
+
+
+@pytest.mark.unit
+def test_NodeDB_remove():
+    """Test remove()"""
+    db = NodeDB()
+    db.update(1, {"user": {"id": "!00000001", "shortName": "AAA"}, "lastHeard": 100})
+    assert db.remove(1)["num"] == 1
+    assert db.remove(1) is None
+    assert len(db.byId) == 0
+    assert db.getByShortName("AAA") == []
+    assert db.nodesByLastHeard() == []
+
+
+@pytest.mark.unit
+def test_NodeDB_views_are_read_only():
+    """Test that byNum and byId can not be written to"""
+    db = NodeDB()
+    db.update(1, {"user": {"id": "!00000001"}})
+    with pytest.raises(TypeError):
+        db.byId["!00000002"] = {}  # type: ignore[index]  # pylint: disable=E1137
+    assert dict(db.byNum) == {1: db.get(1)}
+
+
+@pytest.mark.unit
+def test_MeshInterface_nodes_setters():
+    """Test that assigning plain dictionaries to nodes/nodesByNum still works"""
+    iface = MeshInterface(noProto=True)
+    assert iface.nodes is None
+    node = {"num": 2475227164, "user": {"id": "!9388f81c", "shortName": "?1C"}}
+    iface.nodes = {"!9388f81c": node}
+    assert iface.nodesByNum[2475227164] is node
+    iface.nodesByNum = {2475227164: node}
+    assert iface.nodes["!9388f81c"] is node
+    assert iface.nodeDB.getByShortName("?1C") == [node]
+    iface.nodes = None
+    assert iface.nodesByNum is None
+    iface.close()
+
+
+@pytest.mark.unit
+def test_snapshot_roundtrip(tmp_path):
+    """Test writeSnapshot()/readSnapshot()"""
+    path = str(tmp_path / "nodedb.bin")
+    m1 = mesh_pb2.FromRadio()
+    m1.node_info.num = 1234
+    m1.node_info.user.id = "!000004d2"
+    m2 = mesh_pb2.FromRadio()
+    m2.channel.index = 1
+    writeSnapshot(path, [m1, m2])
+    assert readSnapshot(path) == [m1, m2]
+
+
+@pytest.mark.unit
+def test_snapshot_truncated(tmp_path):
+    """Test that truncated or foreign files are rejected"""
+    path = tmp_path / "nodedb.bin"
+    m = mesh_pb2.FromRadio()
+    m.node_info.num = 1234
+    writeSnapshot(str(path), [m])
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        readSnapshot(str(path))
+    path.write_bytes(b"garbage")
+    with pytest.raises(ValueError):
+        readSnapshot(str(path))
+
+
+@pytest.mark.unit
+def test_diffNodeInfo():
+    """Test diffNodeInfo() reports changed leaves by path and skips raw packets and secrets"""
+    old = {"position": {"latitude": 1.0, "longitude": 2.0}, "snr": 5, "lastReceived": {"id": 1}}
+    new = {"position": {"latitude": 1.5, "longitude": 2.0}, "snr": 5, "lastReceived": {"id": 2},
+           "deviceMetrics": {"batteryLevel": 90}, "adminSessionPassKey": b"secret"}
+    assert diffNodeInfo(old, new) == {
+        "position.latitude": (1.0, 1.5),
+        "deviceMetrics.batteryLevel": (None, 90),
+    }
+
+
+@pytest.mark.unit
+def test_NodeDB_onChange():
+    """Test that update() reports what it changed"""
+    db = NodeDB()
+    seen = []
+    db.onChange = lambda num, changes: seen.append((num, changes))
+    db.update(1, {"snr": 5})
+    db.update(1, {"snr": 5})  # no change, no report
+    db.update(1, {"snr": 6, "lastHeard": 100})
+    assert seen == [
+        (1, {"snr": (None, 5)}),
+        (1, {"snr": (5, 6), "lastHeard": (None, 100)}),
+    ]
+
+
+@pytest.mark.unit
+def test_NodeChangeCoalescer():
+    """Test that changes within a window are folded together"""
+    published = []
+    c = NodeChangeCoalescer(published.append, window=60)
+    c.add(1, {"snr": (None, 5)})
+    c.add(1, {"snr": (5, 6), "lastHeard": (None, 100)})
+    c.add(2, {"snr": (1, 2)})
+    c.add(2, {"snr": (2, 1)})  # back where it started
+    assert not published
+    c.flush()
+    assert published == [NodeChange(1, {"snr": (None, 6), "lastHeard": (None, 100)})]
+
+    c.window = 0
+    c.add(3, {"snr": (1, 2)})
+    assert published[-1] == NodeChange(3, {"snr": (1, 2)})
+
+
+@pytest.mark.unit
+def test_NodeDB_maxNodes_evicts_least_recently_updated():
+    """Test that maxNodes evicts the oldest nodes, but never kept nodes or favorites"""
+    db = NodeDB(maxNodes=3)
+    removed = []
+    db.onRemove = removed.append
+    db.keep.add(1)
+    db.update(1, {"snr": 1})
+    db.update(2, {"isFavorite": True})
+    db.update(3, {"snr": 3})
+    db.update(4, {"snr": 4})
+    assert sorted(db.byNum) == [1, 2, 4]
+    db.update(4, {"snr": 5})
+    db.getOrCreate(5)
+    assert sorted(db.byNum) == [1, 2, 5]
+    assert db.evictions == 2
+    assert removed == [3, 4]
+
+
+@pytest.mark.unit
+def test_NodeDB_maxAge_expires_nodes():
+    """Test that nodes not heard from in maxAge seconds are dropped"""
+    now = int(time.time())
+    db = NodeDB(maxAge=3600)
+    db.keep.add(1)
+    db.update(1, {"lastHeard": now - 100})
+    db.update(2, {"lastHeard": now - 100, "isFavorite": True})
+    db.update(3, {"lastHeard": now - 100})
+    db.update(4, {"lastHeard": now})
+    assert db.expire(now=now + 3550) == [3]
+    assert sorted(db.byNum) == [1, 2, 4]
+    db.update(5, {"lastHeard": now - 7200})  # the node being updated is never expired by its own update
+    assert sorted(db.byNum) == [1, 2, 4, 5]
+    db.update(4, {"lastHeard": now})  # updates only look for expired nodes once every expireInterval
+    assert sorted(db.byNum) == [1, 2, 4, 5]
+    db.expireInterval = 0
+    db.update(4, {"lastHeard": now})  # then they expire them against the current time
+    assert sorted(db.byNum) == [1, 2, 4]
+
+
+@pytest.mark.unit
+def test_summarizePacket():
+    """Test that the packet summary drops payloads"""
+    packet = {"from": 1, "to": 2, "id": 3, "rxTime": 4, "rxSnr": 5.0, "raw": object(),
+              "decoded": {"portnum": "TEXT_MESSAGE_APP", "payload": b"hello", "text": "hello"}}
+    assert summarizePacket(packet) == {"from": 1, "to": 2, "id": 3, "rxTime": 4, "rxSnr": 5.0,
+                                       "portnum": "TEXT_MESSAGE_APP"}
+
+
+@pytest.mark.unitslow
+def test_NodeDB_bounded_with_many_nodes():
+    """Test that a bounded DB stays bounded with a large number of transient nodes"""
+    db = NodeDB(maxNodes=1000)
+    db.keep.add(0)
+    db.update(0, {"lastHeard": 0})
+    for num in range(1, 50000):
+        db.update(num, {"lastHeard": num, "snr": 1.0, "user": {"id": f"!{num:08x}", "shortName": f"{num % 0xFFFF:04x}"}})
+    assert len(db) == 1000
+    assert len(db.byId) == 999  # node 0 never sent a User
+    assert len(db._heardOrder) == 1000
+    assert 0 in db.byNum
+
+
+@pytest.mark.unit
+def test_SessionKeyCache_expiry():
+    """Test that passkeys expire counted from when they were first seen"""
+    keys = SessionKeyCache(lifetime=300, margin=60)
+    keys.put(1, b"")  # not a key
+    assert keys.get(1, now=0) is None
+    keys.put(1, b"a", now=0)
+    keys.put(1, b"a", now=200)  # the same key again is no younger
+    assert keys.get(1, now=200) == b"a"
+    assert not keys.needsRefresh(1, now=200)
+    assert keys.needsRefresh(1, now=250)
+    assert keys.get(1, now=300) is None
+    keys.put(1, b"b", now=300)
+    assert keys.get(1, now=500) == b"b"
+    assert keys.needsRefresh(2)
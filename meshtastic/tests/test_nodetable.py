@@ -0,0 +1,79 @@
+"""Meshtastic unit tests for nodetable.py"""
+
+import io
+import json
+
+import pytest
+
+from ..nodetable import NodeTable
+
+NODES = [
+    {"num": 1, "user": {"id": "!00000001", "longName": "One", "shortName": "ONE"}, "lastHeard": 100,
+     "deviceMetrics": {"batteryLevel": 101}},
+    {"num": 2, "user": {"id": "!00000002", "longName": "Two", "shortName": "TWO"}, "lastHeard": 300,
+     "position": {"latitude": 47.5, "longitude": -122.5}},
+    {"num": 0x1234ABCD, "snr": 5.5},
+]
+
+
+@pytest.mark.unit
+def test_NodeTable_select():
+    """Test sorting, filtering and paging"""
+    table = NodeTable()
+    assert [n["num"] for n in table.select(NODES)] == [2, 1, 0x1234ABCD]
+    assert [n["num"] for n in table.select(NODES, sortField="user.longName", reverse=False)] == [1, 2, 0x1234ABCD]
+    assert [n["num"] for n in table.select(NODES, where=lambda n: "user" in n, offset=1, limit=5)] == [1]
+    assert [n["num"] for n in table.select(NODES, sortField=None, limit=1)] == [1]
+
+
+@pytest.mark.unit
+def test_NodeTable_table():
+    """Test the formatted text table"""
+    table = NodeTable(["user.id", "user.shortName", "deviceMetrics.batteryLevel", "position.latitude"])
+    text = table.table(table.select(NODES))
+    assert table.headers == ["N", "ID", "AKA", "Battery", "Latitude"]
+    assert "Powered" in text
+    assert "47.5000°" in text
+    assert "!1234abcd" in text and "Meshtastic abcd" in text
+
+
+@pytest.mark.unit
+def test_NodeTable_machine_readable():
+    """Test that csv/jsonl keep the raw values"""
+    table = NodeTable(["user.id", "position.latitude", "snr"])
+    nodes = table.select(NODES)
+    assert table.render(nodes, "csv").splitlines() == [
+        "N,ID,Latitude,SNR",
+        "1,!00000002,47.5,",
+        "2,!00000001,,",
+        "3,,,5.5",
+    ]
+    rows = [json.loads(line) for line in table.render(nodes, "jsonl", start=11).splitlines()]
+    assert rows[0] == {"N": 11, "ID": "!00000002", "Latitude": 47.5, "SNR": None}
+    with pytest.raises(ValueError):
+        table.render(nodes, "xml")
+
+
+@pytest.mark.unit
+def test_NodeTable_arrow():
+    """Test the Arrow output"""
+    pa = pytest.importorskip("pyarrow")
+    table = NodeTable(["user.id", "snr"])
+    buf = io.BytesIO()
+    table.write(buf, table.select(NODES), "arrow")
+    result = pa.ipc.open_stream(buf.getvalue()).read_all()
+    assert result.column_names == ["N", "ID", "SNR"]
+    assert result.column("SNR").to_pylist() == [None, None, 5.5]
+
+
+@pytest.mark.unit
+def test_showNodes_formats(capsys, iface_with_nodes):
+    """Test showNodes() with the machine readable formats"""
+    iface = iface_with_nodes
+    assert iface.showNodes(showFields=["user.id"], printFmt="jsonl") is None
+    out, _ = capsys.readouterr()
+    assert json.loads(out.splitlines()[0]) == {"N": 1, "ID": "!9388f81c"}
+    iface.localNode.nodeNum = 2475227164
+    iface.showNodes(includeSelf=False, printFmt="csv")
+    out, _ = capsys.readouterr()
+    assert len(out.splitlines()) == 1
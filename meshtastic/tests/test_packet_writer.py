@@ -0,0 +1,60 @@
+"""Meshtastic unit tests for packet_writer.py"""
+
+import io
+import json
+
+import pytest
+
+from ..packet_writer import JsonlPacketWriter
+
+PACKET = {
+    "from": 1,
+    "to": 2,
+    "rxTime": 100,
+    "raw": object(),
+    "decoded": {"portnum": "TEXT_MESSAGE_APP", "payload": b"hi", "text": "hi", "bitfield": 0},
+}
+
+
+@pytest.mark.unit
+def test_JsonlPacketWriter_whole_packet():
+    """Test that packets are written compactly, without protobuf objects and (by default) payloads"""
+    out = io.StringIO()
+    w = JsonlPacketWriter(out, flushInterval=0)
+    w.write(PACKET)
+    assert out.getvalue() == ""  # still buffered
+    w.close()
+    assert out.getvalue() == '{"from":1,"to":2,"rxTime":100,"decoded":{"portnum":"TEXT_MESSAGE_APP","text":"hi","bitfield":0}}\n'
+
+    out = io.StringIO()
+    w = JsonlPacketWriter(out, payload=True, flushInterval=0)
+    w.write(PACKET)
+    w.close()
+    assert json.loads(out.getvalue())["decoded"]["payload"] == "aGk="
+
+
+@pytest.mark.unit
+def test_JsonlPacketWriter_fields_and_flushing():
+    """Test field selection and that full buffers are written out"""
+    out = io.StringIO()
+    w = JsonlPacketWriter(out, fields=["from", "decoded.portnum", "decoded.payload", "nope.nothing"],
+                          flushInterval=0, bufferSize=200)
+    for _ in range(10):
+        w.write(PACKET)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 9  # three ~75 character lines fill the buffer
+    assert json.loads(lines[0]) == {"from": 1, "decoded.portnum": "TEXT_MESSAGE_APP", "decoded.payload": "aGk="}
+    w.close()
+    assert len(out.getvalue().splitlines()) == w.count == 10
+
+
+@pytest.mark.unit
+def test_JsonlPacketWriter_selected_dictionaries_are_cleaned():
+    """Test that selecting a sub-dictionary leaves out protobuf objects and the payload, as for whole packets"""
+    out = io.StringIO()
+    w = JsonlPacketWriter(out, fields=["decoded"], flushInterval=0)
+    w.write({**PACKET, "decoded": {**PACKET["decoded"], "admin": {"raw": object(), "getConfigResponse": {}}}})
+    w.close()
+    assert json.loads(out.getvalue()) == {
+        "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": "hi", "bitfield": 0, "admin": {"getConfigResponse": {}}}
+    }
@@ -0,0 +1,96 @@
+"""Meshtastic unit tests for slog/slog.py"""
+
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from pubsub import pub  # type: ignore[import-untyped]
+
+from ..protobuf import mesh_pb2, portnums_pb2
+
+try:
+    # Depends upon pyarrow (and the rest of poetry's powermon group), not installed by default
+    from meshtastic.slog.runs import read_run
+    from meshtastic.slog.slog import PacketLogger, log_defs, log_regex, match_slog
+except ImportError:
+    pytest.skip("Can't import meshtastic.slog", allow_module_level=True)
+
+
+LINES = [
+    "DEBUG | 12:00:01 42 [Main] S:B:7,2.5.0.abcdef",
+    "INFO  | ??:??:?? 3 S:PM:0x1,",
+    "S:PM:12,some reason, with a comma ",
+    "S:PS:3",
+    "S:PS:-3",
+    "S:PS: 3",
+    "S:PS:3,",
+    "S:PS:",
+    "S:PS:007",
+    "S:PS:0x1F",
+    "S:PS:0XaBc",
+    "S:PS:0x",
+    "S:PS:0xg",
+    "S:PS:0b11",
+    "S:PS:١",
+    "S:B:1,,x",
+    "S:B:,x",
+    "S:B:1",
+    "S:B:1,\t",
+    "S:PM:S:PS:4",
+    "S:PS:4 S:nope",
+    "S:PS:4\nS:PS:5",
+    "line\nS:PS:5",
+    "S:ü:1",
+    "S:X:1",
+    "S::1",
+    "no structured log here",
+    "",
+]
+
+
+@pytest.mark.unit
+def test_match_slog_is_log_regex():
+    """Test that match_slog finds the same code and args as log_regex"""
+    for line in LINES:
+        m = log_regex.match(line)
+        assert match_slog(line) == (m.groups() if m else None), line
+
+
+@pytest.mark.unit
+def test_parse_args_is_parse():
+    """Test that the fast parser gives the same values as the parse library"""
+    for line in LINES:
+        m = log_regex.match(line)
+        if m and m.group(1) in log_defs:
+            d = log_defs[m.group(1)]
+            assert d.parse_args(m.group(2)) == d._parse_args_slow(m.group(2)), line
+    assert log_defs["B"].parse_args("7,2.5.0 ") == {"board_id": 7, "sw_version": "2.5.0"}
+    assert log_defs["PM"].parse_args("0x00000940,") == {"pm_mask": 0x940}
+    assert log_defs["PS"].parse_args("x") is None
+
+
+@pytest.mark.unit
+def test_PacketLogger(tmp_path):
+    """Test that the packets of our interface (and only those) are recorded"""
+    iface, other = MagicMock(), MagicMock()
+    logger = PacketLogger(iface, str(tmp_path))
+    rx = mesh_pb2.MeshPacket(to=0xFFFFFFFF, id=7, rx_time=1700000000, rx_snr=6.25, rx_rssi=-90, hop_start=3, hop_limit=2)
+    setattr(rx, "from", 0x1234)
+    rx.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    rx.decoded.payload = b"hello"
+    pub.sendMessage("meshtastic.receive.text", packet={"raw": rx, "rxMonotonic": time.monotonic() - 0.5}, interface=iface)
+    pub.sendMessage("meshtastic.receive.text", packet={"raw": rx}, interface=other)
+    pub.sendMessage("meshtastic.receive.text", packet={"raw": rx}, interface=iface)  # no rxMonotonic
+    tx = mesh_pb2.MeshPacket(to=0x1234, id=8, hop_limit=3, encrypted=b"abc")
+    pub.sendMessage("meshtastic.sent", packet={"to": 0x1234, "raw": tx}, interface=iface)
+    logger.close()
+
+    rows = read_run(str(tmp_path), "packets").to_pylist()
+    assert [r["direction"] for r in rows] == ["rx", "rx", "tx"]
+    assert rows[1]["id"] == 7 and rows[1]["decode_latency"] is None
+    rows.pop(1)
+    assert rows[0]["from"] == 0x1234 and rows[0]["id"] == 7 and rows[0]["portnum"] == 1
+    assert rows[0]["rx_snr"] == 6.25 and rows[0]["rx_rssi"] == -90 and rows[0]["payload_len"] == 5
+    assert 0.5 <= rows[0]["decode_latency"] < 5
+    assert rows[1]["to"] == 0x1234 and rows[1]["portnum"] is None and rows[1]["rx_snr"] is None
+    assert rows[1]["payload_len"] == 3 and rows[1]["decode_latency"] is None
@@ -0,0 +1,116 @@
+"""Meshtastic unit tests for slog/arrow.py"""
+
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+try:
+    # Depends upon pyarrow (and the rest of poetry's powermon group), not installed by default
+    import pyarrow as pa
+
+    from meshtastic.slog import arrow
+except ImportError:
+    pytest.skip("Can't import meshtastic.slog", allow_module_level=True)
+
+
+def readStream(path):
+    """Read a file written by ArrowWriter"""
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_stream(source).read_all()
+
+
+@pytest.mark.unit
+def test_ArrowWriter_learns_schema(tmp_path):
+    """Test that all rows get written, with the schema of the first row"""
+    path = tmp_path / "t.arrow"
+    w = arrow.ArrowWriter(str(path))
+    now = datetime.now()
+    for i in range(2500):
+        w.add_row({"time": now, "value": float(i)})
+    w.close()
+    t = readStream(path)
+    assert t.num_rows == 2500 == w.rows_written
+    assert t.schema.names == ["time", "value"]
+    assert t.column("value").to_pylist() == [float(i) for i in range(2500)]
+
+
+@pytest.mark.unit
+def test_ArrowWriter_flushes_by_time(tmp_path):
+    """Test that a trickle of rows is written without waiting for a full chunk, missing fields are null"""
+    path = tmp_path / "t.arrow"
+    w = arrow.ArrowWriter(str(path), flush_interval_secs=0.01)
+    w.set_schema(pa.schema([("a", pa.int32()), ("b", pa.string())]))
+    w.add_row({"a": 1})
+    w.add_row({"a": 2, "b": "x"})
+    deadline = time.time() + 5
+    while w.rows_written < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert w.rows_written == 2
+    w.close()
+    assert readStream(path).to_pylist() == [{"a": 1, "b": None}, {"a": 2, "b": "x"}]
+
+
+@pytest.mark.unit
+def test_FeatherWriter_readable_while_writing(tmp_path):
+    """Test that the feather file is compressed as it is written, and readable before (and after) close"""
+    base = str(tmp_path / "slog")
+    w = arrow.FeatherWriter(base, flush_interval_secs=0.2)  # long enough for the 1500 rows to be added first
+    for i in range(1500):
+        w.add_row({"value": i, "text": "the same text compresses well"})
+    deadline = time.time() + 5
+    while w.rows_written < 1500 and time.time() < deadline:
+        time.sleep(0.01)
+    assert arrow.read_table(base + ".feather").num_rows == 1500
+
+    # as if the process died half way through writing a batch
+    partial = str(tmp_path / "partial.feather")
+    with open(base + ".feather", "rb") as src, open(partial, "wb") as dst:
+        data = src.read()
+        dst.write(data[: len(data) - 20])
+    assert arrow.read_table(partial).num_rows == 1000
+
+    w.close()
+    assert pa.ipc.open_file(base + ".feather").num_record_batches == 2
+    t = arrow.read_table(base + ".feather")
+    assert t.column("value").to_pylist() == list(range(1500))
+    assert os.path.getsize(base + ".feather") < t.nbytes / 4
+    assert not os.path.exists(base + ".arrow")
+
+
+@pytest.mark.unit
+def test_FeatherWriter_discards_empty(tmp_path):
+    """Test that a writer that never got a row or schema leaves no file"""
+    base = str(tmp_path / "power")
+    arrow.FeatherWriter(base).close()
+    assert not os.listdir(tmp_path)
+
+
+@pytest.mark.unit
+def test_ArrowWriter_drops_only_bad_rows(tmp_path):
+    """Test that a row not matching the schema is dropped without losing the rest of its batch"""
+    path = tmp_path / "t.arrow"
+    w = arrow.ArrowWriter(str(path))
+    w.add_row({"a": 1})
+    w.add_row({"a": "not a number"})
+    w.add_row({"a": 3})
+    w.close()
+    assert w.rows_written == 2
+    assert readStream(path).column("a").to_pylist() == [1, 3]
+
+
+@pytest.mark.unit
+def test_ArrowWriter_close_survives_write_errors(tmp_path):
+    """Test that an unexpected error writing (e.g. a full disk) neither kills the writer thread nor hangs close"""
+    path = tmp_path / "t.arrow"
+
+    def diskFull():
+        raise OSError("No space left on device")
+
+    w = arrow.ArrowWriter(str(path))
+    w.add_row({"a": 1})
+    w._before_write = diskFull  # type: ignore[method-assign]
+    w.close()
+    assert w.rows_written == 0
+    assert not w._thread._thread.is_alive()
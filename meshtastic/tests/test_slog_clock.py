@@ -0,0 +1,91 @@
+"""Meshtastic unit tests for slog/clock.py"""
+
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+try:
+    # Depends upon pyarrow (and the rest of poetry's powermon group), not installed by default
+    import pyarrow as pa
+
+    from meshtastic.slog.clock import Clock, estimate_clock_offset, time_type
+    from meshtastic.slog import LogSet
+    from meshtastic.slog.runs import clock_offset, read_run
+    from meshtastic.slog.slog import PowerLogger
+except ImportError:
+    pytest.skip("Can't import meshtastic.slog", allow_module_level=True)
+
+
+@pytest.mark.unit
+def test_Clock():
+    """Test that the clock follows time.monotonic_ns from its wall clock anchor"""
+    clock = Clock()
+    before = time.monotonic_ns()
+    now = clock.now()
+    assert before + clock.offset_ns <= now <= time.monotonic_ns() + clock.offset_ns
+    assert abs(now - time.time_ns()) < 1e9
+    assert int(clock.metadata()["clock_wall_ns"]) - int(clock.metadata()["clock_monotonic_ns"]) == clock.offset_ns
+
+
+@pytest.mark.unit
+def test_PowerLogger_timestamps(tmp_path):
+    """Test that power readings are stamped in ns by the clock, with its anchor in the file"""
+    meter = MagicMock()
+    meter.get_average_current_mA.return_value = 20.0
+    meter.get_max_current_mA.return_value = 25.0
+    meter.get_min_current_mA.return_value = 15.0
+    clock = Clock()
+    logger = PowerLogger(meter, str(tmp_path / "power"), interval=0.001, clock=clock)
+    time.sleep(0.05)
+    logger.store_current_reading(clock.offset_ns + 1)
+    logger.close()
+    table = read_run(str(tmp_path), "power")
+    assert table.schema.field("time").type == time_type
+    assert table.schema.metadata[b"clock_wall_ns"] == str(clock.wall_ns).encode()
+    times = table.column("time").cast(pa.int64()).to_pylist()
+    assert clock.offset_ns + 1 in times
+    assert all(t > clock.wall_ns for t in times if t != clock.offset_ns + 1)
+
+
+@pytest.mark.unit
+def test_estimate_clock_offset():
+    """Test that the delay between power steps and the events causing them is found"""
+    start = 1_700_000_000_000_000_000
+    power_times, current = [], []
+    level = 10.0
+    for i in range(5000):  # 10s of readings every 2ms, the current changing every 500ms
+        if i % 250 == 0:
+            level = 10.0 if level > 50 else 100.0
+        power_times.append(start + i * 2_000_000)
+        current.append(level + (i % 3) * 0.1)
+    events = [start + i * 2_000_000 + 3_000_000 for i in range(250, 5000, 250)]  # stamped 3ms late
+    slog = pa.table(
+        {
+            "time": pa.array(events + [start + 1_000_000], time_type),
+            "ps_state": pa.array([1] * len(events) + [None], pa.uint32()),
+        }
+    )
+    power = pa.table({"time": pa.array(power_times, time_type), "average_mW": current})
+    offset = estimate_clock_offset(slog, power)
+    assert offset is not None
+    assert offset.offset_ns == 3_000_000 and offset.spread_ns == 0 and offset.events == len(events)
+    assert estimate_clock_offset(slog, power, min_step=1000) is None
+
+
+@pytest.mark.unit
+def test_LogSet_estimate_offset(tmp_path, caplog):
+    """Test that the clock anchor goes in the manifest, and the offset too if it can be estimated"""
+    meter = MagicMock()
+    meter.get_average_current_mA.return_value = 20.0
+    meter.get_max_current_mA.return_value = 20.0
+    meter.get_min_current_mA.return_value = 20.0
+    log_set = LogSet(MagicMock(), str(tmp_path), meter, include_packets=False, estimate_offset=True)
+    time.sleep(0.02)
+    log_set.close()
+    with open(tmp_path / "manifest.json", encoding="utf8") as f:
+        manifest = json.load(f)
+    assert manifest["clock"] == log_set.clock.metadata()
+    assert "Could not estimate" in caplog.text
+    assert clock_offset(str(tmp_path)) is None
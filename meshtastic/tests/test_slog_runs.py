@@ -0,0 +1,97 @@
+"""Meshtastic unit tests for slog/runs.py"""
+
+import json
+import os
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+try:
+    # Depends upon pyarrow (and the rest of poetry's powermon group), not installed by default
+    from pubsub import pub  # type: ignore[import-untyped]
+
+    from meshtastic.slog import LogSet, MultiLogSet
+    from meshtastic.slog.arrow import FeatherWriter
+    from meshtastic.slog.runs import Manifest, devices, prune_runs, read_capture, read_run, segment_files
+except ImportError:
+    pytest.skip("Can't import meshtastic.slog", allow_module_level=True)
+
+
+@pytest.mark.unit
+def test_FeatherWriter_rotates(tmp_path):
+    """Test that segments are started by size and recorded in the manifest, and a run reads back as one table"""
+    manifest = Manifest(str(tmp_path))
+    w = FeatherWriter(str(tmp_path / "power"), rotate_bytes=1, on_segment=lambda s: manifest.add_segment("power", s))
+    for i in range(3500):
+        w.add_row({"value": i})
+    w.close()
+    manifest.close()
+    assert [os.path.basename(f) for f in segment_files(str(tmp_path), "power")] == [
+        "power-00000.feather", "power-00001.feather", "power-00002.feather", "power-00003.feather"
+    ]
+    with open(tmp_path / "manifest.json", encoding="utf8") as f:
+        saved = json.load(f)
+    assert saved["closed"]
+    assert [s["rows"] for s in saved["streams"]["power"]] == [1000, 1000, 1000, 500]
+    assert read_run(str(tmp_path), "power").column("value").to_pylist() == list(range(3500))
+
+
+@pytest.mark.unit
+def test_LogSet_segments(tmp_path):
+    """Test that raw.txt is rotated by time, and that the segments are listed in the manifest"""
+    client = MagicMock()
+    log_set = LogSet(client, str(tmp_path), rotate_secs=0.05)
+    pub.sendMessage("meshtastic.log.line", line="DEBUG | ??:??:?? 1 [Main] S:PS:3", interface=client)
+    time.sleep(0.1)
+    pub.sendMessage("meshtastic.log.line", line="DEBUG | ??:??:?? 2 [Main] S:PS:4", interface=client)
+    log_set.close()
+    with open(tmp_path / "manifest.json", encoding="utf8") as f:
+        saved = json.load(f)
+    assert [s["file"] for s in saved["streams"]["raw"]] == ["raw-00000.txt", "raw-00001.txt"]
+    assert (tmp_path / "raw-00001.txt").read_text(encoding="utf8").endswith("S:PS:4\n")
+    assert read_run(str(tmp_path), "slog").column("ps_state").to_pylist() == [3, 4]
+
+
+@pytest.mark.unit
+def test_prune_runs(tmp_path):
+    """Test that old runs are deleted, but never the current one, one still open or unrelated directories"""
+    for i, name in enumerate(["a", "b", "c", "d"]):
+        run = tmp_path / name
+        run.mkdir()
+        (run / "raw.txt").write_text("x" * 100, encoding="utf8")
+        os.utime(run / "raw.txt", (time.time() - (4 - i) * 86400,) * 2)  # a is the oldest
+        os.utime(run, (0, 0))  # runs are judged by their files
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "notes.txt").write_text("keep me", encoding="utf8")
+    os.utime(tmp_path / "other", (0, 0))
+    (tmp_path / "open").mkdir()
+    Manifest(str(tmp_path / "open"))  # never closed, as if still being written
+    os.utime(tmp_path / "open" / "manifest.json", (0, 0))
+
+    assert prune_runs(str(tmp_path), keep_runs=3, keep=str(tmp_path / "a")) == [str(tmp_path / "b")]
+    assert prune_runs(str(tmp_path), max_age_days=1.5) == [str(tmp_path / "c"), str(tmp_path / "a")]
+    assert prune_runs(str(tmp_path), max_total_bytes=50) == [str(tmp_path / "d")]
+    assert sorted(os.listdir(tmp_path)) == ["open", "other"]
+
+
+@pytest.mark.unit
+def test_MultiLogSet(tmp_path):
+    """Test that the log lines of each device go to its own directory, and read back as one table"""
+    clients = {"dut1": MagicMock(), "dut2": MagicMock()}
+    run = tmp_path / "run"
+    capture = MultiLogSet(clients, str(run), writer_threads=1, include_packets=False)
+    for i in range(3):
+        for name, client in clients.items():
+            pub.sendMessage("meshtastic.log.line", line=f"{name} S:PS:{i}", interface=client)
+    pub.sendMessage("meshtastic.log.line", line="S:PS:9", interface=MagicMock())  # not one of ours
+    with pytest.raises(ValueError):
+        capture.add("dut1", MagicMock())
+    capture.close()
+
+    assert devices(str(run)) == ["dut1", "dut2"]
+    assert (run / "dut2" / "raw.txt").read_text(encoding="utf8") == "dut2 S:PS:0\ndut2 S:PS:1\ndut2 S:PS:2\n"
+    table = read_capture(str(run), "slog").sort_by("time")
+    assert table.column("device").to_pylist() == ["dut1", "dut2"] * 3
+    assert table.column("ps_state").to_pylist() == [0, 0, 1, 1, 2, 2]
+    assert prune_runs(str(tmp_path), keep_runs=0) == [str(run)]  # a multi device run is a run too
@@ -0,0 +1,74 @@
+"""Meshtastic unit tests for spatial.py"""
+
+import random
+
+import pytest
+
+from ..nodedb import NodeDB
+from ..spatial import SpatialIndex, distance_m
+
+
+def _randomIndex(count, seed=42):
+    rnd = random.Random(seed)
+    index = SpatialIndex()
+    points = {}
+    for num in range(count):
+        lat = rnd.uniform(47.0, 48.0)
+        lon = rnd.uniform(-123.0, -122.0)
+        index.update(num, lat, lon)
+        points[num] = (lat, lon)
+    return index, points
+
+
+@pytest.mark.unit
+def test_distance_m():
+    """Test distance_m() against a known distance (one degree of latitude)"""
+    assert distance_m(0, 0, 1, 0) == pytest.approx(111195, rel=1e-4)
+    assert distance_m(47.5, -122.3, 47.5, -122.3) == 0
+
+
+@pytest.mark.unit
+def test_nodes_within_matches_brute_force():
+    """Test nodes_within() finds exactly the nodes a full scan would"""
+    index, points = _randomIndex(2000)
+    result = index.nodes_within(47.5, -122.5, 5000)
+    expected = sorted(num for num, (lat, lon) in points.items() if distance_m(47.5, -122.5, lat, lon) <= 5000)
+    assert sorted(num for num, _ in result) == expected
+    distances = [d for _, d in result]
+    assert distances == sorted(distances)
+
+
+@pytest.mark.unit
+def test_nodes_in_bbox():
+    """Test nodes_in_bbox(), including boxes that cross the antimeridian"""
+    index, points = _randomIndex(2000)
+    expected = sorted(num for num, (lat, lon) in points.items() if 47.2 <= lat <= 47.3 and -122.6 <= lon <= -122.4)
+    assert sorted(index.nodes_in_bbox(47.2, -122.6, 47.3, -122.4)) == expected
+
+    index.update(5000, 10.0, 179.9)
+    index.update(5001, 10.0, -179.9)
+    assert sorted(index.nodes_in_bbox(9.0, 179.0, 11.0, -179.0)) == [5000, 5001]
+
+
+@pytest.mark.unit
+def test_nearest_matches_brute_force():
+    """Test nearest() against a full scan, including from outside the populated area"""
+    index, points = _randomIndex(2000)
+    for lat, lon in ((47.5, -122.5), (47.01, -122.99), (40.0, -100.0)):
+        expected = sorted(points, key=lambda n, lat=lat, lon=lon: distance_m(lat, lon, *points[n]))[:5]
+        assert [num for num, _ in index.nearest(lat, lon, 5)] == expected
+    assert index.nearest(47.5, -122.5, 0) == []
+
+
+@pytest.mark.unit
+def test_NodeDB_maintains_spatial_index():
+    """Test that the node DB keeps the spatial index in step with node positions"""
+    db = NodeDB()
+    db.update(1, {"position": {"latitude": 47.5, "longitude": -122.5}})
+    db.update(2, {"position": {"latitude": 47.6, "longitude": -122.5}})
+    assert [n for n, _ in db.spatial.nearest(47.61, -122.5, 1)] == [2]
+    db.update(2, {"position": {"latitude": 10.0, "longitude": 10.0}})
+    assert [n for n, _ in db.spatial.nodes_within(47.5, -122.5, 20000)] == [1]
+    db.update(1, {"position": {}})
+    db.remove(2)
+    assert len(db.spatial) == 0
@@ -0,0 +1,81 @@
+"""Meshtastic unit tests for timeseries.py"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+try:
+    # numpy comes with the analysis extra, it is not installed by default
+    import numpy as np
+
+    from meshtastic.timeseries import MetricRing, TelemetryStore
+except ImportError:
+    pytest.skip("Can't import numpy", allow_module_level=True)
+
+from .. import _onTelemetryReceive
+
+
+def _telemetry(num, t, **metrics):
+    return {"from": num, "rxTime": t + 1, "decoded": {"telemetry": {"time": t, "deviceMetrics": metrics}}}
+
+
+@pytest.mark.unit
+def test_MetricRing_wraps():
+    """Test that the ring keeps the newest samples in order, with NaN for missing metrics"""
+    ring = MetricRing(3)
+    ring.append(1, {"a": 1.0})
+    ring.append(2, {"b": 2.0})
+    times, columns = ring.window()
+    assert list(times) == [1, 2]
+    assert np.isnan(columns["a"][1]) and np.isnan(columns["b"][0])
+    for t in range(3, 6):
+        ring.append(t, {"a": float(t)})
+    times, columns = ring.window()
+    assert list(times) == [3, 4, 5]
+    assert list(columns["a"]) == [3.0, 4.0, 5.0]
+    times, columns = ring.window(since=4, names=["a"])
+    assert list(times) == [4, 5]
+    assert list(columns) == ["a"]
+
+
+@pytest.mark.unit
+def test_TelemetryStore_queries():
+    """Test mean(), rate() and battery_slope()"""
+    store = TelemetryStore()
+    for i in range(5):
+        store.add_packet(_telemetry(1, 1000000 + 3600 * i, batteryLevel=90 - 2 * i, voltage=4.0))
+        store.add_packet(_telemetry(2, 1000000 + 3600 * i, batteryLevel=101, channelUtilization=float(i)))
+        store.add_packet(_telemetry(3, 1000000 + 3600 * i, batteryLevel=0))
+    assert store.mean("deviceMetrics", "voltage") == {1: 4.0}
+    assert store.mean("deviceMetrics", "channelUtilization", since=1000000 + 3 * 3600) == {2: 3.5}
+    assert store.rate("deviceMetrics", "batteryLevel", nodes=[1]) == {1: pytest.approx(-2 / 3600)}
+    assert store.battery_slope() == {1: pytest.approx(-2.0)}  # nodes 2 and 3 are externally powered
+
+    store.remove(1)
+    store.remove(3)
+    assert store.nodes("deviceMetrics") == [2]
+
+
+@pytest.mark.unit
+def test_TelemetryStore_to_arrow():
+    """Test the Arrow export"""
+    pytest.importorskip("pyarrow")
+    store = TelemetryStore()
+    store.add_packet(_telemetry(1, 100, batteryLevel=50))
+    store.add_packet(_telemetry(2, 200, voltage=3.7))
+    table = store.to_arrow("deviceMetrics")
+    assert table.column_names == ["num", "time", "batteryLevel", "voltage"]
+    rows = table.to_pylist()
+    assert [r["num"] for r in rows] == [1, 2]
+    assert rows[0]["batteryLevel"] == 50 and rows[0]["voltage"] is None
+    assert store.to_arrow("powerMetrics").num_rows == 0
+
+
+@pytest.mark.unit
+def test_onTelemetryReceive_feeds_store(iface_with_nodes):
+    """Test that received telemetry is added to the interface's store"""
+    iface = iface_with_nodes
+    iface.telemetryStore = TelemetryStore()
+    iface.nodeDB.onChange = MagicMock()
+    _onTelemetryReceive(iface, _telemetry(2475227164, 100, batteryLevel=42))
+    assert iface.telemetryStore.mean("deviceMetrics", "batteryLevel") == {2475227164: 42.0}
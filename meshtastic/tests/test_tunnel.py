@@ -11,7 +11,7 @@ from meshtastic import mt_config
 from ..tcp_interface import TCPInterface
 try:
     # Depends upon pytap2, not installed by default
-    from ..tunnel import Tunnel, onTunnelReceive
+    from ..tunnel import Tunnel, onTunnelNodeRemoved, onTunnelNodeUpdated, onTunnelReceive
 except ImportError:
     pytest.skip("Can't import Tunnel or onTunnelReceive", allow_module_level=True)
 
@@ -276,3 +276,74 @@ def test_ipToNodeId_all(mock_platform_system, caplog, iface_with_nodes):
             tun = Tunnel(iface)
             nodeid = tun._ipToNodeId(b"\x00\x00\xff\xff")
             assert nodeid == "^all"
+
+
+@pytest.mark.unit
+@patch("platform.system")
+def test_ipToNodeId_indexed(mock_platform_system, iface_with_nodes):
+    """Test _ipToNodeId() finds nodes from the DB and ones announced via meshtastic.node.updated"""
+    iface = iface_with_nodes
+    iface.noProto = True
+    mock_platform_system.return_value = "Linux"
+    with patch("socket.socket"):
+        tun = Tunnel(iface)
+        assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") == "!9388f81c"
+        assert tun._ipToNodeId(b"\x0a\x73\x12\x34") is None
+        onTunnelNodeUpdated({"num": 0x11111234, "user": {"id": "!11111234"}}, iface)
+        assert tun._ipToNodeId(b"\x0a\x73\x12\x34") == "!11111234"
+        assert tun._nodeNumToIp(0x11111234) == "10.115.18.52"
+
+
+@pytest.mark.unit
+@patch("platform.system")
+def test_ipToNodeId_collision(mock_platform_system, caplog, iface_with_nodes):
+    """Test that nodes sharing the low 16 bits of their nodenum are reported, not guessed between"""
+    iface = iface_with_nodes
+    iface.noProto = True
+    mock_platform_system.return_value = "Linux"
+    with caplog.at_level(logging.WARNING):
+        with patch("socket.socket"):
+            tun = Tunnel(iface)
+            onTunnelNodeUpdated({"num": 0x1234f81c, "user": {"id": "!1234f81c"}}, iface)
+            assert re.search(r"IP address collision", caplog.text, re.MULTILINE)
+            assert tun.suffixCollisions() == {"10.115.248.28": ["!1234f81c", "!9388f81c"]}
+            assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") is None
+            assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") is None
+            assert caplog.text.count("Can not pick a node for 10.115.248.28") == 1  # warned once per suffix
+            onTunnelNodeRemoved(0x1234f81c, iface)
+            onTunnelNodeUpdated({"num": 0x5678f81c, "user": {"id": "!5678f81c"}}, iface)
+            assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") is None
+            assert caplog.text.count("Can not pick a node for 10.115.248.28") == 2  # a new collision warns again
+
+
+@pytest.mark.unit
+@patch("platform.system")
+def test_ipToNodeId_removed(mock_platform_system, iface_with_nodes):
+    """Test that nodes dropped from the node DB are dropped from the IP index and address cache"""
+    iface = iface_with_nodes
+    iface.noProto = True
+    mock_platform_system.return_value = "Linux"
+    with patch("socket.socket"):
+        tun = Tunnel(iface)
+        onTunnelNodeUpdated({"num": 0x1234f81c, "user": {"id": "!1234f81c"}}, iface)
+        onTunnelNodeRemoved(0x1234f81c, iface)
+        assert not tun.suffixCollisions()
+        assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") == "!9388f81c"
+        assert 0x1234f81c not in tun._ipCache
+        onTunnelNodeRemoved(0x9388f81c, iface)
+        assert tun._ipToNodeId(b"\x0a\x73\xf8\x1c") is None
+
+
+@pytest.mark.unit
+@patch("platform.system")
+def test_nodeNumToIp_cache_is_bounded(mock_platform_system, iface_with_nodes):
+    """Test that the IP address cache does not grow without limit"""
+    iface = iface_with_nodes
+    iface.noProto = True
+    mock_platform_system.return_value = "Linux"
+    with patch("socket.socket"):
+        tun = Tunnel(iface)
+        tun.ipCacheSize = 10
+        for num in range(100):
+            assert tun._nodeNumToIp(num) == f"10.115.0.{num}"
+        assert len(tun._ipCache) == 10
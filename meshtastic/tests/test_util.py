@@ -2,7 +2,9 @@
 
 import json
 import logging
+import random
 import re
+from decimal import Decimal
 from unittest.mock import patch
 
 import pytest
@@ -16,9 +18,11 @@ from meshtastic.util import (
     camel_to_snake,
     catchAndIgnore,
     convert_mac_addr,
+    degreesFromI,
     eliminate_duplicate_port,
     findPorts,
     fixme,
+    fixupPositions,
     fromPSK,
     fromStr,
     genPSK256,
@@ -670,3 +674,21 @@ def test_shorthex():
     assert result == b'\x05'
     result = fromStr('0xffff')
     assert result == b'\xff\xff'
+
+@given(st.integers(min_value=-(2**31), max_value=2**31 - 1))
+def test_fuzz_degreesFromI(value):
+    """Test that degreesFromI matches the Decimal based conversion bit for bit"""
+    assert degreesFromI(value).hex() == float(value * Decimal("1e-7")).hex()
+
+@pytest.mark.unit
+def test_degreesFromI_batch():
+    """Test the batch conversions against the Decimal based one"""
+    rnd = random.Random(1)
+    values = [rnd.randint(-1800000000, 1800000000) for _ in range(10000)]
+    expected = [float(v * Decimal("1e-7")) for v in values]
+    assert degreesFromI(values) == expected
+    positions = fixupPositions([{"latitudeI": v, "longitudeI": -v} for v in values])
+    assert [p["latitude"] for p in positions] == expected
+    assert [p["longitude"] for p in positions] == [-x for x in expected]
+    np = pytest.importorskip("numpy")
+    assert degreesFromI(np.array(values, dtype=np.int32)).tolist() == expected
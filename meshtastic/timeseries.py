@@ -0,0 +1,215 @@
+"""In memory time series of the telemetry received from each node.
+
+Needs numpy (installed with the analysis extra, e.g. `pip install meshtastic[analysis]`), to_arrow() also
+needs pyarrow (from the powermon group).
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None  # type: ignore[assignment]
+
+TELEMETRY_GROUPS = ("deviceMetrics", "environmentMetrics", "airQualityMetrics", "powerMetrics", "localStats")
+"""The Telemetry variants we keep history for"""
+
+POWERED_BATTERY_LEVEL = 100
+"""Battery levels above this (or of 0) mean the node is externally powered, as shown by showNodes"""
+
+
+class MetricRing:
+    """A fixed capacity ring buffer of samples for one node and one telemetry group.
+
+    Each metric is a float64 column (NaN where a sample did not include it), so queries are
+    plain numpy operations over the columns.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.columns: Dict[str, np.ndarray] = {}
+        self._next = 0  # where the next sample goes
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, t: float, values: Dict[str, float]) -> None:
+        """Add one sample"""
+        i = self._next
+        self.times[i] = t
+        for name, col in self.columns.items():
+            col[i] = values.get(name, np.nan)
+        for name in values.keys() - self.columns.keys():
+            col = np.full(self.capacity, np.nan, dtype=np.float64)
+            col[i] = values[name]
+            self.columns[name] = col
+        self._next = (i + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _ordered(self, a: np.ndarray) -> np.ndarray:
+        """Return the valid part of a column, oldest sample first"""
+        if self._count < self.capacity:
+            return a[: self._count]
+        return np.concatenate((a[self._next :], a[: self._next]))
+
+    def window(
+        self, since: Optional[float] = None, names: Optional[Iterable[str]] = None
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Return (times, {metric: values}) for the samples at or after since, oldest first (as copies)"""
+        if names is None:
+            names = list(self.columns)
+        times = self._ordered(self.times)
+        columns = {name: self._ordered(self.columns[name]) for name in names if name in self.columns}
+        if since is not None:
+            mask = times >= since
+            times = times[mask]
+            columns = {name: col[mask] for name, col in columns.items()}
+        elif self._count < self.capacity:
+            times = times.copy()
+            columns = {name: col.copy() for name, col in columns.items()}
+        return times, columns
+
+
+class TelemetryStore:
+    """Keeps the last `capacity` telemetry samples of each node, per telemetry group.
+
+    Attach one to an interface (iface.telemetryStore = TelemetryStore()) and every received
+    telemetry packet is added to it.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """Constructor
+
+        capacity (int): The number of samples kept per node and telemetry group
+        """
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[str, Dict[int, MetricRing]] = {group: {} for group in TELEMETRY_GROUPS}
+
+    def add(self, num: int, group: str, t: float, metrics: Dict) -> None:
+        """Add a sample of a telemetry group for a node, non numeric metrics are ignored"""
+        values = {
+            name: float(v) for name, v in metrics.items() if isinstance(v, (int, float))
+        }
+        if not values:
+            return
+        with self._lock:
+            rings = self._rings.setdefault(group, {})
+            ring = rings.get(num)
+            if ring is None:
+                ring = rings[num] = MetricRing(self.capacity)
+            ring.append(t, values)
+
+    def add_packet(self, packet: Dict) -> None:
+        """Add the telemetry from a received packet dictionary"""
+        telemetry = packet.get("decoded", {}).get("telemetry")
+        if not telemetry or "from" not in packet:
+            return
+        # prefer the time the node measured at, then when we got it
+        t = telemetry.get("time") or packet.get("rxTime") or time.time()
+        for group in TELEMETRY_GROUPS:
+            if group in telemetry:
+                self.add(packet["from"], group, t, telemetry[group])
+
+    def nodes(self, group: str) -> List[int]:
+        """Return the nodes we have samples of a telemetry group for"""
+        with self._lock:
+            return list(self._rings.get(group, {}))
+
+    def remove(self, num: int) -> None:
+        """Forget the history of a node"""
+        with self._lock:
+            for rings in self._rings.values():
+                rings.pop(num, None)
+
+    def clear(self) -> None:
+        """Forget everything"""
+        with self._lock:
+            for rings in self._rings.values():
+                rings.clear()
+
+    def series(
+        self, num: int, group: str, metric: str, since: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (times, values) of one metric of a node, oldest first, skipping samples without it"""
+        with self._lock:
+            ring = self._rings.get(group, {}).get(num)
+            if ring is None:
+                return np.empty(0), np.empty(0)
+            times, columns = ring.window(since, (metric,))
+        values = columns.get(metric)
+        if values is None:
+            return np.empty(0), np.empty(0)
+        valid = ~np.isnan(values)
+        return times[valid], values[valid]
+
+    def _all_series(self, group: str, metric: str, since: Optional[float], nodes: Optional[Iterable[int]]):
+        """Yield (num, times, values) for every node with samples of metric"""
+        for num in list(nodes) if nodes is not None else self.nodes(group):
+            times, values = self.series(num, group, metric, since)
+            if len(values):
+                yield num, times, values
+
+    def mean(self, group: str, metric: str, since: Optional[float] = None,
+             nodes: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        """Return the average of a metric per node"""
+        return {num: float(values.mean()) for num, _, values in self._all_series(group, metric, since, nodes)}
+
+    def rate(self, group: str, metric: str, since: Optional[float] = None,
+             nodes: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        """Return the rate of change per second of a metric per node, from the first and last sample in the window.
+
+        Nodes with fewer than two samples (at different times) are left out.
+        """
+        result = {}
+        for num, times, values in self._all_series(group, metric, since, nodes):
+            first, last = np.argmin(times), np.argmax(times)
+            dt = times[last] - times[first]
+            if dt > 0:
+                result[num] = float((values[last] - values[first]) / dt)
+        return result
+
+    def battery_slope(
+        self, since: Optional[float] = None, nodes: Optional[Iterable[int]] = None
+    ) -> Dict[int, float]:
+        """Return the least squares slope of the battery level per node, in percent per hour.
+
+        Samples taken while externally powered are ignored, nodes with fewer than two samples left are left out.
+        """
+        result = {}
+        for num, times, values in self._all_series("deviceMetrics", "batteryLevel", since, nodes):
+            on_battery = (values > 0) & (values <= POWERED_BATTERY_LEVEL)
+            times, values = times[on_battery], values[on_battery]
+            if len(values) < 2 or np.ptp(times) == 0:
+                continue
+            t = (times - times.mean()) / 3600.0
+            result[num] = float(np.dot(t, values - values.mean()) / np.dot(t, t))
+        return result
+
+    def to_arrow(self, group: str, since: Optional[float] = None) -> "pa.Table":
+        """Return a pyarrow.Table of the samples of a telemetry group: num and time columns followed by one
+        column per metric (null where a sample did not include it)
+        """
+        if pa is None:
+            raise ImportError("to_arrow() needs pyarrow, which is not installed")
+        with self._lock:
+            windows = [(num, *ring.window(since)) for num, ring in self._rings.get(group, {}).items()]
+        names = sorted({name for _, _, columns in windows for name in columns})
+        times = np.concatenate([t for _, t, _ in windows]) if windows else np.empty(0)
+        arrays = {
+            "num": pa.array(
+                np.concatenate([np.full(len(t), num, dtype=np.uint32) for num, t, _ in windows])
+                if windows else np.empty(0, dtype=np.uint32)
+            ),
+            "time": pa.array((times * 1000).astype(np.int64), type=pa.timestamp("ms")),
+        }
+        for name in names:
+            values = np.concatenate([columns.get(name, np.full(len(t), np.nan)) for _, t, columns in windows])
+            arrays[name] = pa.array(values, from_pandas=True)  # from_pandas turns NaN into null
+        return pa.Table.from_pydict(arrays)
@@ -18,6 +18,8 @@
 import logging
 import platform
 import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set
 
 from pubsub import pub # type: ignore[import-untyped]
 from pytap2 import TapDevice
@@ -34,6 +36,29 @@ def onTunnelReceive(packet, interface):  # pylint: disable=W0613
     tunnelInstance.onReceive(packet)
 
 
+def onTunnelNodeUpdated(node, interface):
+    """Callback for node DB changes, keeps the tunnel's IP address index current."""
+    tunnelInstance = mt_config.tunnelInstance
+    if tunnelInstance is not None and tunnelInstance.iface is interface:
+        tunnelInstance._indexNode(node)
+
+
+def onTunnelNodeRemoved(num, interface):
+    """Callback for nodes dropped from the node DB, so they stop taking up an IP address"""
+    tunnelInstance = mt_config.tunnelInstance
+    if tunnelInstance is not None and tunnelInstance.iface is interface:
+        tunnelInstance._unindexNode(num)
+
+
+def onTunnelUserReceive(packet, interface):
+    """Callback for received User packets (which can assign a new node ID)."""
+    tunnelInstance = mt_config.tunnelInstance
+    if tunnelInstance is not None and tunnelInstance.iface is interface and "from" in packet:
+        node = interface.nodesByNum.get(packet["from"]) if interface.nodesByNum else None
+        if node is not None:
+            tunnelInstance._indexNode(node)
+
+
 class Tunnel:
     """A TUN based IP tunnel over meshtastic"""
 
@@ -91,6 +116,17 @@ class Tunnel:
         # A new non standard log level that is lower level than DEBUG
         self.LOG_TRACE = 5
 
+        """Node IDs keyed by the low 16 bits of their nodenum (which is what our IP addresses contain),
+        then by the full nodenum. More than one entry for a suffix means those nodes collide."""
+        self._ipSuffixIndex: Dict[int, Dict[int, str]] = {}
+        self._ipSuffixLock = threading.Lock()
+        self._warnedSuffixes: Set[int] = set()  # colliding suffixes _ipToNodeId() already warned about
+
+        """Cache of IP address strings keyed by nodenum, oldest first (at most ipCacheSize entries)"""
+        self._ipCache: "OrderedDict[int, str]" = OrderedDict()
+        self._ipCacheLock = threading.Lock()
+        self.ipCacheSize = 1024
+
         # TODO: check if root?
         logging.info(
             "Starting IP to mesh tunnel (you must be root for this *pre-alpha* "
@@ -98,6 +134,9 @@ class Tunnel:
         )
 
         pub.subscribe(onTunnelReceive, "meshtastic.receive.data.IP_TUNNEL_APP")
+        pub.subscribe(onTunnelNodeUpdated, "meshtastic.node.updated")
+        pub.subscribe(onTunnelNodeRemoved, "meshtastic.node.removed")
+        pub.subscribe(onTunnelUserReceive, "meshtastic.receive.user")
         myAddr = self._nodeNumToIp(self.iface.myInfo.my_node_num)
 
         if self.iface.nodes:
@@ -105,6 +144,7 @@ class Tunnel:
                 nodeId = node["user"]["id"]
                 ip = self._nodeNumToIp(node["num"])
                 logging.info(f"Node { nodeId } has IP address { ip }")
+                self._indexNode(node)
 
         logging.debug("creating TUN device with MTU=200")
         # FIXME - figure out real max MTU, it should be 240 - the overhead bytes for SubPacket and Data
@@ -201,22 +241,77 @@ class Tunnel:
             if not self._shouldFilterPacket(p):
                 self.sendPacket(destAddr, p)
 
-    def _ipToNodeId(self, ipAddr):
+    def _indexNode(self, node) -> None:
+        """Add (or refresh) a node in the IP suffix index, warning if its suffix is already used by another node"""
+        try:
+            nodeNum = node["num"]
+            nodeId = node["user"]["id"]
+        except (KeyError, TypeError):
+            return  # not enough info to route to this node yet
+
+        suffix = nodeNum & 0xFFFF
+        with self._ipSuffixLock:
+            entries = self._ipSuffixIndex.setdefault(suffix, {})
+            isNew = nodeNum not in entries
+            entries[nodeNum] = nodeId
+            if isNew and len(entries) > 1:
+                logging.warning(
+                    f"IP address collision: nodes {', '.join(sorted(entries.values()))} all map to "
+                    f"{self._nodeNumToIp(nodeNum)}, packets for that address will be dropped"
+                )
+
+    def _unindexNode(self, nodeNum) -> None:
+        """Drop a node from the IP suffix index and the address cache"""
+        suffix = nodeNum & 0xFFFF
+        with self._ipSuffixLock:
+            entries = self._ipSuffixIndex.get(suffix)
+            if entries is not None:
+                entries.pop(nodeNum, None)
+                if not entries:
+                    del self._ipSuffixIndex[suffix]
+                if len(entries) <= 1:
+                    self._warnedSuffixes.discard(suffix)
+            with self._ipCacheLock:
+                self._ipCache.pop(nodeNum, None)
+
+    def suffixCollisions(self) -> Dict[str, list]:
+        """Return the IP addresses that more than one node maps to, with the IDs of those nodes"""
+        with self._ipSuffixLock:
+            return {
+                self._nodeNumToIp(suffix): sorted(entries.values())
+                for suffix, entries in self._ipSuffixIndex.items()
+                if len(entries) > 1
+            }
+
+    def _ipToNodeId(self, ipAddr) -> Optional[str]:
         # We only consider the last 16 bits of the nodenum for IP address matching
         ipBits = ipAddr[2] * 256 + ipAddr[3]
 
         if ipBits == 0xFFFF:
             return "^all"
 
-        for node in self.iface.nodes.values():
-            nodeNum = node["num"] & 0xFFFF
-            # logging.debug(f"Considering nodenum 0x{nodeNum:x} for ipBits 0x{ipBits:x}")
-            if (nodeNum) == ipBits:
-                return node["user"]["id"]
-        return None
-
-    def _nodeNumToIp(self, nodeNum):
-        return f"{self.subnetPrefix}.{(nodeNum >> 8) & 0xff}.{nodeNum & 0xff}"
+        with self._ipSuffixLock:
+            entries = self._ipSuffixIndex.get(ipBits)
+            if not entries:
+                return None
+            if len(entries) > 1:
+                if ipBits not in self._warnedSuffixes:
+                    self._warnedSuffixes.add(ipBits)
+                    logging.warning(
+                        f"Can not pick a node for {ipstr(ipAddr)}, it is shared by {', '.join(sorted(entries.values()))}"
+                    )
+                return None
+            return next(iter(entries.values()))
+
+    def _nodeNumToIp(self, nodeNum) -> str:
+        with self._ipCacheLock:
+            ip = self._ipCache.get(nodeNum)
+            if ip is None:
+                ip = f"{self.subnetPrefix}.{(nodeNum >> 8) & 0xff}.{nodeNum & 0xff}"
+                self._ipCache[nodeNum] = ip
+                if len(self._ipCache) > self.ipCacheSize:
+                    self._ipCache.popitem(last=False)
+            return ip
 
     def sendPacket(self, destAddr, p):
         """Forward the provided IP packet into the mesh"""
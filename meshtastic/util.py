@@ -11,13 +11,12 @@ import threading
 import time
 import traceback
 from queue import Queue
-from typing import Any, Dict, List, NoReturn, Optional, Set, Tuple, Union
+from typing import Any, Dict, Iterable, List, NoReturn, Optional, Set, Tuple, Union
 
 from google.protobuf.json_format import MessageToJson
 from google.protobuf.message import Message
 
 import packaging.version as pkg_version
-import requests
 import serial # type: ignore[import-untyped]
 import serial.tools.list_ports # type: ignore[import-untyped]
 
@@ -380,6 +379,33 @@ def readnet_u16(p, offset: int) -> int:
     return p[offset] * 256 + p[offset + 1]
 
 
+def degreesFromI(value):
+    """Convert a latitudeI/longitudeI value (degrees * 1e7) to degrees.
+
+    Gives exactly the same float as float(value * Decimal("1e-7")): the integer converts to a double
+    without rounding and IEEE division is correctly rounded, so value / 1e7 is the double nearest to
+    the exact quotient. A list/tuple gives a list (converted one value at a time), a numpy array is
+    divided element-wise.
+    """
+    if isinstance(value, (list, tuple)):
+        return [v / 1e7 for v in value]
+    return value / 1e7
+
+
+def fixupPositions(positions: Iterable[Dict]) -> Iterable[Dict]:
+    """Add float latitude/longitude to Position dictionaries that have latitudeI/longitudeI (in place),
+    one position at a time with degreesFromI()
+
+    Returns positions
+    """
+    for position in positions:
+        if "latitudeI" in position:
+            position["latitude"] = degreesFromI(position["latitudeI"])
+        if "longitudeI" in position:
+            position["longitude"] = degreesFromI(position["longitudeI"])
+    return positions
+
+
 def convert_mac_addr(val: str) -> Union[str, bytes]:
     """Convert the base 64 encoded value to a mac address
     val - base64 encoded value (ex: '/c0gFyhb'))
@@ -659,6 +685,8 @@ def check_if_newer_version() -> Optional[str]:
     """Check pip to see if we are running the latest version."""
     pypi_version: Optional[str] = None
     try:
+        import requests  # pylint: disable=C0415 # slow to import and only needed here
+
         url: str = "https://pypi.org/pypi/meshtastic/json"
         data = requests.get(url, timeout=5).json()
         pypi_version = data["info"]["version"]
@@ -0,0 +1,65 @@
+# Memory benchmark for the node DB: feed it 50k transient nodes (like an MQTT fed mesh)
+# and compare an unbounded DB keeping whole packets with a bounded one keeping summaries.
+#
+# usage: python tests/nodedb-memory-bench.py [numNodes]
+
+import sys
+import time
+import tracemalloc
+
+import meshtastic
+from meshtastic.mesh_interface import MeshInterface
+from meshtastic.nodedb import NodeDB
+from meshtastic.protobuf import mesh_pb2, portnums_pb2
+
+
+def makePacket(num):
+    """A received text message from num, the way _handlePacketFromRadio leaves it"""
+    raw = mesh_pb2.MeshPacket()
+    setattr(raw, "from", num)
+    raw.to = 0xFFFFFFFF
+    raw.id = num
+    raw.rx_time = int(time.time())
+    raw.decoded.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+    raw.decoded.payload = b"hello from a node we will never hear from again"
+    return {
+        "from": num,
+        "to": 0xFFFFFFFF,
+        "id": num,
+        "rxTime": raw.rx_time,
+        "rxSnr": 6.25,
+        "hopLimit": 3,
+        "fromId": f"!{num:08x}",
+        "toId": "^all",
+        "decoded": {
+            "portnum": "TEXT_MESSAGE_APP",
+            "payload": raw.decoded.payload,
+            "text": raw.decoded.payload.decode(),
+        },
+        "raw": raw,
+    }
+
+
+def run(numNodes, maxNodes, lastReceivedMode):
+    iface = MeshInterface(noProto=True)
+    iface.lastReceivedMode = lastReceivedMode
+    tracemalloc.start()
+    iface.nodeDB = NodeDB(maxNodes=maxNodes)
+    start = time.perf_counter()
+    for num in range(1, numNodes + 1):
+        meshtastic._receiveInfoUpdate(iface, makePacket(num))
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"maxNodes={maxNodes!s:>6} lastReceived={lastReceivedMode:<7} nodes={len(iface.nodeDB):>6} "
+        f"mem={current / 1e6:7.1f}MB peak={peak / 1e6:7.1f}MB time={elapsed:5.2f}s"
+    )
+    iface.close()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    run(count, None, "full")
+    run(count, None, "summary")
+    run(count, 2000, "summary")
@@ -0,0 +1,83 @@
+# Benchmark for slog.arrow.ArrowWriter: rows/s the logging threads can add, the total rate
+# including the conversion and writing, and the slowest add_row, compared with the previous implementation
+# (which converted and wrote on the thread adding the rows).
+#
+# usage: python tests/slog-arrow-bench.py [numRows]
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pyarrow as pa
+
+from meshtastic.slog.arrow import ArrowWriter
+
+
+class RowArrowWriter:
+    """The previous ArrowWriter: converts and writes every 1000 rows on the thread adding them"""
+
+    def __init__(self, file_name: str):
+        self.sink = pa.OSFile(file_name, "wb")
+        self.new_rows: List[dict] = []
+        self.schema: Optional[pa.Schema] = None
+        self.writer: Optional[pa.RecordBatchStreamWriter] = None
+        self._lock = threading.Condition()
+
+    def close(self):
+        with self._lock:
+            self._write()
+            if self.writer:
+                self.writer.close()
+            self.sink.close()
+
+    def _write(self):
+        if len(self.new_rows) > 0:
+            if self.schema is None:
+                self.schema = pa.Table.from_pylist([self.new_rows[0]]).schema
+                self.writer = pa.ipc.new_stream(self.sink, self.schema)
+            self.writer.write_batch(pa.RecordBatch.from_pylist(self.new_rows, schema=self.schema))
+            self.new_rows = []
+
+    def add_row(self, row_dict: dict):
+        with self._lock:
+            self.new_rows.append(row_dict)
+            if len(self.new_rows) >= 1000:
+                self._write()
+
+
+def powerRows(n):
+    """Rows like PowerLogger writes"""
+    now = datetime.now()
+    return [{"time": now, "average_mW": 12.5 + i % 7, "max_mW": 30.25, "min_mW": 1.5} for i in range(n)]
+
+
+def bench(cls, rows, path):
+    w = cls(path)
+    start = time.perf_counter()
+    worst = 0.0
+    for row in rows:
+        t = time.perf_counter()
+        w.add_row(row)
+        worst = max(worst, time.perf_counter() - t)
+    added = time.perf_counter() - start
+    w.close()
+    total = time.perf_counter() - start
+    return len(rows) / added, len(rows) / total, worst
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rows = powerRows(n)
+    with tempfile.TemporaryDirectory() as d:
+        for name, cls in (("row-oriented (old)", RowArrowWriter), ("background writer", ArrowWriter)):
+            addRate, totalRate, worst = bench(cls, rows, os.path.join(d, "bench.arrow"))
+            print(f"{name:20} add_row {addRate:10.0f} rows/s, including writing {totalRate:10.0f} rows/s, "
+                  f"slowest add_row {worst * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Benchmark for parsing device log lines in slog.StructuredLogger: lines/s with the previous regex + parse
+# library code and with match_slog + LogDef.parse_args, on a mix of plain and structured lines.
+#
+# usage: python tests/slog-parse-bench.py [numLines]
+
+import sys
+import time
+
+import pyarrow as pa
+
+from meshtastic.slog.slog import log_defs, log_regex, match_slog
+
+LINES = [
+    "DEBUG | 12:00:01 42 [Router] Received routing from=0x1234, id=0x5678, portnum=5",
+    "INFO  | 12:00:01 42 [Main] S:PM:0x1,sleep",
+    "DEBUG | 12:00:01 42 [Power] Battery: usbPower=1, isCharging=1, batMv=4190, batPct=100",
+    "DEBUG | 12:00:01 42 [Main] S:PS:3",
+    "INFO  | 12:00:01 42 [Main] S:B:7,2.5.0.abcdef",
+    "DEBUG | 12:00:02 43 [RadioIf] Starting low level send (id=0x12345678 fr=0x12 to=0xff, WantAck=0)",
+    "DEBUG | 12:00:02 43 [Main] S:PM:0x00000948,",
+]
+
+
+def parseOld(line):
+    """What StructuredLogger._onLogMessage used to do"""
+    m = log_regex.match(line)
+    if m:
+        d = log_defs.get(m.group(1))
+        if d:
+            args = m.group(2)
+            last_field = d.fields[-1]
+            last_is_str = last_field[1] == pa.string()
+            if last_is_str:
+                args += " "
+            r = d.format.parse(args)
+            if r:
+                di = r.named
+                if last_is_str:
+                    di[last_field[0]] = di[last_field[0]].strip()
+                    if di[last_field[0]] == "":
+                        del di[last_field[0]]
+                return di
+    return None
+
+
+def parseNew(line):
+    """What StructuredLogger._onLogMessage does now"""
+    m = match_slog(line) if "S:" in line else None
+    if m:
+        d = log_defs.get(m[0])
+        if d:
+            return d.parse_args(m[1])
+    return None
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    assert [parseOld(line) for line in LINES] == [parseNew(line) for line in LINES]
+    for mix, sample in (
+        ("mixed", LINES),
+        ("structured", [line for line in LINES if "S:" in line]),
+        ("plain", [line for line in LINES if "S:" not in line]),
+    ):
+        lines = [sample[i % len(sample)] for i in range(n)]
+        for name, parse in (("regex + parse", parseOld), ("match_slog + parse_args", parseNew)):
+            start = time.perf_counter()
+            for line in lines:
+                parse(line)
+            elapsed = time.perf_counter() - start
+            print(f"{mix:>10} {name:>24}: {n / elapsed:10.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()